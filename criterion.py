@@ -81,31 +81,55 @@ class LossCombiner(nn.Module):
 		return self.losses[0].name
 
 class MultiHeadNllLoss(nn.Module):
-	def __init__(self, output_size: int, n_heads: int, weights:List[List[float]]=None, use_cuda=True):
+	def __init__(self, output_size: int, n_heads: int, weights: List[List[float]]=None, use_cuda=True):
+		"""Sum of the weighted NLL losses of all heads, computed with one gather and reduction.
+		Gives the same loss as LossCombiner(output_size, weights, NllLoss).
+
+		Arguments:
+			output_size {int} -- number of classes
+			n_heads {int} -- number of heads (aspects)
+
+		Keyword Arguments:
+			weights {List[List[float]]} -- class weights of each head. A head without weights (None) weights all classes equally (default: {None})
+		"""
 		super().__init__()
 		self.output_size = output_size
+		self.n_heads = n_heads
 		if weights is not None:
-			self.weight = torch.Tensor(weights)
+			assert len(weights) == n_heads
+			weights = [w if w is not None else [1.0] * output_size for w in weights]
+			self.weight = torch.Tensor(weights)		# [n_heads, output_size]
 
 			if use_cuda and torch.cuda.is_available():
 				self.weight = self.weight.cuda()
 		else:
 			self.weight = None
 
-	def _transform_logits(self, logits: torch.Tensor) -> torch.Tensor:
-		return logits.view(-1, self.output_size)
-
 	def forward(self, logits: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
-		logits = self._transform_logits(logits)
-		targets = targets.view(-1)
-		return F.nll_loss(logits, targets, weight=self.weight)
+		# logits: [batch_size, n_heads, output_size], targets: [batch_size, n_heads]
+		logits = logits.view(-1, self.n_heads, self.output_size)
+		targets = targets.view(-1, self.n_heads)
+		nll = -logits.gather(-1, targets.unsqueeze(-1)).squeeze(-1)		# [batch_size, n_heads]
+
+		if self.weight is None:
+			return nll.mean(dim=0).sum()
+
+		# weight of the target class of each sample and head. Like F.nll_loss, each head is normalized by its sum of weights
+		heads = torch.arange(self.n_heads, dtype=torch.long, device=targets.device)
+		w = self.weight[heads, targets]									# [batch_size, n_heads]
+		return ((w * nll).sum(dim=0) / w.sum(dim=0)).sum()
 
 	@property
 	def name(self):
 		return 'NLL Loss'
-	
 
 
+def create_multi_head_loss(output_size: int, weights: List[List[float]], vectorized: bool = False) -> nn.Module:
+	"""Loss of the aspect heads. Either one NllLoss per head (LossCombiner) or the equivalent MultiHeadNllLoss."""
+	if vectorized:
+		return MultiHeadNllLoss(output_size, len(weights), weights)
+	return LossCombiner(output_size, weights, NllLoss)
+
 
 class MSELoss(nn.Module):
 	def __init__(self):
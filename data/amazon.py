@@ -7,9 +7,9 @@ import torchtext
 from torchtext import data as data_t
 from stop_words import get_stop_words
 
-from data.torchtext.custom_fields import ReversibleField
+from data.torchtext.custom_fields import ReversibleField, VectorField, LengthField
 from data.torchtext.amazon_dataset import *
-from data.data_loader import get_embedding
+from data.data_loader import get_embedding, get_padding_length, create_iterators
 
 from misc.run_configuration import RunConfiguration
 logger = logging.getLogger(__name__)
@@ -38,7 +38,6 @@ def amazon_dataset(
 	logger.debug('Creating splits and load data')
 	data = load_splits(task, hyperparameters, root, train_file, validation_file, test_file, verbose)
 	comment_field = data['fields']['comment']
-	padding_field = data['fields']['padding']
 	aspect_sentiment_field = data['fields']['aspect_sentiment']
 
 	(train, val, test) = data['splits']
@@ -58,7 +57,6 @@ def amazon_dataset(
 		vectors=[pretrained_vectors])
 	print('Comment Vocabulary building finished')
 
-	padding_field.build_vocab(train.padding, val.padding, test.padding)
 	aspect_sentiment_field.build_vocab(train.aspect_sentiments, val.aspect_sentiments, test.aspect_sentiments)
 
 	# build aspect fields
@@ -68,8 +66,8 @@ def amazon_dataset(
 		aspect_sentiment_fields.append(f)
 
 	train_device = torch.device('cuda:0' if torch.cuda.is_available() and use_cuda else 'cpu')
-	train_iter, val_iter, test_iter = data_t.BucketIterator.splits(
-		(train, val, test), batch_size=batch_size, device=train_device, shuffle=True)
+	train_iter, val_iter, test_iter = create_iterators(
+		(train, val, test), batch_size, train_device, hyperparameters)
 
 	# add embeddings
 	embedding_size = comment_field.vocab.vectors.shape[1]
@@ -93,7 +91,7 @@ def amazon_dataset(
 		'target_field_name': 'aspect_sentiments',
 		#'target': [('general_sentiments', general_sentiment_field), ('aspect_sentiments', aspect_sentiment_field)] + train.aspect_sentiment_fields,
 		'target': train.aspect_sentiment_fields,
-		'padding_field_name': 'padding',
+		'padding_field_name': 'lengths',
 		'examples': examples,
 		'embeddings': (source_embedding, None),
 		'dummy_input': Variable(torch.zeros((batch_size, 42), dtype=torch.long)),
@@ -130,20 +128,12 @@ def load_splits(
 							unk_token=None,
 							use_vocab=True)
 
-	padding_field = data.Field(
-							batch_first=True,
-							sequential=True,
-							fix_length=hyperparameters.clip_comments_to,
-							use_vocab=True,
-							init_token=None,
-							eos_token=None,
-							unk_token=None,
-							is_target=False)
+	length_field = LengthField()
 
-	comment_field = data.Field(
+	comment_field = VectorField(
 							batch_first=True,    # produce tensors with batch dimension first
 							lower=True,
-							fix_length=hyperparameters.clip_comments_to,
+							fix_length=get_padding_length(hyperparameters),
 							sequential=True,
 							use_vocab=True,
 							init_token=None,
@@ -154,7 +144,7 @@ def load_splits(
 	fields = [
 		('comments', comment_field),                        # comment itself e.g. (@KuttnerSarah @DB_Bahn Hund = Fahrgast, Hund in Box = Gepäck.skurril, oder?)
 		('aspect_sentiments', aspect_sentiment_field),		# aspect sentiment field List of 20 aspects with positive, negative, neutral, n/a
-		('padding', padding_field)                          # artificial field that we append to fill it with the padding information later to create the masks
+		('lengths', length_field)                           # artificial field that we fill with the number of words of the comment to create the masks
 	]
 
 	train, val, test = AmazonDataset.splits(
@@ -172,7 +162,7 @@ def load_splits(
 		'fields': {
 			'comment': comment_field,
 			'aspect_sentiment': aspect_sentiment_field,
-			'padding': padding_field,
+			'lengths': length_field,
 			'fields': fields
 		},
 		'splits': (train, val, test)
@@ -14,7 +14,7 @@ import random
 import logging
 import spacy
 from data.data_loader import get_embedding, get_embedding_size
-from data.torchtext.custom_fields import ReversibleField
+from data.torchtext.custom_fields import ReversibleField, VectorField
 from data.torchtext.sequence_tagging_dataset import CustomSequenceTaggingDataSet
 
 logger = logging.getLogger(__name__)
@@ -62,7 +62,7 @@ def conll2003_dataset(task:str,
 	assert hyperparameters.language == 'en'
 	
 	# Setup fields with batch dimension first
-	comments_field = data.Field(batch_first=True,
+	comments_field = VectorField(batch_first=True,
 								lower=True, 
 								stop_words=None,
 								init_token=None,
@@ -1,9 +1,14 @@
 import os
+from functools import partial
 from typing import List
 from torchtext import data, datasets, vocab
 from torch.nn import Embedding
 from prettytable import PrettyTable
 from misc.run_configuration import RunConfiguration
+from data.torchtext import custom_vocab
+from data.torchtext.token_budget_iterator import TokenBudgetBucketIterator
+from data.torchtext.tensor_dataset import TensorIterator
+from data.torchtext.prefetch_loader import PrefetchLoader, BatchTensorIterator
 import matplotlib as mpl
 mpl.use('agg')
 import matplotlib.pyplot as plt
@@ -28,6 +33,46 @@ def get_embedding_size(field, embd) -> int:
 	else:
 		return field.vocab.vectors.shape[1]
 
+def get_padding_length(hp: RunConfiguration):
+	"""Returns the fix_length of the comment field.
+	With dynamic padding, every batch is only padded to its longest comment (None).
+	"""
+	return None if hp.dynamic_padding else hp.clip_comments_to
+
+def create_iterators(splits, batch_size: int, device, hp: RunConfiguration):
+	"""Creates the train, validation and test iterators of a dataset.
+
+	If hp.batch_max_tokens is set, batches are packed by a token budget (see TokenBudgetBucketIterator).
+	Otherwise, batches have batch_size examples. With dynamic padding, comments of similar length are batched
+	together so that the batches need little padding.
+	With hp.tensorized_dataset, all splits are numericalized once and batches are sliced from tensors
+	(see TensorIterator). Elmo comments are not numericalized by index, so they always use torchtext iterators.
+	"""
+	if hp.tensorized_dataset and hp.embedding_type != 'elmo':
+		if hp.batch_max_tokens > 0:
+			return TensorIterator.splits(splits, batch_size=None, device=device, max_tokens=hp.batch_max_tokens)
+		return TensorIterator.splits(splits, batch_size=batch_size, device=device, sort_by_length=hp.dynamic_padding)
+
+	if hp.batch_max_tokens > 0:
+		return TokenBudgetBucketIterator.splits(splits, max_tokens=hp.batch_max_tokens,
+			fix_length=get_padding_length(hp), device=device, shuffle=True)
+
+	kwargs = {}
+	if hp.dynamic_padding:
+		kwargs['sort_key'] = lambda example: len(example.comments)
+	return data.BucketIterator.splits(splits, batch_size=batch_size, device=device, shuffle=True, **kwargs)
+
+def create_batch_loader(iterator, hp: RunConfiguration):
+	"""Returns an iterable over the (comments, aspect_sentiments, lengths) tensors of the batches of iterator.
+
+	If hp.prefetch_batches is larger than 0, the batches are prepared in the background (see PrefetchLoader).
+	TensorIterator batches are already slices of tensors on the device and elmo embeds the comments on
+	numericalization, so these are never prefetched.
+	"""
+	if hp.prefetch_batches > 0 and hp.embedding_type != 'elmo' and not isinstance(iterator, TensorIterator):
+		return PrefetchLoader(iterator, hp.data_loader_workers, hp.prefetch_batches, pin_memory=hp.use_cuda)
+	return BatchTensorIterator(iterator)
+
 DEFAULT_DATA_PIPELINE = data.Pipeline(lambda w: '0' if w.isdigit() else w )
 
 class Dataset(object):
@@ -112,14 +157,7 @@ class Dataset(object):
 			self.img_stats_folder = os.path.join(self.data_path, 'stats')
 			create_dir_if_necessary(self.img_stats_folder)
 
-		self.logger.info(f'Getting {self.pretrained_word_embeddings} with dimension {self.pretrained_word_embeddings_dim}')
-		word_vectors: vocab
-		word_vectors = None
-		if self.pretrained_word_embeddings == 'glove':
-			word_vectors = vocab.GloVe(name=self.pretrained_word_embeddings_name, dim=self.pretrained_word_embeddings_dim)
-		elif self.pretrained_word_embeddings == 'fasttext':
-			word_vectors = vocab.FastText(language=self.language)
-		self.logger.info('Word vectors successfully loaded.')
+		word_vectors = self._load_word_vectors()
 				
 		self.logger.debug('Start loading dataset')
 		self.dataset = loader(
@@ -173,6 +211,29 @@ class Dataset(object):
 
 		self.logger.info('Dataset loaded. Ready for training')
 
+	def _load_word_vectors(self) -> custom_vocab.Vectors:
+		"""Returns the pretrained word vectors for the configured embedding type.
+		
+		The vectors are wrapped so that only the rows of the dataset vocabulary are read. Those rows are cached
+		per vocabulary, so repeated runs do not need to open the full vector set again.
+		"""
+		self.logger.info(f'Getting {self.pretrained_word_embeddings} with dimension {self.pretrained_word_embeddings_dim}')
+		word_vectors: custom_vocab.Vectors
+		word_vectors = None
+		if self.pretrained_word_embeddings == 'glove':
+			word_vectors = custom_vocab.VocabFilteredVectors(
+				partial(custom_vocab.GloVe, name=self.pretrained_word_embeddings_name, dim=self.pretrained_word_embeddings_dim),
+				name=f'glove.{self.pretrained_word_embeddings_name}',
+				dim=self.pretrained_word_embeddings_dim)
+		elif self.pretrained_word_embeddings == 'fasttext':
+			# wiki fasttext vectors are always 300 dimensional
+			word_vectors = custom_vocab.VocabFilteredVectors(
+				partial(custom_vocab.FastText, language=self.language),
+				name=f'fasttext.{self.language}',
+				dim=300)
+		self.logger.info('Word vectors successfully loaded.')
+		return word_vectors
+
 	def log_parameters(self):
 		parameter_table = get_class_variable_table(self, 'Data Loader')
 		self.logger.info('\n' + parameter_table)
@@ -7,9 +7,9 @@ import torchtext
 from torchtext import data
 from stop_words import get_stop_words
 
-from data.torchtext.custom_fields import ReversibleField, ElmoField
+from data.torchtext.custom_fields import ReversibleField, ElmoField, VectorField, LengthField
 from data.torchtext.germeval2017_dataset import GermEval2017Dataset
-from data.data_loader import get_embedding, get_embedding_size
+from data.data_loader import get_embedding, get_embedding_size, get_padding_length, create_iterators
 
 from misc.run_configuration import RunConfiguration
 
@@ -51,7 +51,7 @@ def germeval2017_dataset(
 							hyperparameters,
 							batch_first=True,    # produce tensors with batch dimension first
 							lower=True,
-							fix_length=hyperparameters.clip_comments_to,
+							fix_length=get_padding_length(hyperparameters),
 							sequential=True,
 							use_vocab=True,
 							init_token=None,
@@ -60,10 +60,10 @@ def germeval2017_dataset(
 							stop_words=stop_words,
 							preprocessing=data.Pipeline(preprocess_word))
 	else:
-		comment_field = data.Field(
+		comment_field = VectorField(
 								batch_first=True,    # produce tensors with batch dimension first
 								lower=True,
-								fix_length=hyperparameters.clip_comments_to,
+								fix_length=get_padding_length(hyperparameters),
 								sequential=True,
 								use_vocab=True,
 								init_token=None,
@@ -106,15 +106,7 @@ def germeval2017_dataset(
 							unk_token=None,
 							use_vocab=True)
 
-	padding_field = data.Field(
-							batch_first=True,
-							sequential=True,
-							fix_length=hyperparameters.clip_comments_to,
-							use_vocab=True,
-							init_token=None,
-							eos_token=None,
-							unk_token=None,
-							is_target=False)
+	length_field = LengthField()
 
 	fields = [
 		('id', id_field),                                   # link to comment eg: (http://twitter.com/lolloseb/statuses/718382187792478208)
@@ -123,7 +115,7 @@ def germeval2017_dataset(
 		('general_sentiments', general_sentiment_field),    # sentiment of comment (positive, negative, neutral)
 		(None, None),                                       # apsect based sentiment e.g (Allgemein#Haupt:negative Sonstige_Unregelmässigkeiten#Haupt:negative Sonstige_Unregelmässigkeiten#Haupt:negative)
 		('aspect_sentiments', aspect_sentiment_field),		# apsect sentiment field List of 20 aspects with positive, negative, neutral, n/a
-		('padding', padding_field)                          # artificial field that we append to fill it with the padding information later to create the masks
+		('lengths', length_field)                           # artificial field that we fill with the number of words of the comment to create the masks
 			]
 
 	train, val, test = GermEval2017Dataset.splits(
@@ -147,7 +139,6 @@ def germeval2017_dataset(
 		comment_field.build_vocab(train.comments, val.comments, test.comments)
 
 	general_sentiment_field.build_vocab(train.general_sentiments)
-	padding_field.build_vocab(train.padding, val.comments, test.comments)
 	aspect_sentiment_field.build_vocab(train.aspect_sentiments, val.aspect_sentiments, test.aspect_sentiments)
 	id_field.build_vocab(train.id, val.id, test.id)
 
@@ -158,8 +149,8 @@ def germeval2017_dataset(
 		aspect_sentiment_fields.append(f)
 
 	train_device = torch.device('cuda:0' if torch.cuda.is_available() and use_cuda else 'cpu')
-	train_iter, val_iter, test_iter = data.BucketIterator.splits(
-		(train, val, test), batch_size=batch_size, device=train_device, shuffle=True)
+	train_iter, val_iter, test_iter = create_iterators(
+		(train, val, test), batch_size, train_device, hyperparameters)
 
 	# add embeddings
 	embedding_size = get_embedding_size(comment_field, hyperparameters.embedding_type)
@@ -182,7 +173,7 @@ def germeval2017_dataset(
 		'target_field_name': 'general_sentiments',
 		#'target': [('general_sentiments', general_sentiment_field), ('aspect_sentiments', aspect_sentiment_field)] + train.aspect_sentiment_fields,
 		'target': train.aspect_sentiment_fields,
-		'padding_field_name': 'padding',
+		'padding_field_name': 'lengths',
 		'examples': examples,
 		'embeddings': (source_embedding, None),
 		'dummy_input': Variable(torch.zeros((batch_size, 42), dtype=torch.long)),
@@ -7,9 +7,9 @@ import torchtext
 from torchtext import data as data_t
 from stop_words import get_stop_words
 
-from data.torchtext.custom_fields import ReversibleField, ElmoField
+from data.torchtext.custom_fields import ReversibleField, ElmoField, VectorField, LengthField
 from data.torchtext.organic_dataset import *
-from data.data_loader import get_embedding
+from data.data_loader import get_embedding, get_padding_length, create_iterators
 
 from misc.run_configuration import RunConfiguration
 
@@ -37,7 +37,6 @@ def organic_dataset(
 
 	data = load_splits(task, hyperparameters, root, train_file, validation_file, test_file, verbose)
 	comment_field = data['fields']['comment']
-	padding_field = data['fields']['padding']
 	aspect_sentiment_field = data['fields']['aspect_sentiment']
 	id_field = data['fields']['id']
 
@@ -47,7 +46,6 @@ def organic_dataset(
 	fields = train.fields
 
 	comment_field.build_vocab(train.comments, val.comments, test.comments, vectors=[pretrained_vectors])
-	padding_field.build_vocab(train.padding, val.padding, test.padding)
 	aspect_sentiment_field.build_vocab(train.aspect_sentiments, val.aspect_sentiments, test.aspect_sentiments)
 	id_field.build_vocab(train.id, val.id, test.id)
 
@@ -58,8 +56,8 @@ def organic_dataset(
 		aspect_sentiment_fields.append(f)
 
 	train_device = torch.device('cuda:0' if torch.cuda.is_available() and use_cuda else 'cpu')
-	train_iter, val_iter, test_iter = data_t.BucketIterator.splits(
-		(train, val, test), batch_size=batch_size, device=train_device, shuffle=True)
+	train_iter, val_iter, test_iter = create_iterators(
+		(train, val, test), batch_size, train_device, hyperparameters)
 
 	# add embeddings
 	embedding_size = comment_field.vocab.vectors.shape[1]
@@ -80,7 +78,7 @@ def organic_dataset(
 		'target_field_name': 'aspect_sentiments',
 		#'target': [('general_sentiments', general_sentiment_field), ('aspect_sentiments', aspect_sentiment_field)] + train.aspect_sentiment_fields,
 		'target': train.aspect_sentiment_fields,
-		'padding_field_name': 'padding',
+		'padding_field_name': 'lengths',
 		'examples': examples,
 		'embeddings': (source_embedding, None),
 		'dummy_input': Variable(torch.zeros((batch_size, 42), dtype=torch.long)),
@@ -131,20 +129,12 @@ def load_splits(
 							unk_token=None,
 							use_vocab=True)
 
-	padding_field = data.Field(
-							batch_first=True,
-							sequential=True,
-							fix_length=hyperparameters.clip_comments_to,
-							use_vocab=True,
-							init_token=None,
-							eos_token=None,
-							unk_token=None,
-							is_target=False)
+	length_field = LengthField()
 
-	comment_field = data.Field(
+	comment_field = VectorField(
 							batch_first=True,    # produce tensors with batch dimension first
 							lower=True,
-							fix_length=hyperparameters.clip_comments_to,
+							fix_length=get_padding_length(hyperparameters),
 							sequential=True,
 							use_vocab=True,
 							init_token=None,
@@ -170,7 +160,7 @@ def load_splits(
 		('aspect_sentiments', aspect_sentiment_field),		# aspect sentiment field List of 20 aspects with positive, negative, neutral, n/a
 		('comments', comment_field),                        # comment itself e.g. (@KuttnerSarah @DB_Bahn Hund = Fahrgast, Hund in Box = Gepäck.skurril, oder?)
 		(None, None), 										
-		('padding', padding_field)                          # artificial field that we append to fill it with the padding information later to create the masks
+		('lengths', length_field)                           # artificial field that we fill with the number of words of the comment to create the masks
 
 	]
 
@@ -204,7 +194,7 @@ def load_splits(
 		'fields': {
 			'comment': comment_field,
 			'aspect_sentiment': aspect_sentiment_field,
-			'padding': padding_field,
+			'lengths': length_field,
 			'id': id_field,
 			'fields': fields
 		},
@@ -0,0 +1,140 @@
+import os
+import json
+import pickle
+import logging
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List
+
+from misc.utils import check_if_file_exists
+
+logger = logging.getLogger(__name__)
+
+
+def get_correction_store_path(language: str) -> str:
+	return os.path.join(os.getcwd(), 'data', 'spellchecker', language + '_corrections.jsonl')
+
+def get_legacy_cache_path(language: str) -> str:
+	return os.path.join(os.getcwd(), 'data', 'spellchecker', language + '_cache.pkl')
+
+
+class SpellCorrectionStore(object):
+	"""Append-only on-disk table of spell corrections (token -> correction).
+
+	Each line of the store is a json encoded [token, correction] pair. New corrections are appended, the file
+	is never rewritten. Tokens the spell checker could not correct are stored with themselves as correction so
+	they are not checked again. A partially written last line (e.g. after a crash) is skipped on load.
+	If the store does not exist yet, the entries of the old pickled cache are imported.
+	"""
+
+	def __init__(self, path: str, legacy_path: str = None):
+		self.path = path
+		self.table: Dict[str, str] = {}
+
+		if check_if_file_exists(path):
+			self._load()
+		elif legacy_path is not None and check_if_file_exists(legacy_path):
+			with open(legacy_path, 'rb') as f:
+				legacy = pickle.load(f)
+			logger.info(f'Import {len(legacy)} spell corrections from {legacy_path}')
+			self.add(legacy)
+
+	def _load(self):
+		skipped = 0
+		with open(self.path, encoding='utf8') as f:
+			for line in f:
+				try:
+					token, correction = json.loads(line)
+				except ValueError:
+					skipped += 1
+					continue
+				self.table[token] = correction
+
+		if skipped > 0:
+			logger.warning(f'Skipped {skipped} unreadable lines in spell correction store {self.path}')
+		logger.info(f'Loaded {len(self.table)} spell corrections from {self.path}')
+
+	def __contains__(self, token: str) -> bool:
+		return token in self.table
+
+	def __len__(self) -> int:
+		return len(self.table)
+
+	def get(self, token: str, default: str = None) -> str:
+		return self.table.get(token, default)
+
+	def add(self, corrections: Dict[str, str]) -> None:
+		"""Adds corrections to the table and appends the new ones to the store."""
+		new_corrections = [(t, c) for t, c in corrections.items() if self.table.get(t) != c]
+		if len(new_corrections) == 0:
+			return
+
+		self.table.update(new_corrections)
+		with open(self.path, 'a', encoding='utf8') as f:
+			f.write(''.join(json.dumps([t, c]) + '\n' for t, c in new_corrections))
+
+
+# stores are loaded once per process
+_stores: Dict[str, SpellCorrectionStore] = {}
+
+def get_correction_store(language: str) -> SpellCorrectionStore:
+	path = get_correction_store_path(language)
+	if path not in _stores:
+		_stores[path] = SpellCorrectionStore(path, get_legacy_cache_path(language))
+	return _stores[path]
+
+
+def _correct_batch(spell, tokens: List[str]) -> List[str]:
+	# newer versions of pyspellchecker return None if there is no candidate
+	return [spell.correction(w) or w for w in tokens]
+
+def _should_check(w: str) -> bool:
+	# don't replace empty tokens or tokens in all caps
+	return w != ' ' and w != '' and not w.isupper()
+
+def correct_tokens(comments: Iterable[List[str]], spell, store: SpellCorrectionStore, num_workers: int = 0) -> Dict[str, str]:
+	"""Corrects all unique unknown tokens of a corpus and adds them to the store.
+
+	Arguments:
+		comments {Iterable[List[str]]} -- tokenized comments
+		spell {SpellChecker} -- spell checker
+		store {SpellCorrectionStore} -- correction table
+
+	Keyword Arguments:
+		num_workers {int} -- number of processes used for the correction. 0 corrects in this process (default: {0})
+
+	Returns:
+		Dict[str, str] -- corrections of the previously unknown tokens
+	"""
+	unknown = set()
+	for comment in comments:
+		for w in comment:
+			if _should_check(w) and w not in store:
+				unknown.add(w)
+	unknown = sorted(w for w in unknown if w not in spell)
+	if len(unknown) == 0:
+		return {}
+
+	logger.info(f'Correct {len(unknown)} unknown tokens')
+	if num_workers > 0:
+		# one batch per worker so the spell checker is only sent to each process once
+		batch_size = (len(unknown) + num_workers - 1) // num_workers
+		batches = [unknown[i:i + batch_size] for i in range(0, len(unknown), batch_size)]
+		with ProcessPoolExecutor(max_workers=num_workers) as executor:
+			corrected = [c for batch in executor.map(partial(_correct_batch, spell), batches) for c in batch]
+	else:
+		corrected = _correct_batch(spell, unknown)
+
+	corrections = dict(zip(unknown, corrected))
+	store.add(corrections)
+	return corrections
+
+def apply_corrections(text_tokens: List[str], store: SpellCorrectionStore) -> List[str]:
+	for i, w in enumerate(text_tokens):
+		if not _should_check(w):
+			continue
+
+		c = store.get(w)
+		if c is not None:
+			text_tokens[i] = c
+	return text_tokens
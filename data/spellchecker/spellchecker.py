@@ -1,5 +1,5 @@
 import os
-from typing import List, Dict
+from typing import Iterable, List, Dict
 from misc.utils import check_if_file_exists
 import pickle
 import logging
@@ -108,4 +108,37 @@ def get_organic_words_replacement() -> Dict:
 				v = line.replace('-', ' ')
 				dictionary[k] = v
 
-	return dictionary
\ No newline at end of file
+	return dictionary
+
+
+def get_symspell_source_files(language: str) -> List[str]:
+	"""Files the symmetric delete index of a language is built from."""
+	base = os.path.join(os.getcwd(), 'data', 'spellchecker')
+	if language == 'de':
+		return [os.path.join(base, 'de', 'german.dic')]
+
+	import spellchecker as pyspellchecker
+	return [
+		os.path.join(os.path.dirname(pyspellchecker.__file__), 'resources', 'en.json.gz'),
+		os.path.join(base, 'hunspell-en_US-2018', 'en_US.dic'),
+		os.path.join(base, 'organic-words.txt')
+	]
+
+def get_symspell_word_lists(language: str) -> Iterable:
+	"""Dictionaries and domain words of the symmetric delete index of a language. A dictionary maps words to their
+	frequencies, every other word counts once. Rebuild the index after changing the word lists in code."""
+	if language == 'de':
+		from data.torchtext.custom_datasets import germeval_words
+		yield germeval_words
+		yield get_de_dictionary()
+		return
+
+	# word frequencies of pyspellchecker
+	from spellchecker import SpellChecker
+	yield SpellChecker(language='en').word_frequency.dictionary
+
+	# load word from additional dictionary
+	yield get_en_dictionary()
+
+	# load organic specific entities
+	yield get_organic_dictionary()
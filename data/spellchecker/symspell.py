@@ -0,0 +1,333 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+from misc.utils import check_if_file_exists
+
+logger = logging.getLogger(__name__)
+
+# increase this whenever the layout of the index changes
+INDEX_FORMAT_VERSION = 2
+
+# an index file consists of the magic bytes, the length of the json header, the json header and the
+# 8 byte aligned sections whose positions are stored in the header
+INDEX_MAGIC = b'ABSASYMS'
+HEADER_LENGTH_BYTES = 8
+
+
+def _align(position: int) -> int:
+	return (position + 7) // 8 * 8
+
+def _hash(key: str) -> int:
+	# python's own string hash is randomized per process and can not be stored
+	return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def get_deletes(word: str, max_distance: int) -> Set[str]:
+	"""Returns the word and all strings that can be created by deleting up to max_distance characters."""
+	deletes = {word}
+	current = [word]
+	for _ in range(max_distance):
+		following = []
+		for w in current:
+			for i in range(len(w)):
+				d = w[:i] + w[i + 1:]
+				if d not in deletes:
+					deletes.add(d)
+					following.append(d)
+		current = following
+	return deletes
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+	"""Optimal string alignment distance (Levenshtein with adjacent transpositions).
+
+	Returns max_distance + 1 if the distance is larger than max_distance.
+	"""
+	if abs(len(a) - len(b)) > max_distance:
+		return max_distance + 1
+
+	previous_previous = None
+	previous = list(range(len(b) + 1))
+	for i in range(1, len(a) + 1):
+		current = [i] + [0] * len(b)
+		for j in range(1, len(b) + 1):
+			cost = 0 if a[i - 1] == b[j - 1] else 1
+			current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+			if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+				current[j] = min(current[j], previous_previous[j - 2] + 1)
+		if min(current) > max_distance:
+			return max_distance + 1
+		previous_previous, previous = previous, current
+	return min(previous[-1], max_distance + 1)
+
+
+def merge_word_lists(word_lists: Iterable[Iterable[str]]) -> Counter:
+	"""Merges dictionaries and domain word lists to lower case word frequencies.
+
+	A dictionary maps words to their frequencies, every other word counts once.
+	"""
+	word_counts = Counter()
+	for words in word_lists or []:
+		if isinstance(words, dict):
+			for w, count in words.items():
+				word_counts[w.lower()] += count
+		else:
+			word_counts.update(w.lower() for w in words if w.strip() != '')
+	return word_counts
+
+def source_stats(paths: Iterable[str]) -> List[Dict]:
+	"""Path, size and modification time of the files an index is built from. An index whose stored sources differ
+	from the current ones is stale. Missing files have a size of -1."""
+	stats = []
+	for p in paths:
+		try:
+			st = os.stat(p)
+			stats.append({'path': p, 'size': st.st_size, 'mtime': st.st_mtime_ns})
+		except OSError:
+			stats.append({'path': p, 'size': -1, 'mtime': 0})
+	return stats
+
+
+def build_symspell_index(path: str, word_counts: Dict[str, int], max_distance: int = 2, prefix_length: int = 7, sources: List[Dict] = None) -> None:
+	"""Builds a symmetric delete index and writes it to path.
+
+	For every word, all deletes of its prefix up to max_distance are hashed. The index stores the
+	(hash, word id) pairs sorted by hash together with a directory over the upper hash bits, so a lookup of a
+	delete is a directory access and a scan of a bucket with one or two entries.
+
+	Arguments:
+		path {str} -- index file
+		word_counts {Dict[str, int]} -- lower case words and their frequencies
+
+	Keyword Arguments:
+		max_distance {int} -- maximum edit distance of suggestions (default: {2})
+		prefix_length {int} -- only the deletes of this many leading characters are indexed (default: {7})
+		sources {List[Dict]} -- source_stats of the files the words were read from (default: {None})
+	"""
+	words = sorted(word_counts.keys())
+	counts = np.asarray([word_counts[w] for w in words], dtype=np.int64)
+
+	hashes = array('Q')
+	word_ids = array('i')
+	for i, w in enumerate(words):
+		for d in get_deletes(w[:prefix_length], max_distance):
+			hashes.append(_hash(d))
+			word_ids.append(i)
+
+	hashes = np.frombuffer(hashes, dtype=np.uint64)
+	word_ids = np.frombuffer(word_ids, dtype=np.int32)
+	order = np.argsort(hashes, kind='mergesort')
+	hashes = hashes[order]
+	word_ids = word_ids[order]
+
+	# about one bucket per distinct delete
+	directory_bits = max(1, int(np.ceil(np.log2(max(2, len(np.unique(hashes)))))))
+	buckets = np.arange(2 ** directory_bits, dtype=np.uint64) << np.uint64(64 - directory_bits)
+	directory = np.searchsorted(hashes, buckets).astype(np.int64)
+	directory = np.append(directory, np.int64(len(hashes)))
+
+	encoded_words = [w.encode('utf-8') for w in words]
+	word_offsets = np.zeros(len(words) + 1, dtype=np.int64)
+	word_offsets[1:] = np.cumsum([len(w) for w in encoded_words])
+	word_bytes = np.frombuffer(b''.join(encoded_words), dtype=np.uint8)
+
+	meta = {
+		'version': INDEX_FORMAT_VERSION,
+		'sources': sources or [],
+		'max_distance': max_distance,
+		'prefix_length': prefix_length,
+		'num_words': len(words),
+		'num_entries': len(hashes),
+		'num_word_bytes': len(word_bytes),
+		'directory_bits': directory_bits,
+		'sections': {}
+	}
+	sections = [
+		('hashes', hashes),
+		('word_ids', word_ids),
+		('directory', directory),
+		('counts', counts),
+		('word_offsets', word_offsets),
+		('word_bytes', word_bytes)
+	]
+
+	# section positions depend on the header length, so reserve enough space for the largest possible numbers
+	position = len(INDEX_MAGIC) + HEADER_LENGTH_BYTES + len(json.dumps(meta).encode('utf-8')) + 300
+	for name, section in sections:
+		position = _align(position)
+		meta['sections'][name] = position
+		position += section.nbytes
+	header = json.dumps(meta).encode('utf-8')
+	header += b' ' * (meta['sections']['hashes'] - len(INDEX_MAGIC) - HEADER_LENGTH_BYTES - len(header))
+
+	tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+	try:
+		with open(tmp_path, 'wb') as f:
+			f.write(INDEX_MAGIC)
+			f.write(len(header).to_bytes(HEADER_LENGTH_BYTES, 'little'))
+			f.write(header)
+			for name, section in sections:
+				f.write(b'\0' * (meta['sections'][name] - f.tell()))
+				section.tofile(f)
+		os.replace(tmp_path, path)
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+	logger.info(f'Symmetric delete index with {len(words)} words and {len(hashes)} deletes written to {path}')
+
+
+def _map_section(path: str, position: int, dtype, count: int):
+	# numpy can not memory map empty sections
+	if count == 0:
+		return np.zeros(0, dtype=dtype)
+	return np.memmap(path, dtype=dtype, mode='r', offset=position, shape=(count,))
+
+
+class SymSpellIndex(object):
+	"""Memory mapped symmetric delete spell checker.
+
+	Can be used in place of a pyspellchecker SpellChecker: supports `word in index` and `index.correction(word)`.
+	Like pyspellchecker, words are compared in lower case and the suggestion with the smallest edit distance
+	and the highest frequency is returned.
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		with open(path, 'rb') as f:
+			if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+				raise ValueError(f'{path} is not a symmetric delete index')
+			header_length = int.from_bytes(f.read(HEADER_LENGTH_BYTES), 'little')
+			meta = json.loads(f.read(header_length).decode('utf-8'))
+
+		if meta['version'] != INDEX_FORMAT_VERSION:
+			raise ValueError(f'{path} has index format {meta["version"]}, expected {INDEX_FORMAT_VERSION}')
+
+		self.sources: List[Dict] = meta['sources']
+		self.max_distance: int = meta['max_distance']
+		self.prefix_length: int = meta['prefix_length']
+		self.directory_shift = np.uint64(64 - meta['directory_bits'])
+		sections = meta['sections']
+		self.hashes = _map_section(path, sections['hashes'], np.uint64, meta['num_entries'])
+		self.word_ids = _map_section(path, sections['word_ids'], np.int32, meta['num_entries'])
+		self.directory = _map_section(path, sections['directory'], np.int64, 2 ** meta['directory_bits'] + 1)
+		self.counts = _map_section(path, sections['counts'], np.int64, meta['num_words'])
+		self.word_offsets = _map_section(path, sections['word_offsets'], np.int64, meta['num_words'] + 1)
+		self.word_bytes = _map_section(path, sections['word_bytes'], np.uint8, meta['num_word_bytes'])
+
+	def __getstate__(self):
+		# do not copy the memory mapped arrays when the index is sent to another process
+		return {'path': self.path}
+
+	def __setstate__(self, state):
+		self.__init__(state['path'])
+
+	def _word(self, word_id: int) -> str:
+		return self.word_bytes[self.word_offsets[word_id]:self.word_offsets[word_id + 1]].tobytes().decode('utf-8')
+
+	def _probe(self, key: str) -> np.ndarray:
+		h = np.uint64(_hash(key))
+		bucket = int(h >> self.directory_shift)
+		start, end = self.directory[bucket], self.directory[bucket + 1]
+		bucket_hashes = self.hashes[start:end]
+		return self.word_ids[start:end][bucket_hashes == h]
+
+	def __contains__(self, word: str) -> bool:
+		word = word.lower()
+		return any(self._word(i) == word for i in self._probe(word[:self.prefix_length]))
+
+	def candidates(self, word: str) -> List[str]:
+		"""All known words with the smallest edit distance to word (at most max_distance)."""
+		word = word.lower()
+		word_ids = set()
+		for d in get_deletes(word[:self.prefix_length], self.max_distance):
+			word_ids.update(self._probe(d).tolist())
+
+		best_distance = self.max_distance + 1
+		best = []
+		for i in word_ids:
+			candidate = self._word(i)
+			distance = edit_distance(word, candidate, min(best_distance, self.max_distance))
+			if distance < best_distance:
+				best_distance = distance
+				best = [(candidate, i)]
+			elif distance == best_distance and distance <= self.max_distance:
+				best.append((candidate, i))
+		best.sort(key=lambda c: (-self.counts[c[1]], c[0]))
+		return [c for c, _ in best]
+
+	def correction(self, word: str) -> str:
+		candidates = self.candidates(word)
+		if len(candidates) == 0:
+			return word
+		return candidates[0]
+
+
+def get_symspell_index_path(language: str) -> str:
+	return os.path.join(os.getcwd(), 'data', 'spellchecker', f'{language}_symspell.idx')
+
+def load_symspell_index(language: str, source_files: List[str]) -> SymSpellIndex:
+	"""Loads the prebuilt symmetric delete index of a language.
+
+	The index is built once with build_language_index (python -m data.spellchecker.symspell <language>).
+	Loading only compares the stored size and modification time of the source files with the current ones,
+	the word lists are not read.
+
+	Arguments:
+		language {str} -- language of the index
+		source_files {List[str]} -- files the index was built from
+
+	Raises:
+		ValueError -- if the index does not exist or is stale
+
+	Returns:
+		SymSpellIndex -- the index
+	"""
+	path = get_symspell_index_path(language)
+	hint = f'Build it with: python -m data.spellchecker.symspell {language}'
+	if not check_if_file_exists(path):
+		logger.error(f'Symmetric delete index does not exist at {path}. {hint}')
+		raise ValueError(f'Symmetric delete index does not exist at {path}. {hint}')
+
+	try:
+		index = SymSpellIndex(path)
+	except ValueError as err:
+		logger.error(f'Could not load symmetric delete index at {path} ({err}). {hint}')
+		raise ValueError(f'{err}. {hint}')
+
+	if index.sources != source_stats(source_files):
+		logger.error(f'Symmetric delete index at {path} was built from different files. {hint}')
+		raise ValueError(f'Symmetric delete index at {path} is stale. {hint}')
+	return index
+
+def build_language_index(language: str, max_distance: int = 2, prefix_length: int = 7) -> str:
+	"""Builds the symmetric delete index of a language from its dictionaries and domain word lists.
+
+	Returns:
+		str -- path of the index
+	"""
+	from data.spellchecker.spellchecker import get_symspell_source_files, get_symspell_word_lists
+	path = get_symspell_index_path(language)
+	source_files = get_symspell_source_files(language)
+
+	# stat before reading, so that a file that changes during the build makes the index stale
+	sources = source_stats(source_files)
+	word_counts = merge_word_lists(get_symspell_word_lists(language))
+	build_symspell_index(path, word_counts, max_distance, prefix_length, sources)
+	return path
+
+
+if __name__ == '__main__':
+	import argparse
+	logging.basicConfig(level=logging.INFO)
+	parser = argparse.ArgumentParser(description='Builds the symmetric delete spell checker index of a language.')
+	parser.add_argument('language', choices=['en', 'de'])
+	parser.add_argument('--max_distance', type=int, default=2)
+	parser.add_argument('--prefix_length', type=int, default=7)
+	args = parser.parse_args()
+	build_language_index(args.language, args.max_distance, args.prefix_length)
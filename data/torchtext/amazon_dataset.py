@@ -9,6 +9,8 @@ import torch.utils.data
 from misc.utils import create_dir_if_necessary, check_if_file_exists, isnotebook
 from data.torchtext.custom_fields import ReversibleField
 from data.torchtext.custom_datasets import *
+from data.torchtext.columnar_cache import cache_version, load_columnar_cache, ColumnarCacheWriter
+from data.torchtext.text_normalizer import TextNormalizer, AMAZON_PROFILE
 import pandas as pd
 
 if isnotebook():
@@ -32,7 +34,7 @@ def add_tr_prefixes(path:str, tr_1=False, tr_2=False, tr_3=False, sp=False) -> s
 		fn[0] += '_TR-3' 
 	return '.'.join(fn)
 
-class AmazonDataset(Dataset):
+class AmazonDataset(CachedDataset):
 
 	@staticmethod
 	def sort_key(example):
@@ -99,13 +101,17 @@ class AmazonDataset(Dataset):
 
 		# first, try to load all models from cache
 		filename = path.split("\\")[-1]
-		examples, loaded_fields = self._try_load(filename.split(".")[0], fields)
+		version = cache_version(hp, path)
+		examples, loaded_fields = self._try_load(filename.split(".")[0], fields, version)
 
 		if not examples:
-			examples, fields = self._load(path, filename, fields, a_sentiment, hp=hp, **kwargs)
+			if is_streamable(path):
+				examples, fields = self._load_streaming(path, filename, fields, version, hp=hp, **kwargs)
+			else:
+				examples, fields = self._load(path, filename, fields, a_sentiment, hp=hp, **kwargs)
 			
 			# disable caching for now... space on Azure Cloud VMs is expensive ;)
-			# self._save(filename.split(".")[0], examples)
+			# self._save(filename.split(".")[0], examples, version)
 		else:
 			fields = loaded_fields
 			
@@ -128,6 +134,7 @@ class AmazonDataset(Dataset):
 		aspect_sentiments: List[Dict[str, str]] = []
 
 		raw_examples: List[List[Union[str, List[Dict[str, str]]]]] = []
+		normalizer = TextNormalizer(hp, AMAZON_PROFILE)
 
 		# read the pickeled dataframe
 		df = pd.read_pickle(path)
@@ -149,23 +156,12 @@ class AmazonDataset(Dataset):
 			sentiment_dict[aspect_category] = aspect_sentiment
 
 
-			# replace urls with regex
-			comment = replace_urls_regex(comment)
-
-			comment = comment.split(' ')
-
-			# remove all empty entries
-			comment = [w for w in comment if w.strip() != '']
-
-			if hp.replace_url_tokens:
-				comment = replace_urls(comment)
-				
-			comment = ' '.join(comment)
+			comment = normalizer(comment)
 
 			columns = [
 				comment,
 				sentiment_dict,
-				'' # padding
+				'' # lengths
 			]
 
 			raw_examples.append(columns)
@@ -204,9 +200,49 @@ class AmazonDataset(Dataset):
 				example.comments = example.comments[0:hp.clip_comments_to]
 				comment_length = hp.clip_comments_to
 
-			example.padding = ['0'] * comment_length
+			example.lengths = comment_length
 		return examples, fields
 		
+	def _load_streaming(self, path, filename, fields, version, verbose=True, hp=None, chunksize=10000, **kwargs):
+		"""Loads a chunked review file (Parquet, Feather or json lines) in a single pass.
+
+		Every review is cleaned, tokenized, clipped and appended to the columnar cache right away, so memory
+		does not grow with the number of reviews. The examples are then read back from the cache.
+		"""
+		self.hp = hp
+		comment_field = dict(fields)['comments']
+		writer = ColumnarCacheWriter(self._cache_path(filename.split(".")[0]))
+		aspect_sentiment_categories = set()
+		normalizer = TextNormalizer(hp, AMAZON_PROFILE)
+
+		iterator = tqdm(desc=f'Load {os.path.basename(filename)[0:7]}', leave=True, disable=not verbose)
+		for chunk in iter_review_chunks(path, chunksize):
+			for aspect_category, aspect_sentiment, comment in zip(chunk['aspect'], chunk['sentiment'], chunk['reviewText']):
+				self.stats[aspect_category][aspect_sentiment] += 1
+				aspect_sentiment_categories.add(aspect_category)
+
+				comment = normalizer(comment)
+				comment = comment_field.preprocess(comment)[0:hp.clip_comments_to]
+				writer.append(comment, {aspect_category: aspect_sentiment})
+			iterator.update(len(chunk))
+		iterator.close()
+
+		# process the aspect sentiment
+		if len(self.aspects) == 0:
+			# make sure the list is sorted. Otherwise we'll have a different
+			# order every time and can not transfer models
+			self.aspects = sorted(aspect_sentiment_categories)
+
+			# construct the fields
+			fields = self._construct_fields(fields)
+
+		# every review has a label for exactly one aspect
+		self.na_labels = writer.num_examples * (len(self.aspects) - 1)
+		writer.close(version, self.aspects, self.stats, self.na_labels)
+
+		cache = load_columnar_cache(writer.path, version)
+		return cache.examples, fields
+
 	def _construct_fields(self, fields):
 		for s_cat in self.aspects:
 
@@ -222,39 +258,35 @@ class AmazonDataset(Dataset):
 				fields.append((s_cat, f))
 		return fields
 
-	def _try_load(self, name, fields):
-		path = os.path.join(os.getcwd(), 'data', 'data', 'cache', self.dataset_name)
-		create_dir_if_necessary(path)
-		samples_path = os.path.join(path, name + ".pkl")
-		aspects_path = os.path.join(path, name + "_aspects.pkl")
-
-		if not check_if_file_exists(samples_path) or not check_if_file_exists(aspects_path):
-			return [], None
-
-		with open(samples_path, 'rb') as f:
-			examples = pickle.load(f)
-
-		with open(aspects_path, 'rb') as f:
-			self.aspects = pickle.load(f)
-
-		# get all fields
-		fields = self._construct_fields(fields)
-		return examples, fields
-
-	def _save(self, name, samples):
-
-		path = os.path.join(os.getcwd(), 'data', 'data', 'cache', self.dataset_name)
-		create_dir_if_necessary(path)
-		samples_path = os.path.join(path, name + ".pkl")
-		aspects_path = os.path.join(path, name + "_aspects.pkl")
-
-		# print(f'Trying to save loaded dataset to {samples_path}.')
-		with open(samples_path, 'wb') as f:
-			pickle.dump(samples, f)
-			# print(f'Model {name} successfully saved.')
-
-		with open(aspects_path, "wb") as f:
-			pickle.dump(self.aspects, f)
-
 
-	
\ No newline at end of file
+# .json files may hold a single json array (e.g. DataFrame.to_json()) and are read by the existing loader
+STREAMABLE_EXTENSIONS = ['.parquet', '.feather', '.arrow', '.jsonl']
+
+def is_streamable(path: str) -> bool:
+	return os.path.splitext(path)[1].lower() in STREAMABLE_EXTENSIONS
+
+def iter_review_chunks(path: str, chunksize: int = 10000):
+	"""Yields the reviews of a Parquet, Feather or json lines file as DataFrames of at most `chunksize` rows.
+	
+	Parquet and Feather files require pyarrow.
+	"""
+	ext = os.path.splitext(path)[1].lower()
+	columns = ['aspect', 'sentiment', 'reviewText']
+
+	if ext == '.parquet':
+		import pyarrow.parquet as pq
+		parquet_file = pq.ParquetFile(path)
+		for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+			yield batch.to_pandas()
+	elif ext in ['.feather', '.arrow']:
+		import pyarrow as pa
+		reader = pa.ipc.open_file(path)
+		for i in range(reader.num_record_batches):
+			batch = reader.get_batch(i)
+			for start in range(0, batch.num_rows, chunksize):
+				yield batch.slice(start, chunksize).to_pandas()[columns]
+	elif ext == '.jsonl':
+		for chunk in pd.read_json(path, lines=True, chunksize=chunksize):
+			yield chunk[columns]
+	else:
+		raise ValueError(f'Can not stream reviews from {path}. Supported formats are {STREAMABLE_EXTENSIONS}')
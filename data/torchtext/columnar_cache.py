@@ -0,0 +1,355 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+import torchtext.data as data
+
+from misc.utils import create_dir_if_necessary
+
+logger = logging.getLogger(__name__)
+
+# increase this whenever the layout of the cache changes
+CACHE_FORMAT_VERSION = 3
+
+# flags of the run configuration that change the content of a preprocessed dataset
+PREPROCESSING_FLAGS = [
+	'task',
+	'language',
+	'clip_comments_to',
+	'use_stop_words',
+	'use_spell_checkers',
+	'spell_correction_on_load',
+	'use_text_cleaner',
+	'contraction_removal',
+	'organic_text_cleaning',
+	'replace_url_tokens',
+	'harmonize_bahn',
+	'token_removal_1',
+	'token_removal_2',
+	'token_removal_3'
+]
+
+NA_LABEL = 'n/a'
+
+# a cache file consists of the magic bytes, the length of the json header, the json header and the
+# 8 byte aligned sections (tokens, offsets, labels, string tables and extras columns) whose positions
+# and sizes are stored in the header
+CACHE_MAGIC = b'ABSACOLS'
+HEADER_LENGTH_BYTES = 8
+
+
+def _align(position: int) -> int:
+	return (position + 7) // 8 * 8
+
+
+def _encode_strings(strings: List[str]) -> np.ndarray:
+	# the strings of a table are separated by a null byte, so the table is decoded with a single split
+	encoded = '\0'.join(strings)
+	if encoded.count('\0') != max(0, len(strings) - 1):
+		raise ValueError('Strings of a columnar cache must not contain null characters')
+	return np.frombuffer(encoded.encode('utf-8'), dtype=np.uint8)
+
+def _decode_strings(section: np.ndarray, count: int) -> List[str]:
+	if count == 0:
+		return []
+	return section.tobytes().decode('utf-8').split('\0')
+
+
+def cache_version(hp, source_path: str, *extra) -> str:
+	"""Computes the version of a cached dataset split.
+
+	The version is a hash of the preprocessing flags of the run configuration, the modification time and size
+	of the source file and any additional values (e.g. the task). A cache with a different version is stale.
+
+	Arguments:
+		hp {RunConfiguration} -- run configuration used for preprocessing
+		source_path {str} -- path of the raw dataset file
+
+	Returns:
+		str -- version hash
+	"""
+	flags = {f: str(getattr(hp, f, None)) for f in PREPROCESSING_FLAGS}
+	source = {}
+	if os.path.exists(source_path):
+		stat = os.stat(source_path)
+		source = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+	key = json.dumps({
+		'format': CACHE_FORMAT_VERSION,
+		'flags': flags,
+		'source': source,
+		'extra': [str(e) for e in extra]
+	}, sort_keys=True)
+	return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class ColumnarCacheWriter(object):
+	"""Writes a preprocessed dataset split into a single columnar cache file.
+
+	Comments are numericalized with a cache-local token table and appended to a flat int32 token array with an
+	int64 offsets array. Aspect labels are collected sparsely and written as a dense int8 matrix
+	[num_examples x num_aspects] on close, so the aspects do not have to be known while records are appended.
+	All other example attributes (id, relevance, ...) are stored as json columns.
+
+	Everything is written to a temporary file which replaces the cache file in one rename, so concurrent
+	readers and writers never see a partially written cache.
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+		create_dir_if_necessary(os.path.dirname(path))
+
+		self.num_examples = 0
+		self._tokens = tempfile.TemporaryFile()
+		self._offsets = array('q', [0])
+		self._token_stoi: Dict[str, int] = {}
+		self._token_itos: List[str] = []
+
+		self._label_rows = array('l')
+		self._label_aspects = array('l')
+		self._label_values = array('l')
+		self._aspect_stoi: Dict[str, int] = {}
+		self._aspect_itos: List[str] = []
+		self._label_stoi: Dict[str, int] = {NA_LABEL: 0}
+		self._label_itos: List[str] = [NA_LABEL]
+
+		self._extras: Dict[str, list] = defaultdict(list)
+
+	def _code(self, value: str, stoi: Dict[str, int], itos: List[str]) -> int:
+		code = stoi.get(value)
+		if code is None:
+			code = len(itos)
+			stoi[value] = code
+			itos.append(value)
+		return code
+
+	def append(self, tokens: List[str], labels: Dict[str, str], extras: Dict[str, object] = None) -> None:
+		"""Appends one example.
+
+		Arguments:
+			tokens {List[str]} -- preprocessed and clipped comment tokens
+			labels {Dict[str, str]} -- aspect -> sentiment label of all aspects that are not n/a
+
+		Keyword Arguments:
+			extras {Dict[str, object]} -- json serializable example attributes (default: {None})
+		"""
+		ids = array('i', [self._code(t, self._token_stoi, self._token_itos) for t in tokens])
+		ids.tofile(self._tokens)
+		self._offsets.append(self._offsets[-1] + len(ids))
+
+		for aspect, label in labels.items():
+			if label == NA_LABEL:
+				continue
+			self._label_rows.append(self.num_examples)
+			self._label_aspects.append(self._code(aspect, self._aspect_stoi, self._aspect_itos))
+			self._label_values.append(self._code(label, self._label_stoi, self._label_itos))
+
+		if extras:
+			for name, value in extras.items():
+				self._extras[name].append(value)
+		self.num_examples += 1
+
+	def append_example(self, example: data.Example, aspects: List[str]) -> None:
+		extras = {name: value for name, value in vars(example).items()
+					if name not in aspects and name not in ('comments', 'lengths', 'aspect_sentiments')}
+		labels = {aspect: getattr(example, aspect) for aspect in aspects}
+		self.append(example.comments, labels, extras)
+
+	def close(self, version: str, aspects: List[str], stats=None, na_labels: int = 0) -> None:
+		"""Writes the cache file and moves it into place.
+
+		Arguments:
+			version {str} -- cache version (see cache_version)
+			aspects {List[str]} -- ordered aspect names. Raises a ValueError for labels of unknown aspects
+		"""
+		aspect_positions = np.asarray([aspects.index(a) for a in self._aspect_itos], dtype=np.int64)
+		labels = np.zeros((self.num_examples, len(aspects)), dtype=np.int8)
+		if len(self._label_rows) > 0:
+			labels[np.asarray(self._label_rows), aspect_positions[np.asarray(self._label_aspects)]] = \
+				np.asarray(self._label_values)
+		offsets = np.asarray(self._offsets, dtype=np.int64)
+		num_tokens = int(offsets[-1])
+
+		sections = [
+			('offsets', offsets),
+			('labels', labels),
+			('token_table', _encode_strings(self._token_itos)),
+			('label_table', _encode_strings(self._label_itos))
+		]
+		# extras columns are decoded when the examples are materialized, not when the header is read
+		for name, column in self._extras.items():
+			sections.append((f'extras.{name}', np.frombuffer(json.dumps(column).encode('utf-8'), dtype=np.uint8)))
+
+		meta = {
+			'version': version,
+			'num_examples': self.num_examples,
+			'num_tokens': num_tokens,
+			'num_token_strings': len(self._token_itos),
+			'num_label_strings': len(self._label_itos),
+			'aspects': aspects,
+			'extras': list(self._extras.keys()),
+			'stats': stats or {},
+			'na_labels': na_labels,
+			'sections': {}
+		}
+
+		# section positions depend on the header length, so measure the header with placeholders that are
+		# at least as long as the real positions and sizes
+		section_sizes = [('tokens', num_tokens * 4)] + [(name, section.nbytes) for name, section in sections]
+		meta['sections'] = {name: [2 ** 53, 2 ** 53] for name, _ in section_sizes}
+		position = len(CACHE_MAGIC) + HEADER_LENGTH_BYTES + len(json.dumps(meta).encode('utf-8'))
+		for name, size in section_sizes:
+			position = _align(position)
+			meta['sections'][name] = [position, size]
+			position += size
+		header = json.dumps(meta).encode('utf-8')
+		header += b' ' * (meta['sections']['tokens'][0] - len(CACHE_MAGIC) - HEADER_LENGTH_BYTES - len(header))
+
+		try:
+			with open(self.tmp_path, 'wb') as f:
+				f.write(CACHE_MAGIC)
+				f.write(len(header).to_bytes(HEADER_LENGTH_BYTES, 'little'))
+				f.write(header)
+
+				self._tokens.seek(0)
+				shutil.copyfileobj(self._tokens, f)
+				for name, array_data in sections:
+					f.write(b'\0' * (meta['sections'][name][0] - f.tell()))
+					array_data.tofile(f)
+
+			os.replace(self.tmp_path, self.path)
+		finally:
+			self._tokens.close()
+			if os.path.exists(self.tmp_path):
+				os.remove(self.tmp_path)
+
+
+def write_examples(path: str, examples: List[data.Example], version: str, aspects: List[str], stats=None, na_labels: int = 0) -> None:
+	writer = ColumnarCacheWriter(path)
+	for example in examples:
+		writer.append_example(example, aspects)
+	writer.close(version, aspects, stats, na_labels)
+
+
+def _map_section(path: str, section, dtype):
+	position, size = section
+	count = size // np.dtype(dtype).itemsize
+	# numpy can not memory map empty sections
+	if count == 0:
+		return np.zeros(0, dtype=dtype)
+	return np.memmap(path, dtype=dtype, mode='r', offset=position, shape=(count,))
+
+
+class ColumnarExamples(object):
+	"""Read-only sequence of torchtext Examples backed by a memory mapped columnar cache.
+
+	Opening the cache only maps its sections. The examples are materialized once, on the first access, with
+	one gather of the token and label strings for the whole split. Every later access, e.g. in the next
+	epoch, returns the same Example objects.
+	"""
+
+	def __init__(self, path: str, meta):
+		self.aspects: List[str] = meta['aspects']
+		self.num_examples: int = meta['num_examples']
+		self.num_token_strings: int = meta['num_token_strings']
+		self.num_label_strings: int = meta['num_label_strings']
+		self.extra_names: List[str] = meta['extras']
+
+		sections = meta['sections']
+		self.tokens = _map_section(path, sections['tokens'], np.int32)
+		self.offsets = _map_section(path, sections['offsets'], np.int64)
+		self.labels = _map_section(path, sections['labels'], np.int8).reshape(self.num_examples, len(self.aspects))
+		self.token_table = _map_section(path, sections['token_table'], np.uint8)
+		self.label_table = _map_section(path, sections['label_table'], np.uint8)
+		self.extras = {name: _map_section(path, sections[f'extras.{name}'], np.uint8) for name in self.extra_names}
+		self._examples: Optional[List[data.Example]] = None
+
+	def _materialize(self) -> List[data.Example]:
+		token_itos = np.array(_decode_strings(self.token_table, self.num_token_strings), dtype=object)
+		label_itos = np.array(_decode_strings(self.label_table, self.num_label_strings), dtype=object)
+		tokens = token_itos[np.asarray(self.tokens)].tolist()
+		offsets = self.offsets.tolist()
+		labels = label_itos[np.asarray(self.labels)].tolist()
+		extras = {name: json.loads(section.tobytes().decode('utf-8')) for name, section in self.extras.items()}
+
+		examples = []
+		for i in range(self.num_examples):
+			example = data.Example()
+			example.comments = tokens[offsets[i]:offsets[i + 1]]
+			example.lengths = len(example.comments)
+
+			example.aspect_sentiments = labels[i]
+			for aspect, label in zip(self.aspects, labels[i]):
+				setattr(example, aspect, label)
+
+			for name, column in extras.items():
+				setattr(example, name, column[i])
+			examples.append(example)
+		return examples
+
+	@property
+	def examples(self) -> List[data.Example]:
+		if self._examples is None:
+			self._examples = self._materialize()
+		return self._examples
+
+	def __len__(self):
+		return self.num_examples
+
+	def __getitem__(self, i):
+		return self.examples[i]
+
+	def __iter__(self):
+		return iter(self.examples)
+
+
+class ColumnarCache(object):
+
+	def __init__(self, path: str, meta):
+		self.path = path
+		self.version: str = meta['version']
+		self.aspects: List[str] = meta['aspects']
+		self.stats = meta['stats']
+		self.na_labels: int = meta['na_labels']
+		self.examples = ColumnarExamples(path, meta)
+
+
+def load_columnar_cache(path: str, version: str) -> Optional[ColumnarCache]:
+	"""Opens a columnar cache file.
+
+	Arguments:
+		path {str} -- cache file
+		version {str} -- expected cache version
+
+	Returns:
+		Optional[ColumnarCache] -- the cache or None if it does not exist, is stale or unreadable
+	"""
+	if not os.path.isfile(path):
+		logger.info(f'Cache miss for {path}: no cache file.')
+		return None
+
+	try:
+		with open(path, 'rb') as f:
+			if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+				logger.warning(f'Cache miss for {path}: not a columnar cache file.')
+				return None
+			header_length = int.from_bytes(f.read(HEADER_LENGTH_BYTES), 'little')
+			meta = json.loads(f.read(header_length).decode('utf-8'))
+	except Exception:
+		logger.exception(f'Cache miss for {path}: could not read the cache header.')
+		return None
+
+	if meta.get('version') != version:
+		logger.info(f'Cache miss for {path}: cache is stale (version {meta.get("version")}, expected {version}).')
+		return None
+
+	return ColumnarCache(path, meta)
@@ -21,6 +21,10 @@ import spacy
 from spellchecker import SpellChecker
 
 from misc.utils import check_if_file_exists
+from data.torchtext.columnar_cache import load_columnar_cache, write_examples
+from data.spellchecker.correction_store import get_correction_store, correct_tokens, apply_corrections
+from data.spellchecker.symspell import load_symspell_index
+from data.spellchecker.spellchecker import get_symspell_source_files
 
 logger = logging.getLogger(__name__)
 
@@ -232,73 +236,73 @@ class Dataset(torch.utils.data.Dataset):
 
 	
 	def fix_spellings(self, text_tokens: List[str], spell: SpellChecker, language='en') -> List[str]:
-		for i, w in enumerate(text_tokens):
-			if w == ' ' or w == '':
-				continue
-
-			# don't replace if all caps
-			if w.isupper():
-				continue
-
-			# check if it was already replaced
-			if w in self.spellCheckerReplaced:
-				text_tokens[i] = self.spellCheckerReplaced[w]
-				continue
-			
-			if w not in spell:
-				c = spell.correction(w)
-
-				if c == w:
-					continue
-				text_tokens[i] = c
-				self.spellCheckerReplaced[w] = c
+		return self.correct_spellings([text_tokens], spell, language)[0]
 
-		
-		self.save_spellchecker_cache(language)
-		return text_tokens
+	def correct_spellings(self, comments: List[List[str]], spell: SpellChecker, language='en', num_workers=0) -> List[List[str]]:
+		"""Spell corrects tokenized comments in place.
 
-	def save_spellchecker_cache(self, language):
-		path = os.path.join(os.getcwd(), 'data', 'spellchecker', language + '_cache.pkl')
-		with open(path, "wb") as f:
-				pickle.dump(self.spellCheckerReplaced, f)
+		The unique unknown tokens of all comments are corrected in one batch (in parallel if num_workers > 0)
+		and appended to the correction store of the language. Known corrections are only looked up.
+		"""
+		store = get_correction_store(language)
+		self.spellCheckerReplaced = store.table
+		correct_tokens(comments, spell, store, num_workers)
+		return [apply_corrections(c, store) for c in comments]
 
 	def load_spellchecker_cache(self, language):
-		path = os.path.join(os.getcwd(), 'data', 'spellchecker', language + '_cache.pkl')
-		if check_if_file_exists(path):
-			with open(path, 'rb') as f:
-				loaded = pickle.load(f)
-				self.spellCheckerReplaced = loaded
+		self.spellCheckerReplaced = get_correction_store(language).table
 
-
-	def initialize_spellchecker(self, language: str) -> SpellChecker:
+	def initialize_spellchecker(self, language: str):
 
 		#try to initialize cache
 		self.load_spellchecker_cache(language)
 
-		if language != 'en':
-			if language == 'de':
-				spell = SpellChecker(language=None)
+		if language not in ['en', 'de']:
+			return SpellChecker(language=language)
+
+		# symmetric delete index that was built offline (python -m data.spellchecker.symspell <language>)
+		return load_symspell_index(language, get_symspell_source_files(language))
 
-				from data.spellchecker.spellchecker import get_de_dictionary
-				spell.word_frequency.load_words(germeval_words)
-				spell.word_frequency.load_words(get_de_dictionary())
-			else:
-				spell = SpellChecker(language=language)
 
-			return spell
+class CachedDataset(Dataset):
+	"""Dataset whose preprocessed splits are kept in the shared columnar cache.
 
-		spell = SpellChecker(language='en')
+	Every split is cached in data/data/cache/<dataset_name>/<split name>.cols. Subclasses set
+	`dataset_name`, `aspects` and `stats` and implement `_construct_fields`.
+	"""
+
+	dataset_name = ''
 
-		# load word from additional dictionary
-		from data.spellchecker.spellchecker import get_en_dictionary, get_organic_dictionary
-		d = get_en_dictionary()
-		spell.word_frequency.load_words(d)
+	def _cache_path(self, name: str) -> str:
+		return os.path.join(os.getcwd(), 'data', 'data', 'cache', self.dataset_name, os.path.basename(name) + '.cols')
 
-		# load organic specific entities
-		d = get_organic_dictionary()
-		spell.word_frequency.load_words(d)
+	def _try_load(self, name: str, fields, version: str):
+		path = self._cache_path(name)
+		cache = load_columnar_cache(path, version)
+		if cache is None:
+			return [], None
 
-		return spell
+		# validation and test splits have to use the aspects of the train split
+		if len(self.aspects) > 0 and cache.aspects != self.aspects:
+			logger.info(f'Cache miss for {path}: cached aspects do not match the aspects of the train split.')
+			return [], None
+
+		logger.info(f'Cache hit for {path} ({len(cache.examples)} examples).')
+		self.aspects = cache.aspects
+		self.stats.update(cache.stats)
+		self.na_labels = cache.na_labels
+
+		# get all fields
+		fields = self._construct_fields(fields)
+		return cache.examples, fields
+
+	def _save(self, name: str, examples, version: str) -> None:
+		path = self._cache_path(name)
+		try:
+			write_examples(path, examples, version, self.aspects, self.stats, getattr(self, 'na_labels', 0))
+			logger.info(f'Saved {len(examples)} examples to cache {path}.')
+		except Exception:
+			logger.exception(f'Could not write cache {path}')
 
 
 def check_split_ratio(split_ratio):
@@ -362,8 +366,13 @@ def rationed_split(examples, train_ratio, test_ratio, val_ratio, rnd):
 
 	return data
 
+# spacy models are expensive to load, so each language is only loaded once per process
+_spacy_models = {}
+
 def text_cleaner(text: str, language: str):
-	spacy_nlp = spacy.load(language)
+	if language not in _spacy_models:
+		_spacy_models[language] = spacy.load(language)
+	spacy_nlp = _spacy_models[language]
 	parsed = spacy_nlp(text)
 	final_tokens = []
 	for t in parsed:
@@ -381,66 +390,67 @@ def text_cleaner(text: str, language: str):
 	spell_corrected = re.sub(r'(.)\1+', r'\1\1', joined)
 	return spell_corrected
 
+# from https://gist.githubusercontent.com/tthustla/74e99a00541264e93c3bee8b2b49e6d8/raw/599100471e8127d6efad446717dc951a10b69777/yatwapart1_01.py
+EN_CONTRACTION_MAPPING = {
+				"youre": "you are",
+				"youll": "you will",
+				"theyre": "they are", "theyll": "they will",
+				"weve": "we have",
+				"shouldnt": "should not",
+				"dont": "do not",
+				"doesnt": "does not", "doesn": "does not",
+				"didnt": "did not",
+				"wasn": "was not",
+				"arent": "are not", "aren": "are not",
+				"aint": "is not", "isnt": "is not", "isn": "is not",
+				"wouldnt": "would not", "wouldn": "would not",
+				"ain't": "is not", "aren't": "are not","can't": "cannot", 
+			   "can't've": "cannot have", "'cause": "because", "could've": "could have", 
+			   "couldn't": "could not", "couldn't've": "could not have","didn't": "did not", 
+			   "doesn't": "does not", "don't": "do not", "hadn't": "had not", 
+			   "hadn't've": "had not have", "hasn't": "has not", "haven't": "have not", 
+			   "he'd": "he would", "he'd've": "he would have", "he'll": "he will", 
+			   "he'll've": "he will have", "he's": "he is", "how'd": "how did", 
+			   "how'd'y": "how do you", "how'll": "how will", "how's": "how is", 
+			   "I'd": "I would", "I'd've": "I would have", "I'll": "I will", 
+			   "I'll've": "I will have","I'm": "I am", "I've": "I have", 
+			   "i'd": "i would", "i'd've": "i would have", "i'll": "i will", 
+			   "i'll've": "i will have","i'm": "i am", "i've": "i have", 
+			   "isn't": "is not", "it'd": "it would", "it'd've": "it would have", 
+			   "it'll": "it will", "it'll've": "it will have","it's": "it is", 
+			   "let's": "let us", "ma'am": "madam", "mayn't": "may not", 
+			   "might've": "might have","mightn't": "might not","mightn't've": "might not have", 
+			   "must've": "must have", "mustn't": "must not", "mustn't've": "must not have", 
+			   "needn't": "need not", "needn't've": "need not have","o'clock": "of the clock", 
+			   "oughtn't": "ought not", "oughtn't've": "ought not have", "shan't": "shall not",
+			   "sha'n't": "shall not", "shan't've": "shall not have", "she'd": "she would", 
+			   "she'd've": "she would have", "she'll": "she will", "she'll've": "she will have", 
+			   "she's": "she is", "should've": "should have", "shouldn't": "should not", 
+			   "shouldn't've": "should not have", "so've": "so have","so's": "so as", 
+			   "this's": "this is",
+			   "that'd": "that would", "that'd've": "that would have","that's": "that is", 
+			   "there'd": "there would", "there'd've": "there would have","there's": "there is", 
+				   "here's": "here is",
+			   "they'd": "they would", "they'd've": "they would have", "they'll": "they will", 
+			   "they'll've": "they will have", "they're": "they are", "they've": "they have", 
+			   "to've": "to have", "wasn't": "was not", "we'd": "we would", 
+			   "we'd've": "we would have", "we'll": "we will", "we'll've": "we will have", 
+			   "we're": "we are", "we've": "we have", "weren't": "were not", 
+			   "what'll": "what will", "what'll've": "what will have", "what're": "what are", 
+			   "what's": "what is", "what've": "what have", "when's": "when is", 
+			   "when've": "when have", "where'd": "where did", "where's": "where is", 
+			   "where've": "where have", "who'll": "who will", "who'll've": "who will have", 
+			   "who's": "who is", "who've": "who have", "why's": "why is", 
+			   "why've": "why have", "will've": "will have", "won't": "will not", 
+			   "won't've": "will not have", "would've": "would have", "wouldn't": "would not", 
+			   "wouldn't've": "would not have", "y'all": "you all", "y'all'd": "you all would",
+			   "y'all'd've": "you all would have","y'all're": "you all are","y'all've": "you all have",
+			   "you'd": "you would", "you'd've": "you would have", "you'll": "you will", 
+			   "you'll've": "you will have", "you're": "you are", "you've": "you have" }
+
 def en_contraction_removal(text: str) -> str:
 	apostrophe_handled = re.sub("’", "'", text)
-	# from https://gist.githubusercontent.com/tthustla/74e99a00541264e93c3bee8b2b49e6d8/raw/599100471e8127d6efad446717dc951a10b69777/yatwapart1_01.py
-	contraction_mapping = {
-					"youre": "you are",
-					"youll": "you will",
-					"theyre": "they are", "theyll": "they will",
-					"weve": "we have",
-					"shouldnt": "should not",
-					"dont": "do not",
-					"doesnt": "does not", "doesn": "does not",
-					"didnt": "did not",
-					"wasn": "was not",
-					"arent": "are not", "aren": "are not",
-					"aint": "is not", "isnt": "is not", "isn": "is not",
-					"wouldnt": "would not", "wouldn": "would not",
-					"ain't": "is not", "aren't": "are not","can't": "cannot", 
-				   "can't've": "cannot have", "'cause": "because", "could've": "could have", 
-				   "couldn't": "could not", "couldn't've": "could not have","didn't": "did not", 
-				   "doesn't": "does not", "don't": "do not", "hadn't": "had not", 
-				   "hadn't've": "had not have", "hasn't": "has not", "haven't": "have not", 
-				   "he'd": "he would", "he'd've": "he would have", "he'll": "he will", 
-				   "he'll've": "he will have", "he's": "he is", "how'd": "how did", 
-				   "how'd'y": "how do you", "how'll": "how will", "how's": "how is", 
-				   "I'd": "I would", "I'd've": "I would have", "I'll": "I will", 
-				   "I'll've": "I will have","I'm": "I am", "I've": "I have", 
-				   "i'd": "i would", "i'd've": "i would have", "i'll": "i will", 
-				   "i'll've": "i will have","i'm": "i am", "i've": "i have", 
-				   "isn't": "is not", "it'd": "it would", "it'd've": "it would have", 
-				   "it'll": "it will", "it'll've": "it will have","it's": "it is", 
-				   "let's": "let us", "ma'am": "madam", "mayn't": "may not", 
-				   "might've": "might have","mightn't": "might not","mightn't've": "might not have", 
-				   "must've": "must have", "mustn't": "must not", "mustn't've": "must not have", 
-				   "needn't": "need not", "needn't've": "need not have","o'clock": "of the clock", 
-				   "oughtn't": "ought not", "oughtn't've": "ought not have", "shan't": "shall not",
-				   "sha'n't": "shall not", "shan't've": "shall not have", "she'd": "she would", 
-				   "she'd've": "she would have", "she'll": "she will", "she'll've": "she will have", 
-				   "she's": "she is", "should've": "should have", "shouldn't": "should not", 
-				   "shouldn't've": "should not have", "so've": "so have","so's": "so as", 
-				   "this's": "this is",
-				   "that'd": "that would", "that'd've": "that would have","that's": "that is", 
-				   "there'd": "there would", "there'd've": "there would have","there's": "there is", 
-					   "here's": "here is",
-				   "they'd": "they would", "they'd've": "they would have", "they'll": "they will", 
-				   "they'll've": "they will have", "they're": "they are", "they've": "they have", 
-				   "to've": "to have", "wasn't": "was not", "we'd": "we would", 
-				   "we'd've": "we would have", "we'll": "we will", "we'll've": "we will have", 
-				   "we're": "we are", "we've": "we have", "weren't": "were not", 
-				   "what'll": "what will", "what'll've": "what will have", "what're": "what are", 
-				   "what's": "what is", "what've": "what have", "when's": "when is", 
-				   "when've": "when have", "where'd": "where did", "where's": "where is", 
-				   "where've": "where have", "who'll": "who will", "who'll've": "who will have", 
-				   "who's": "who is", "who've": "who have", "why's": "why is", 
-				   "why've": "why have", "will've": "will have", "won't": "will not", 
-				   "won't've": "will not have", "would've": "would have", "wouldn't": "would not", 
-				   "wouldn't've": "would not have", "y'all": "you all", "y'all'd": "you all would",
-				   "y'all'd've": "you all would have","y'all're": "you all are","y'all've": "you all have",
-				   "you'd": "you would", "you'd've": "you would have", "you'll": "you will", 
-				   "you'll've": "you will have", "you're": "you are", "you've": "you have" }
-	expanded = ' '.join([contraction_mapping[t.lower()] if t.lower() in contraction_mapping else t for t in apostrophe_handled.split(" ")])
+	expanded = ' '.join([EN_CONTRACTION_MAPPING[t.lower()] if t.lower() in EN_CONTRACTION_MAPPING else t for t in apostrophe_handled.split(" ")])
 	return expanded
 
 def replace_urls_regex(sentence: str, url_token: str = '<URL>') -> str:
@@ -450,6 +460,33 @@ def replace_urls(words: List[str], url_token: str = '<URL>') -> List[str]:
 	return [url_token if (w.lower().startswith('www') or w.lower().startswith('http')) else w for w in words]
 
 
+def harmonize_bahn_names(text_tokens: List[str]) -> List[str]:
+	bahn_syn = [
+		'db',
+		'deutschebahn',
+		"db_bahn",
+		"bahn.de",
+		"@db_bahn",
+		"#db",
+		"@db",
+		"#db_bahn",
+		"@bahn",
+		"#bahn",
+		"@dbbahn",
+		"#dbbahn",
+		"#dbbahn"
+		"www.bahn.de",
+		"dbbahn"
+	]
+	result = []
+	for token in text_tokens:
+		if token.lower() in bahn_syn:
+			result.append('db')
+		else:
+			result.append(token)
+	return result
+
+
 def intelligent_sentences_clipping(s1: str, s2: str, clip_to: int):
 	# first clip s1 at the front.
 	# let's add words from the back until we hit the clipping mark
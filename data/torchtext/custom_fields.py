@@ -4,6 +4,24 @@ from torchtext.data.field import Field
 from torchtext.data.dataset import Dataset
 import os
 
+from data.torchtext.custom_vocab import Vocab
+
+class VectorField(Field):
+	"""Field for the comment tokens. Its vocabulary gathers all pretrained vectors
+	in one bulk lookup instead of one lookup per token."""
+	vocab_cls = Vocab
+
+class LengthField(Field):
+	"""Field for the number of words of a comment. The masks of the paddings are created from these lengths,
+	so the field needs no vocabulary."""
+
+	def __init__(self, **kwargs):
+		kwargs.setdefault('sequential', False)
+		kwargs.setdefault('use_vocab', False)
+		kwargs.setdefault('batch_first', True)
+		kwargs.setdefault('is_target', False)
+		super(LengthField, self).__init__(**kwargs)
+
 class ReversibleField(Field):
 	def __init__(self, **kwargs):
 		if kwargs.get('tokenize') is list:
@@ -1,11 +1,15 @@
 from __future__ import unicode_literals
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
+import hashlib
 import logging
 import os
+import re
 import zipfile
 import gzip
 
+import numpy as np
 import six
 from six.moves.urllib.request import urlretrieve
 import torch
@@ -152,13 +156,15 @@ class Vocab(object):
 
         tot_dim = sum(v.dim for v in vectors)
         self.vectors = torch.Tensor(len(self), tot_dim)
-        for i, token in enumerate(self.itos):
-            start_dim = 0
-            for v in vectors:
-                end_dim = start_dim + v.dim
-                self.vectors[i][start_dim:end_dim] = v[token.strip()]
-                start_dim = end_dim
-            assert(start_dim == tot_dim)
+        tokens = [token.strip() for token in self.itos]
+        start_dim = 0
+        for v in vectors:
+            end_dim = start_dim + v.dim
+            # gather all rows of this vocabulary at once so memory mapped
+            # vectors only read the rows that are actually needed
+            self.vectors[:, start_dim:end_dim] = v.vectors_for(tokens)
+            start_dim = end_dim
+        assert(start_dim == tot_dim)
 
     def set_vectors(self, stoi, vectors, dim, unk_init=torch.Tensor.zero_):
         """
@@ -176,13 +182,7 @@ class Vocab(object):
                 to zero vectors; can be any function that takes in a Tensor and
                 returns a Tensor of the same size. Default: torch.Tensor.zero_
         """
-        self.vectors = torch.Tensor(len(self), dim)
-        for i, token in enumerate(self.itos):
-            wv_index = stoi.get(token, None)
-            if wv_index is not None:
-                self.vectors[i] = vectors[wv_index]
-            else:
-                self.vectors[i] = unk_init(self.vectors[i])
+        self.vectors = _lookup_rows(stoi, vectors, self.itos, dim, unk_init)
 
 
 class SubwordVocab(Vocab):
@@ -251,10 +251,261 @@ def _infer_shape(f):
     return num_lines, vector_dim
 
 
+def _read_blocks(f, block_size):
+    """Read a binary file in blocks of roughly `block_size` bytes that only
+    contain complete lines. Every yielded block ends with a newline."""
+    remainder = b''
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b'\n') + 1
+        remainder = data[cut:]
+        if cut:
+            yield data[:cut]
+    if remainder:
+        yield remainder + b'\n'
+
+
+# the token of every line of a block: everything up to the first space
+_TOKEN_PATTERN = re.compile(br'^[^ \n]*', re.MULTILINE)
+
+# bytes that bytes.rstrip() removes
+_WHITESPACE = np.array([ord(c) for c in ' \t\n\r\x0b\x0c'], dtype=np.uint8)
+
+
+def _count_line_entries(data, starts, ends):
+    """Number of spaces of every line of `data` without trailing whitespace,
+    i.e. `line.rstrip().count(b' ')` for all lines at once."""
+    non_space = np.flatnonzero(~np.isin(data, _WHITESPACE))
+    if len(non_space) == 0:
+        stripped_ends = starts
+    else:
+        last = np.searchsorted(non_space, ends) - 1
+        stripped_ends = np.maximum(np.where(last >= 0, non_space[np.maximum(last, 0)] + 1, 0), starts)
+    spaces = np.flatnonzero(data == ord(' '))
+    return np.searchsorted(spaces, stripped_ends) - np.searchsorted(spaces, starts)
+
+
+def _parse_vector_block(block, dim):
+    """Parse a block of `word v_1 ... v_dim` lines.
+
+    The line layout of the whole block is computed with numpy, the tokens are
+    split out with one regular expression and all numbers are decoded with a
+    single `numpy.fromstring` call. Header lines (one entry) and non-UTF8
+    tokens are skipped in the same way as the line-by-line parser.
+
+    Returns:
+        A tuple `(words, vectors, messages)` where `vectors` is a float32
+        array of shape `[len(words), dim]` and `messages` contains
+        `(level, message)` log records for the skipped lines.
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+    num_entries = _count_line_entries(data, starts, ends)
+    raw_words = _TOKEN_PATTERN.findall(block)[:len(ends)]
+
+    # Explicitly splitting on " " is important, so we don't
+    # get rid of Unicode non-breaking spaces in the vectors.
+    invalid = np.flatnonzero((num_entries != 1) & (num_entries != dim))
+    if len(invalid) > 0:
+        i = invalid[0]
+        raise RuntimeError(
+            "Vector for token {} has {} dimensions, but previously "
+            "read vectors have {} dimensions. All vectors must have "
+            "the same number of dimensions.".format(raw_words[i], num_entries[i], dim))
+
+    try:
+        words = b'\n'.join(raw_words).decode('utf-8').split('\n') if raw_words else []
+        non_utf8 = []
+    except UnicodeDecodeError:
+        words, non_utf8 = [], []
+        for i, word in enumerate(raw_words):
+            try:
+                words.append(word.decode('utf-8'))
+            except UnicodeDecodeError:
+                words.append(None)
+                non_utf8.append(i)
+
+    skipped = sorted(set(np.flatnonzero(num_entries == 1).tolist()) | set(non_utf8))
+    messages = []
+    for i in skipped:
+        if num_entries[i] == 1:
+            rest = block[starts[i]:ends[i]].rstrip().partition(b' ')[2]
+            messages.append((logging.WARNING, "Skipping token {} with 1-dimensional "
+                                              "vector {}; likely a header".format(raw_words[i], [rest])))
+        else:
+            messages.append((logging.INFO, "Skipping non-UTF8 token {}".format(repr(raw_words[i]))))
+
+    if skipped:
+        # cut the few skipped lines out of the block
+        pieces, position = [], 0
+        for i in skipped:
+            pieces.append(block[position:starts[i]])
+            position = ends[i] + 1
+        pieces.append(block[position:])
+        block = b''.join(pieces)
+        skipped = set(skipped)
+        words = [w for i, w in enumerate(words) if i not in skipped]
+
+    vectors = np.fromstring(_TOKEN_PATTERN.sub(b'', block), dtype=np.float32, sep=' ')
+    if vectors.size != len(words) * dim:
+        # malformed numbers or repeated separators: parse row by row so the
+        # offending value raises exactly as float() does
+        rests = [line.rstrip().partition(b' ')[2] for line in block.split(b'\n')[:-1]]
+        vectors = np.array([[float(x) for x in rest.split(b' ')] for rest in rests],
+                           dtype=np.float32)
+    return words, vectors.reshape(len(words), dim), messages
+
+
+def _parse_vector_blocks(blocks, dim, num_workers):
+    """Parse blocks in order, optionally spreading them over a process pool.
+
+    At most two blocks per worker are in flight, so memory stays bounded by
+    the block size no matter how large the vector file is.
+    """
+    if num_workers <= 1:
+        for block in blocks:
+            yield _parse_vector_block(block, dim)
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        try:
+            for block in blocks:
+                pending.append(executor.submit(_parse_vector_block, block, dim))
+                if len(pending) >= 2 * num_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _gather_rows(matrix, indices):
+    """Read the given rows of a (memory mapped) matrix as a FloatTensor.
+
+    The indices are sorted before reading so that the rows are fetched from
+    disk in file order; the result keeps the order of `indices`.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    order = np.argsort(indices, kind='mergesort')
+    rows = np.empty((len(indices), matrix.shape[1]), dtype=np.float32)
+    rows[order] = matrix[indices[order]]
+    return torch.from_numpy(rows)
+
+
+def _lookup_rows(stoi, vectors, tokens, dim, unk_init):
+    """Look up the rows of `tokens` in `vectors`.
+
+    The rows of all known tokens are read with one indexed gather and
+    `unk_init` is called once for a `[num_unknown, dim]` tensor that fills
+    the rows of the unknown tokens.
+    """
+    indices = np.fromiter((stoi.get(token, -1) for token in tokens), dtype=np.int64, count=len(tokens))
+    known = np.flatnonzero(indices >= 0)
+    missing = np.flatnonzero(indices < 0)
+
+    result = torch.Tensor(len(tokens), dim)
+    if len(known) > 0:
+        if isinstance(vectors, np.ndarray):
+            rows = _gather_rows(vectors, indices[known])
+        elif isinstance(vectors, torch.Tensor):
+            rows = vectors[torch.from_numpy(indices[known])]
+        else:
+            rows = torch.stack([torch.as_tensor(vectors[i]) for i in indices[known].tolist()])
+        result[torch.from_numpy(known)] = rows
+    if len(missing) > 0:
+        result[torch.from_numpy(missing)] = unk_init(torch.Tensor(len(missing), dim))
+    return result
+
+
+class VectorStore(object):
+    """Binary on-disk store for pretrained word vectors.
+
+    The vectors are kept as one contiguous float32 or float16 `.npy` matrix
+    which is opened with `numpy.memmap`, so only the rows that are looked up
+    are ever read from disk. The tokens are stored in a utf-8 index file with
+    one token per line; line `i` is the token of row `i`.
+    """
+
+    dtypes = ('float32', 'float16')
+
+    def __init__(self, path, dtype='float32'):
+        """
+        Arguments:
+            path: path prefix of the store. The matrix is written to
+                `path + '.npy'` and the token index to `path + '.itos'`.
+            dtype: dtype of the stored matrix, either 'float32' or 'float16'.
+        """
+        if dtype not in self.dtypes:
+            raise ValueError("Got vector store dtype {}, allowed dtypes "
+                             "are {}".format(dtype, self.dtypes))
+        self.dtype = dtype
+        self.matrix_path = path + '.npy'
+        self.index_path = path + '.itos'
+
+    def exists(self):
+        # the index is written last so its presence marks a complete store
+        return os.path.isfile(self.matrix_path) and os.path.isfile(self.index_path)
+
+    def create(self, num_rows, dim):
+        """Create a writable, memory mapped matrix with room for `num_rows` vectors.
+
+        The matrix is written to a temporary file which is moved into place by
+        `finalize`, so an interrupted conversion never leaves a broken store.
+        """
+        directory = os.path.dirname(self.matrix_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        return np.lib.format.open_memmap(self.matrix_path + '.tmp', mode='w+',
+                                         dtype=self.dtype, shape=(num_rows, dim))
+
+    def finalize(self, matrix, itos):
+        """Flush a matrix returned by `create` and write the token index.
+
+        `matrix` may contain more rows than `itos`; only the first `len(itos)`
+        rows are used when the store is loaded.
+        """
+        matrix.flush()
+        del matrix
+        os.replace(self.matrix_path + '.tmp', self.matrix_path)
+        # newline='\n' so that the index is read back without '\r' on windows
+        with open(self.index_path + '.tmp', 'w', encoding='utf-8', newline='\n') as f:
+            for token in itos:
+                f.write(token)
+                f.write('\n')
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def save(self, itos, vectors):
+        """Write an in-memory (torch or numpy) matrix to the store."""
+        if isinstance(vectors, torch.Tensor):
+            vectors = vectors.numpy()
+        matrix = self.create(len(itos), vectors.shape[1])
+        matrix[:] = vectors[:len(itos)]
+        self.finalize(matrix, itos)
+
+    def load(self):
+        """Open the store.
+
+        Returns:
+            A tuple `(itos, matrix)` where `matrix` is a read-only
+            `numpy.memmap` of shape `[len(itos), dim]`.
+        """
+        with open(self.index_path, 'r', encoding='utf-8', newline='\n') as f:
+            itos = f.read().split('\n')[:-1]
+        matrix = np.load(self.matrix_path, mmap_mode='r')
+        return itos, matrix[:len(itos)]
+
+
 class Vectors(object):
 
     def __init__(self, name, cache=None,
-                 url=None, unk_init=None, max_vectors=None):
+                 url=None, unk_init=None, max_vectors=None, dtype='float32',
+                 num_workers=None, block_size=32 * 1024 * 1024):
         """
         Arguments:
            name: name of the file that contains the vectors
@@ -270,38 +521,62 @@ class Vectors(object):
                Thus, in situations where the entire set doesn't fit in memory,
                or is not needed for another reason, passing `max_vectors`
                can limit the size of the loaded set.
+           dtype: dtype of the binary vector store, 'float32' or 'float16'.
+               Lookups always return float32 tensors.
+           num_workers (int): number of processes used to parse the text file
+               when the binary store is built. Default: number of CPUs, at most 4.
+           block_size (int): number of bytes that are parsed at once.
          """
         cache = '.vector_cache' if cache is None else cache
         self.itos = None
         self.stoi = None
         self.vectors = None
         self.dim = None
+        self.dtype = dtype
+        self.num_workers = min(4, os.cpu_count() or 1) if num_workers is None else num_workers
+        self.block_size = block_size
         self.unk_init = torch.Tensor.zero_ if unk_init is None else unk_init
         self.cache(name, cache, url=url, max_vectors=max_vectors)
 
     def __getitem__(self, token):
         if token in self.stoi:
-            return self.vectors[self.stoi[token]]
+            return torch.from_numpy(np.array(self.vectors[self.stoi[token]], dtype=np.float32))
         else:
             return self.unk_init(torch.Tensor(self.dim))
 
+    def vectors_for(self, tokens):
+        """Look up the vectors of several tokens at once.
+
+        Arguments:
+            tokens: list of token strings.
+        Returns:
+            FloatTensor of shape `[len(tokens), dim]`. Unknown tokens are
+            initialized with `unk_init`.
+        """
+        return _lookup_rows(self.stoi, self.vectors, tokens, self.dim, self.unk_init)
+
     def cache(self, name, cache, url=None, max_vectors=None):
         if os.path.isfile(name):
             path = name
-            if max_vectors:
-                file_suffix = '_{}.pt'.format(max_vectors)
-            else:
-                file_suffix = '.pt'
-            path_pt = os.path.join(cache, os.path.basename(name)) + file_suffix
+            path_cache = os.path.join(cache, os.path.basename(name))
         else:
             path = os.path.join(cache, name)
-            if max_vectors:
-                file_suffix = '_{}.pt'.format(max_vectors)
-            else:
-                file_suffix = '.pt'
-            path_pt = path + file_suffix
-
-        if not os.path.isfile(path_pt):
+            path_cache = path
+        if max_vectors:
+            path_cache += '_{}'.format(max_vectors)
+        path_pt = path_cache + '.pt'
+        if self.dtype != 'float32':
+            path_cache += '.{}'.format(self.dtype)
+        store = VectorStore(path_cache, self.dtype)
+
+        if store.exists():
+            logger.info('Loading vectors from {}'.format(store.matrix_path))
+        elif os.path.isfile(path_pt):
+            # convert caches of earlier versions to the binary store once
+            logger.info('Converting vectors from {} to {}'.format(path_pt, store.matrix_path))
+            itos, _, vectors, _ = torch.load(path_pt)
+            store.save(itos, vectors)
+        else:
             if not os.path.isfile(path) and url:
                 logger.info('Downloading vectors from {}'.format(url))
                 if not os.path.exists(cache):
@@ -339,52 +614,95 @@ class Vectors(object):
                 if not max_vectors or max_vectors > num_lines:
                     max_vectors = num_lines
 
-                itos, vectors, dim = [], torch.zeros((max_vectors, dim)), None
-
-                for line in tqdm(f, total=num_lines):
-                    # Explicitly splitting on " " is important, so we don't
-                    # get rid of Unicode non-breaking spaces in the vectors.
-                    entries = line.rstrip().split(b" ")
-
-                    word, entries = entries[0], entries[1:]
-                    if dim is None and len(entries) > 1:
-                        dim = len(entries)
-                    elif len(entries) == 1:
-                        logger.warning("Skipping token {} with 1-dimensional "
-                                       "vector {}; likely a header".format(word, entries))
-                        continue
-                    elif dim != len(entries):
-                        raise RuntimeError(
-                            "Vector for token {} has {} dimensions, but previously "
-                            "read vectors have {} dimensions. All vectors must have "
-                            "the same number of dimensions.".format(word, len(entries),
-                                                                    dim))
-
-                    try:
-                        if isinstance(word, six.binary_type):
-                            word = word.decode('utf-8')
-                    except UnicodeDecodeError:
-                        logger.info("Skipping non-UTF8 token {}".format(repr(word)))
-                        continue
-
-                    vectors[vectors_loaded] = torch.tensor([float(x) for x in entries])
-                    vectors_loaded += 1
-                    itos.append(word)
-
-                    if vectors_loaded == max_vectors:
-                        break
-
-            self.itos = itos
-            self.stoi = {word: i for i, word in enumerate(itos)}
-            self.vectors = torch.Tensor(vectors).view(-1, dim)
-            self.dim = dim
-            logger.info('Saving vectors to {}'.format(path_pt))
-            if not os.path.exists(cache):
-                os.makedirs(cache)
-            torch.save((self.itos, self.stoi, self.vectors, self.dim), path_pt)
+                itos, vectors = [], store.create(max_vectors, dim)
+
+                blocks = _read_blocks(f, self.block_size)
+                with tqdm(total=num_lines) as progress:
+                    for words, block_vectors, messages in _parse_vector_blocks(blocks, dim, self.num_workers):
+                        for level, message in messages:
+                            logger.log(level, message)
+                        progress.update(len(words) + len(messages))
+
+                        words = words[:max_vectors - vectors_loaded]
+                        vectors[vectors_loaded:vectors_loaded + len(words)] = block_vectors[:len(words)]
+                        vectors_loaded += len(words)
+                        itos.extend(words)
+
+                        if vectors_loaded == max_vectors:
+                            break
+
+            logger.info('Saving vectors to {}'.format(store.matrix_path))
+            store.finalize(vectors, itos)
+
+        self.itos, self.vectors = store.load()
+        self.stoi = {word: i for i, word in enumerate(self.itos)}
+        self.dim = self.vectors.shape[1]
+
+
+class VocabFilteredVectors(Vectors):
+    """Pretrained vectors restricted to the vocabulary of a dataset.
+
+    The first `vectors_for` call with a given token list stores only the
+    rows of those tokens in `<cache>/vocab`, keyed by a hash of the tokens,
+    the vector name and the dimension. Later runs with the same vocabulary
+    read this small store and never open the full vector set.
+    """
+
+    def __init__(self, vectors_factory, name, dim, cache=None, unk_init=None):
+        """
+        Arguments:
+            vectors_factory: callable without arguments that returns the full
+                Vectors object. It is only called on a cache miss.
+            name: name of the vector set, e.g. 'glove.840B'.
+            dim: dimension of the vectors.
+            cache: directory for cached vectors. Default: '.vector_cache'
+            unk_init (callback): initialization of out-of-vocabulary vectors.
+        """
+        cache = '.vector_cache' if cache is None else cache
+        self.vectors_factory = vectors_factory
+        self.name = name
+        self.dim = int(dim)
+        self.cache_dir = os.path.join(cache, 'vocab')
+        self.unk_init = torch.Tensor.zero_ if unk_init is None else unk_init
+        self.itos = None
+        self.stoi = None
+        self.vectors = None
+        self.dtype = 'float32'
+        self._source = None
+
+    @property
+    def source(self):
+        if self._source is None:
+            self._source = self.vectors_factory()
+            if self._source.dim != self.dim:
+                raise RuntimeError('Expected {}-dimensional vectors for {} but got {} '
+                                   'dimensions.'.format(self.dim, self.name, self._source.dim))
+        return self._source
+
+    def __getitem__(self, token):
+        return self.source[token]
+
+    def _store_path(self, tokens):
+        key = hashlib.sha1('{}\n{}\n'.format(self.name, self.dim).encode('utf-8'))
+        for token in tokens:
+            key.update(token.encode('utf-8'))
+            key.update(b'\n')
+        return os.path.join(self.cache_dir, '{}.{}d_{}'.format(self.name, self.dim, key.hexdigest()))
+
+    def vectors_for(self, tokens):
+        store = VectorStore(self._store_path(tokens))
+        if store.exists():
+            logger.info('Loading vocabulary vectors from {}'.format(store.matrix_path))
         else:
-            logger.info('Loading vectors from {}'.format(path_pt))
-            self.itos, self.stoi, self.vectors, self.dim = torch.load(path_pt)
+            logger.info('No vocabulary vectors at {}. Extracting them from {}'.format(
+                store.matrix_path, self.name))
+            source = self.source
+            known = [token for token in dict.fromkeys(tokens) if token in source.stoi]
+            store.save(known, _gather_rows(source.vectors, [source.stoi[t] for t in known]))
+
+        self.itos, self.vectors = store.load()
+        self.stoi = {word: i for i, word in enumerate(self.itos)}
+        return super(VocabFilteredVectors, self).vectors_for(tokens)
 
 
 class GloVe(Vectors):
@@ -434,7 +752,7 @@ class CharNGram(Vectors):
             for gram in grams:
                 gram_key = '{}gram-{}'.format(n, ''.join(gram))
                 if gram_key in self.stoi:
-                    vector += self.vectors[self.stoi[gram_key]]
+                    vector += torch.from_numpy(np.array(self.vectors[self.stoi[gram_key]], dtype=np.float32))
                     num_vectors += 1
         if num_vectors > 0:
             vector /= num_vectors
@@ -442,6 +760,10 @@ class CharNGram(Vectors):
             vector = self.unk_init(vector)
         return vector
 
+    def vectors_for(self, tokens):
+        # n-gram vectors are averaged per token and cannot be gathered by row
+        return torch.cat([self[token] for token in tokens], dim=0)
+
 
 def _default_unk_index():
     return 0
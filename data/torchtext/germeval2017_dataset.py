@@ -13,6 +13,8 @@ from tqdm import tqdm
 
 from misc.utils import create_dir_if_necessary, check_if_file_exists
 from data.torchtext.custom_datasets import *
+from data.torchtext.columnar_cache import cache_version
+from data.torchtext.text_normalizer import TextNormalizer, GERMEVAL_PROFILE
 
 def add_tr_prefixes(path:str, sp=False) -> str:
 	fn = path.split('.')
@@ -22,7 +24,7 @@ def add_tr_prefixes(path:str, sp=False) -> str:
 
 	return '.'.join(fn)
 
-class GermEval2017Dataset(Dataset):
+class GermEval2017Dataset(CachedDataset):
 
 	@staticmethod
 	def sort_key(example):
@@ -79,14 +81,16 @@ class GermEval2017Dataset(Dataset):
 		self.stats = defaultdict(get_stats_dd)
 		self.na_labels = 0
 		self.hp = None
+		self.dataset_name = 'germeval2017'
 
 		# first, try to load all models from cache
 		filename = path.split("\\")[-1]
-		examples, loaded_fields = self._try_load(filename.split(".")[0], fields)
+		version = cache_version(kwargs.get('hp'), path)
+		examples, loaded_fields = self._try_load(filename.split(".")[0], fields, version)
 
 		if not examples:
 			examples, fields = self._load(path, filename, fields, a_sentiment, separator, **kwargs)
-			self._save(filename.split(".")[0], examples)
+			self._save(filename.split(".")[0], examples, version)
 		else:
 			fields = loaded_fields
 			
@@ -129,6 +133,7 @@ class GermEval2017Dataset(Dataset):
 		# 25: aspect Sentiment 20/20
 
 		spell = None
+		normalizer = TextNormalizer(hp, GERMEVAL_PROFILE)
 
 		with open(path, encoding="utf8") as input_file:
 			aspect_sentiment_categories = set()
@@ -190,39 +195,8 @@ class GermEval2017Dataset(Dataset):
 				# remove punctuation and clean text
 				comment = columns[1]
 
-				# remove » and fix encoding issues
-				comment = comment.replace('»', ' ')
-				comment = comment.replace("ã¼", 'ü')
-				comment = comment.replace("ã¤", "ä")
-				comment = comment.replace("ø", "ö")
-				comment = comment.replace("ű", "ü")
-				comment = comment.replace("..", " ")
-
-
-				# replace urls with regex
-				comment = replace_urls_regex(comment)
-
-
-				# remove non ascii characters with empty space
-				# comment = re.sub(r'[^\x00-\x7f]',r' ', comment)
-				#comment = unidecode(str(comment))
-				
-				# remove any non-word characters with empty space
-				comment = re.sub(r'[^\w\säöüß]', r' ', comment)
-
-				comment = comment.split(' ')
-
-				# remove all empty entries
-				comment = [w for w in comment if w.strip() != '']
-
-				if hp.harmonize_bahn:
-					comment = harmonize_bahn_names(comment)
-
-				if hp.replace_url_tokens:
-					comment = replace_urls(comment)
-
-				comment = ' '.join(comment)
-				#comment = comment.translate(punctuation_remover)
+				# fix encoding issues, replace urls and remove non-word characters
+				comment = normalizer(comment)
 
 				columns[1] = comment
 
@@ -234,7 +208,7 @@ class GermEval2017Dataset(Dataset):
 				# add aspect sentiment field
 				columns.append('')
 
-				# add padding field
+				# add length field
 				columns.append('')
 				raw_examples.append(columns)
 
@@ -282,7 +256,7 @@ class GermEval2017Dataset(Dataset):
 				example.comments = example.comments[0:hp.clip_comments_to]
 				comment_length = hp.clip_comments_to
 
-			example.padding = ['0'] * comment_length
+			example.lengths = comment_length
 		return examples, fields
 		
 	def _construct_fields(self, fields):
@@ -299,63 +273,3 @@ class GermEval2017Dataset(Dataset):
 				self.aspect_sentiment_fields.append((s_cat, f))
 				fields.append((s_cat, f))
 		return fields
-
-	def _try_load(self, name, fields):
-		path = os.path.join(os.getcwd(), 'data', 'data', 'cache')
-		create_dir_if_necessary(path)
-		samples_path = os.path.join(path, name + "2.pkl")
-		aspects_path = os.path.join(path, name + "_2aspects.pkl")
-
-		if not check_if_file_exists(samples_path) or not check_if_file_exists(aspects_path):
-			return [], None
-
-		with open(samples_path, 'rb') as f:
-			examples = pickle.load(f)
-
-		with open(aspects_path, 'rb') as f:
-			self.aspects = pickle.load(f)
-
-		# get all fields
-		fields = self._construct_fields(fields)
-		return examples, fields
-
-	def _save(self, name, samples):
-		path = os.path.join(os.getcwd(), 'data', 'data', 'cache')
-		create_dir_if_necessary(path)
-		samples_path = os.path.join(path, name + ".pkl")
-		aspects_path = os.path.join(path, name + "_aspects.pkl")
-
-		# print(f'Trying to save loaded dataset to {samples_path}.')
-		with open(samples_path, 'wb') as f:
-			pickle.dump(samples, f)
-			# print(f'Model {name} successfully saved.')
-
-		with open(aspects_path, "wb") as f:
-			pickle.dump(self.aspects, f)
-
-
-def harmonize_bahn_names(text_tokens: List[str]) -> List[str]:
-	bahn_syn = [
-		'db',
-		'deutschebahn',
-		"db_bahn",
-		"bahn.de",
-		"@db_bahn",
-		"#db",
-		"@db",
-		"#db_bahn",
-		"@bahn",
-		"#bahn",
-		"@dbbahn",
-		"#dbbahn",
-		"#dbbahn"
-		"www.bahn.de",
-		"dbbahn"
-	]
-	result = []
-	for token in text_tokens:
-		if token.lower() in bahn_syn:
-			result.append('db')
-		else:
-			result.append(token)
-	return result
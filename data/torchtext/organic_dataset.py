@@ -4,6 +4,8 @@ import string
 from typing import Dict, List, Tuple, Union
 import pickle
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import torchtext.data as data
 from data.torchtext.custom_fields import ReversibleField
@@ -14,6 +16,8 @@ import spacy
 
 from misc.utils import create_dir_if_necessary, check_if_file_exists
 from data.torchtext.custom_datasets import *
+from data.torchtext.columnar_cache import cache_version
+from data.torchtext.text_normalizer import TextNormalizer, ORGANIC_PROFILE
 
 
 def add_tr_prefixes(path:str, sp=False) -> str:
@@ -140,7 +144,7 @@ def get_all_mapping():
 
 
 
-class OrganicDataset(Dataset):
+class OrganicDataset(CachedDataset):
 
 	@staticmethod
 	def sort_key(example):
@@ -220,11 +224,12 @@ class OrganicDataset(Dataset):
 		_, filename = os.path.split(path)
 		filename = f'{filename.split(".")[0]}_{task}'
 
-		examples, loaded_fields = self._try_load(filename, fields)
+		version = cache_version(hp, path, task)
+		examples, loaded_fields = self._try_load(filename, fields, version)
 
 		if not examples:
 			examples, fields = self._load(path, filename, fields, a_sentiment, separator, task=task, hp=hp, **kwargs)
-			self._save(filename, examples)
+			self._save(filename, examples, version)
 		else:
 			fields = loaded_fields
 			
@@ -270,8 +275,11 @@ class OrganicDataset(Dataset):
 			organic_text_cleaning_dict = get_organic_words_replacement()
 		else:
 			organic_text_cleaning_dict = {}
+		normalizer = TextNormalizer(hp, ORGANIC_PROFILE, organic_text_cleaning_dict)
 
-		spell = None
+		# runs with use_spell_checkers load the prespellchecked _sp files. The raw texts are only corrected
+		# on load (in one batch over the unknown tokens of the whole file) if this is requested explicitly
+		spell = self.initialize_spellchecker(hp.language) if hp.spell_correction_on_load else None
 
 		if task.startswith(ORGANIC_TASK_ALL):
 			aspect_example_index = -1
@@ -286,28 +294,18 @@ class OrganicDataset(Dataset):
 			aspect_example_index = -1
 			mapping = create_coarse_organic_mapping()
 
+		# first pass: split and filter the rows and group them into chunks of whole comments
+		rows = []
 		with open(path, 'rb') as input_file:
-			aspect_sentiment_categories = set()
-			aspect_sentiments: List[Dict[str, str]] = []
-
-			raw_examples: List[List[Union[str, List[Dict[str, str]]]]] = []
-
 			if verbose:
 				iterator = tqdm(input_file, desc=f'Load {filename[0:7]}', leave=False, total=length)
 			else:
 				iterator = input_file
 
-			last_sentence_number = None
-			last_comment_number = None
-			last_sample = None
-
 			# skip the first line
 			skip_line = True
-
-			comments = {}
 			for line in iterator:
 				line = line.decode(errors='ignore')
-				columns = []
 				line = line.strip()
 				if skip_line or line == '':
 					skip_line = False
@@ -321,78 +319,50 @@ class OrganicDataset(Dataset):
 				if columns[4] == '0' or columns[-1] == 'nan-nan':
 					# skip for now
 					continue
-
-				# aspect sentiment is missing
-				if len(columns) == 11:
-					columns.append('')
-					columns.append(dict())
-					last_sample = columns
-				else:
-					# based on aspect task select columns
-					aspect_category = columns[aspect_example_index].strip()
-					aspect_category = aspect_category.replace(';', '').replace('"', '')
-
-					# use mapping to get a more human readable name
-					aspect_category = mapping[aspect_category]
-					
-					s_k = columns[5].strip()
-					if s_k != '':
-						aspect_sentiment = od_sentiment_mapping[columns[5].strip()]	
-						self.stats[aspect_category][aspect_sentiment] += 1
-	
-
-					crnt_sentence_number = columns[3]
-					crnt_comment_number = columns[2]
-					# if last_sentence_number and last_comment are set and equal this means we need to add to the sentiment dict
-					# otherwise we add the last sample and move on
-					
-					# case 1: not set 
-					#	-> first comment
-					if last_sentence_number is None or last_comment_number is None:
-						last_sentence_number = crnt_sentence_number
-						last_comment_number = crnt_comment_number
-						comment_sentiment_dict = dict()
-						last_sample = columns
-
-
-					# case 2: last and current do not numbers match
-					# new sample -> add to new dict
-					elif last_sentence_number != crnt_sentence_number or last_comment_number != crnt_comment_number:
-						# add last sample
-						# add all new potential keys to set
-						for s_category in comment_sentiment_dict.keys():
-							aspect_sentiment_categories.add(s_category)
-						last_sample.append(comment_sentiment_dict) 
-
-						comment_sentiment_dict = dict()
-						last_sentence_number = crnt_sentence_number
-						last_comment_number = crnt_comment_number
-
-						if crnt_comment_number not in comments:
-							comments[crnt_comment_number] = []
-
-						comments[crnt_comment_number].append(last_sample)
-						
-						last_sample = columns
-
-					# case 3: last and current match
-					# 		-> add to last sample
-					elif last_sentence_number == crnt_sentence_number and last_comment_number == crnt_comment_number:
-						if aspect_category != '':
-							comment_sentiment_dict[aspect_category] = aspect_sentiment
-						continue	
-
-					if aspect_category != '':
-						comment_sentiment_dict[aspect_category] = aspect_sentiment
-					
-				# remove punctuation and clean text
-				last_sample = self.process_comment_text(last_sample, hp, organic_text_cleaning_dict, spell)
-				
-				# add aspect sentiment field
-				last_sample.append('')
-
-				# add padding field
-				last_sample.append('')
+				rows.append(columns)
+
+		num_chunks = hp.preprocessing_workers * 4 if hp.preprocessing_workers > 0 else 1
+		chunks, previous_numbers = group_comment_rows(rows, num_chunks)
+
+		# second pass: assemble the samples and clean their texts. If the texts are spell corrected, the samples
+		# only contain the normalized tokens which are corrected in one batch afterwards
+		assemble = partial(assemble_samples, mapping=mapping, aspect_example_index=aspect_example_index,
+							normalizer=normalizer, tokens_only=spell is not None)
+		if hp.preprocessing_workers > 0:
+			# a few large chunks per worker keep the inter-process overhead low
+			with ProcessPoolExecutor(max_workers=hp.preprocessing_workers) as executor:
+				results = list(executor.map(assemble, chunks, previous_numbers))
+		else:
+			results = [assemble(chunk, previous) for chunk, previous in zip(chunks, previous_numbers)]
+
+		# merge the chunks in file order
+		comments = {}
+		aspect_sentiment_categories = set()
+		pending_samples = []
+		last_sample, comment_sentiment_dict = None, dict()
+		for appended_samples, chunk_pending, chunk_stats, chunk_categories, tail in results:
+			for comment_number, sample in appended_samples:
+				# the last sample of the previous chunk is completed by the first row of this chunk
+				if sample is None:
+					aspect_sentiment_categories.update(comment_sentiment_dict.keys())
+					last_sample.append(comment_sentiment_dict)
+					sample = last_sample
+
+				if comment_number not in comments:
+					comments[comment_number] = []
+				comments[comment_number].append(sample)
+
+			for aspect_category, counts in chunk_stats.items():
+				for aspect_sentiment, count in counts.items():
+					self.stats[aspect_category][aspect_sentiment] += count
+			aspect_sentiment_categories.update(chunk_categories)
+			pending_samples.extend(chunk_pending)
+			last_sample, comment_sentiment_dict = tail
+
+		if len(pending_samples) > 0:
+			corrected = self.correct_spellings([tokens for _, tokens in pending_samples], spell, hp.language, hp.preprocessing_workers)
+			for (sample, _), comment in zip(pending_samples, corrected):
+				sample[10] = normalizer.join(comment)
 
 		# convert the comment dictionary to raw example list
 		raw_examples = self.convert_to_raw_examples(comments, hp)
@@ -445,38 +415,9 @@ class OrganicDataset(Dataset):
 				example.comments = example.comments[:hp.clip_comments_to]
 				comment_length = len(example.comments)
 
-			example.padding = ['0'] * comment_length
+			example.lengths = comment_length
 		return examples, fields
 
-	def process_comment_text(self, sample, hp, organic_text_cleaning_dict, spell):
-		# remove punctuation and clean text
-		comment = sample[-4]
-		comment = comment.translate(punctuation_remover)
-
-		# remove non ascii characters with empty space
-		comment = re.sub(r'[^\x00-\x7f]',r' ', comment)
-		
-		if hp.contraction_removal:
-			comment = en_contraction_removal(comment)
-
-		comment = comment.split(' ')
-
-		if hp.replace_url_tokens:
-			comment = replace_urls(comment)
-
-		if hp.organic_text_cleaning:
-			comment = fix_organic_spelling(comment, organic_text_cleaning_dict)
-
-		if hp.use_spell_checkers and spell is not None:
-			comment = self.fix_spellings(comment, spell)
-
-		comment = ' '.join(comment)
-		if hp.use_text_cleaner:
-			comment = text_cleaner(comment, hp.language)
-
-		sample[10] = comment
-		return sample
-
 	def convert_to_raw_examples(self, comments, hp):
 		raise NotImplementedError()
 		
@@ -495,39 +436,6 @@ class OrganicDataset(Dataset):
 				fields.append((s_cat, f))
 		return fields
 
-	def _try_load(self, name, fields):
-		path = os.path.join(os.getcwd(), 'data', 'data', 'cache', self.dataset_name)
-		create_dir_if_necessary(path)
-		samples_path = os.path.join(path, name + "2.pkl")
-		aspects_path = os.path.join(path, name + "_2aspects.pkl")
-
-		if not check_if_file_exists(samples_path) or not check_if_file_exists(aspects_path):
-			return [], None
-
-		with open(samples_path, 'rb') as f:
-			examples = pickle.load(f)
-
-		with open(aspects_path, 'rb') as f:
-			self.aspects = pickle.load(f)
-
-		# get all fields
-		fields = self._construct_fields(fields)
-		return examples, fields
-
-	def _save(self, name, samples):
-		path = os.path.join(os.getcwd(), 'data', 'data', 'cache', self.dataset_name)
-		create_dir_if_necessary(path)
-		samples_path = os.path.join(path, name + ".pkl")
-		aspects_path = os.path.join(path, name + "_aspects.pkl")
-
-		# print(f'Trying to save loaded dataset to {samples_path}.')
-		with open(samples_path, 'wb') as f:
-			pickle.dump(samples, f)
-			# print(f'Model {name} successfully saved.')
-
-		with open(aspects_path, "wb") as f:
-			pickle.dump(self.aspects, f) 
-
 
 class SingleSentenceOrganicDataset(OrganicDataset):
 
@@ -576,6 +484,142 @@ class DoubleSentenceOrganicDataset(OrganicDataset):
 		return raw_examples
 		
 
+def group_comment_rows(rows: List[List[str]], num_chunks: int) -> Tuple[List[List[List[str]]], List[Tuple[str, str]]]:
+	"""Splits the rows of an organic file into about num_chunks chunks of whole comments.
+
+	A chunk only starts at a sentence with a sentiment whose previous row is a complete sample of another
+	comment. assemble_samples can then continue the sample assembly of the previous chunk from the sentence
+	and comment number of that row.
+
+	Arguments:
+		rows {List[List[str]]} -- columns of the relevant rows in file order
+		num_chunks {int} -- requested number of chunks
+
+	Returns:
+		Tuple[List[List[List[str]]], List[Tuple[str, str]]] -- chunks and the (sentence number, comment number)
+			of the row before each chunk
+	"""
+	chunksize = max(1, len(rows) // num_chunks)
+	chunks = []
+	previous_numbers = []
+	start = 0
+	for i in range(1, len(rows)):
+		if i - start < chunksize:
+			continue
+
+		previous, row = rows[i - 1], rows[i]
+		if len(previous) != 11 and len(row) != 11 and previous[2] != row[2] and row[5].strip() != '':
+			chunks.append(rows[start:i])
+			previous_numbers.append((None, None) if start == 0 else (rows[start - 1][3], rows[start - 1][2]))
+			start = i
+
+	chunks.append(rows[start:])
+	previous_numbers.append((None, None) if start == 0 else (rows[start - 1][3], rows[start - 1][2]))
+	return chunks, previous_numbers
+
+def assemble_samples(rows: List[List[str]], previous: Tuple[str, str], mapping: Dict[str, str], aspect_example_index: int,
+						normalizer: TextNormalizer, tokens_only: bool = False):
+	"""Assembles the sentence samples of a chunk of rows (see group_comment_rows) and cleans their texts.
+
+	Samples are added to the comment of the row that completes them. The first sample of a chunk that is not
+	the first one is the last sample of the previous chunk and is returned as None.
+
+	Arguments:
+		rows {List[List[str]]} -- columns of the rows of the chunk
+		previous {Tuple[str, str]} -- sentence and comment number of the row before the chunk or (None, None)
+		mapping {Dict[str, str]} -- aspect mapping of the task
+		aspect_example_index {int} -- column of the aspect
+		normalizer {TextNormalizer} -- organic text normalizer
+
+	Keyword Arguments:
+		tokens_only {bool} -- only normalize the texts to tokens that are returned for spell correction (default: {False})
+
+	Returns:
+		Tuple -- (comment number, sample) pairs in order, (sample, tokens) pairs for spell correction, stats,
+			aspect categories and the last (incomplete) sample with its aspect sentiments
+	"""
+	appended_samples = []
+	pending_samples = []
+	stats = defaultdict(get_stats_dd)
+	aspect_sentiment_categories = set()
+
+	last_sentence_number, last_comment_number = previous
+	last_sample = None
+	comment_sentiment_dict = dict()
+	for columns in rows:
+		# aspect sentiment is missing
+		if len(columns) == 11:
+			columns.append('')
+			columns.append(dict())
+			last_sample = columns
+		else:
+			# based on aspect task select columns
+			aspect_category = columns[aspect_example_index].strip()
+			aspect_category = aspect_category.replace(';', '').replace('"', '')
+
+			# use mapping to get a more human readable name
+			aspect_category = mapping[aspect_category]
+
+			s_k = columns[5].strip()
+			if s_k != '':
+				aspect_sentiment = od_sentiment_mapping[columns[5].strip()]
+				stats[aspect_category][aspect_sentiment] += 1
+
+			crnt_sentence_number = columns[3]
+			crnt_comment_number = columns[2]
+			# if last_sentence_number and last_comment are set and equal this means we need to add to the sentiment dict
+			# otherwise we add the last sample and move on
+
+			# case 1: not set
+			#	-> first comment
+			if last_sentence_number is None or last_comment_number is None:
+				last_sentence_number = crnt_sentence_number
+				last_comment_number = crnt_comment_number
+				comment_sentiment_dict = dict()
+				last_sample = columns
+
+			# case 2: last and current do not numbers match
+			# new sample -> add to new dict
+			elif last_sentence_number != crnt_sentence_number or last_comment_number != crnt_comment_number:
+				# add last sample. It is completed by the caller if it belongs to the previous chunk
+				if last_sample is not None:
+					# add all new potential keys to set
+					for s_category in comment_sentiment_dict.keys():
+						aspect_sentiment_categories.add(s_category)
+					last_sample.append(comment_sentiment_dict)
+
+				comment_sentiment_dict = dict()
+				last_sentence_number = crnt_sentence_number
+				last_comment_number = crnt_comment_number
+
+				appended_samples.append((crnt_comment_number, last_sample))
+				last_sample = columns
+
+			# case 3: last and current match
+			# 		-> add to last sample
+			elif last_sentence_number == crnt_sentence_number and last_comment_number == crnt_comment_number:
+				if aspect_category != '':
+					comment_sentiment_dict[aspect_category] = aspect_sentiment
+				continue
+
+			if aspect_category != '':
+				comment_sentiment_dict[aspect_category] = aspect_sentiment
+
+		# remove punctuation and clean text
+		if tokens_only:
+			# spell checking runs once over the unknown tokens of the whole file
+			pending_samples.append((last_sample, normalizer.normalize_tokens(last_sample[-4])))
+		else:
+			last_sample[10] = normalizer(last_sample[-4])
+
+		# add aspect sentiment field
+		last_sample.append('')
+
+		# add length field
+		last_sample.append('')
+
+	return appended_samples, pending_samples, stats, aspect_sentiment_categories, (last_sample, comment_sentiment_dict)
+
 def fix_organic_spelling(text_tokens: List[str], organic_text_cleaning_dict) -> List[str]:
 	for i, w in enumerate(text_tokens):
 		if w == ' ' or w == '':
@@ -0,0 +1,140 @@
+import queue
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import torch
+from torch.utils.data import DataLoader, Dataset as TorchDataset
+
+logger = logging.getLogger(__name__)
+
+BATCH_FIELD_NAMES = ('comments', 'aspect_sentiments', 'lengths')
+
+BatchTensors = Tuple[torch.Tensor, torch.Tensor, Optional[torch.Tensor]]
+
+
+class _MinibatchDataset(TorchDataset):
+	"""The example lists of one epoch. Each item is one batch."""
+
+	def __init__(self, minibatches: List[list]):
+		self.minibatches = minibatches
+
+	def __len__(self):
+		return len(self.minibatches)
+
+	def __getitem__(self, index: int):
+		return self.minibatches[index]
+
+
+class _CollateMinibatch(object):
+	"""Numericalizes the examples of a batch on the cpu like a torchtext Batch.
+	Fields that the dataset does not have (e.g. lengths for CoNLL) produce None."""
+
+	def __init__(self, fields):
+		self.fields = [(name, fields.get(name)) for name in BATCH_FIELD_NAMES]
+
+	def __call__(self, items):
+		# the data loader uses a batch size of 1, so the only item is the example list of the batch
+		examples = items[0]
+		return tuple(None if field is None else field.process([getattr(e, name) for e in examples]) for name, field in self.fields)
+
+
+class BatchTensorIterator(object):
+	"""Yields the (comments, aspect_sentiments, lengths) tensors of the batches of an iterator."""
+
+	def __init__(self, iterator):
+		self.iterator = iterator
+
+	def __len__(self):
+		return len(self.iterator)
+
+	def __iter__(self):
+		for batch in self.iterator:
+			yield batch.comments, batch.aspect_sentiments, getattr(batch, 'lengths', None)
+
+
+class PrefetchLoader(object):
+	"""Prepares the batches of a torchtext iterator in the background.
+
+	The batches of an epoch are created by the iterator as usual (shuffling, bucketing, batch size), but they are
+	numericalized by the worker processes of a torch DataLoader and optionally pinned. A background thread moves up
+	to prefetch_batches of them to the device of the iterator, so that the preparation of the next batches overlaps
+	with the model step.
+
+	Yields the same (comments, aspect_sentiments, lengths) tensors as BatchTensorIterator.
+
+	Arguments:
+		iterator {torchtext.data.Iterator} -- iterator that defines the batches
+
+	Keyword Arguments:
+		num_workers {int} -- number of worker processes. 0 numericalizes in the background thread (default: {0})
+		prefetch_batches {int} -- number of batches that are prepared ahead (default: {2})
+		pin_memory {bool} -- pin the batches so they are copied asynchronously to the gpu (default: {False})
+	"""
+
+	def __init__(self, iterator, num_workers: int = 0, prefetch_batches: int = 2, pin_memory: bool = False):
+		assert prefetch_batches > 0
+		self.iterator = iterator
+		self.num_workers = num_workers
+		self.prefetch_batches = prefetch_batches
+		self.pin_memory = pin_memory
+		self.collate = _CollateMinibatch(iterator.dataset.fields)
+
+	def __len__(self):
+		return len(self.iterator)
+
+	def _minibatches(self) -> List[list]:
+		iterator = self.iterator
+		iterator.init_epoch()
+		minibatches = []
+		for minibatch in iterator.batches:
+			# same order within the batch as the torchtext iterator
+			if iterator.sort_within_batch:
+				if iterator.sort:
+					minibatch.reverse()
+				else:
+					minibatch.sort(key=iterator.sort_key, reverse=True)
+			minibatches.append(minibatch)
+		return minibatches
+
+	def _put(self, batches: queue.Queue, item, stop: threading.Event) -> bool:
+		while not stop.is_set():
+			try:
+				batches.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def _produce(self, loader: DataLoader, batches: queue.Queue, stop: threading.Event):
+		device = self.iterator.device
+		try:
+			for tensors in loader:
+				tensors = tuple(None if t is None else t.to(device, non_blocking=self.pin_memory) for t in tensors)
+				if not self._put(batches, tensors, stop):
+					return
+			self._put(batches, None, stop)
+		except Exception as err:
+			self._put(batches, err, stop)
+
+	def __iter__(self):
+		loader = DataLoader(_MinibatchDataset(self._minibatches()), batch_size=1, shuffle=False,
+			num_workers=self.num_workers, collate_fn=self.collate, pin_memory=self.pin_memory)
+
+		batches = queue.Queue(maxsize=self.prefetch_batches)
+		stop = threading.Event()
+		producer = threading.Thread(target=self._produce, args=(loader, batches, stop), daemon=True)
+		producer.start()
+		try:
+			while True:
+				tensors = batches.get()
+				if tensors is None:
+					break
+				if isinstance(tensors, Exception):
+					raise tensors
+				self.iterator.iterations += 1
+				yield tensors
+		finally:
+			# the consumer might stop early (e.g. early stopping)
+			stop.set()
+			producer.join()
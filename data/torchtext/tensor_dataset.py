@@ -0,0 +1,126 @@
+import logging
+from typing import List, Optional
+
+import torch
+
+from data.torchtext.token_budget_iterator import pack_by_token_budget
+
+logger = logging.getLogger(__name__)
+
+
+class TensorBatch(object):
+	"""Batch of a TensorIterator. Provides the attributes the trainer reads from torchtext batches."""
+
+	def __init__(self, comments: torch.Tensor, aspect_sentiments: torch.Tensor, lengths: torch.Tensor):
+		self.comments = comments
+		self.aspect_sentiments = aspect_sentiments
+		self.lengths = lengths
+		self.batch_size = comments.shape[0]
+
+	def __len__(self):
+		return self.batch_size
+
+
+class TensorizedSplit(object):
+	"""Numericalizes a dataset split once into contiguous tensors.
+
+	comments [num_examples, padded_length], lengths [num_examples] and aspect_sentiments [num_examples, num_aspects].
+	The comments are numericalized with the comment field, so padding, lower casing and the vocabulary are the
+	same as in torchtext batches.
+	"""
+
+	def __init__(self, dataset, device=None):
+		comment_field = dataset.fields['comments']
+		aspect_sentiment_field = dataset.fields['aspect_sentiments']
+
+		comments = []
+		aspect_sentiments = []
+		for example in dataset:
+			comments.append(example.comments)
+			aspect_sentiments.append(example.aspect_sentiments)
+
+		self.comments = comment_field.process(comments).to(device)
+		self.aspect_sentiments = aspect_sentiment_field.process(aspect_sentiments).to(device)
+		self.lengths = torch.tensor([min(len(c), self.comments.shape[1]) for c in comments], dtype=torch.long, device=device)
+		self.num_examples = len(comments)
+
+		# with a fixed length, every batch has the full length
+		self.fix_length = comment_field.fix_length
+
+	def __len__(self):
+		return self.num_examples
+
+	def batch(self, indices: torch.Tensor) -> TensorBatch:
+		lengths = self.lengths[indices]
+		comments = self.comments[indices]
+		if self.fix_length is None:
+			comments = comments[:, :max(1, int(lengths.max()))]
+
+		return TensorBatch(comments, self.aspect_sentiments[indices], lengths)
+
+
+class TensorIterator(object):
+	"""Iterator over a TensorizedSplit. Batches are created by index slicing, no torchtext Batch is constructed.
+
+	Has the parts of the torchtext Iterator interface that the trainer and evaluators use (init_epoch, epoch,
+	batch_size, train, len). With sort_by_length, examples are sorted by length within pools of 100 batches like
+	the BucketIterator. With max_tokens, batches are packed by a token budget like the TokenBudgetBucketIterator and
+	batch_size is the maximum number of examples per batch (None for no limit).
+	"""
+
+	def __init__(self, split: TensorizedSplit, batch_size: Optional[int], train: bool = True, shuffle: bool = None, sort_by_length: bool = False, max_tokens: int = None):
+		self.split = split
+		self.batch_size = batch_size
+		self.train = train
+		self.shuffle = train if shuffle is None else shuffle
+		self.sort_by_length = sort_by_length
+		self.max_tokens = max_tokens
+		self.variable_batch_size = max_tokens is not None
+		self.epoch = 0
+		self.iterations = 0
+		self.batches: List[torch.Tensor] = []
+
+	@classmethod
+	def splits(cls, datasets, batch_size: Optional[int], device=None, **kwargs):
+		return tuple(cls(TensorizedSplit(d, device), batch_size, train=i == 0, **kwargs) for i, d in enumerate(datasets))
+
+	def _create_batches(self) -> List[torch.Tensor]:
+		lengths = self.split.lengths.cpu()
+		num_examples = len(self.split)
+		if self.shuffle:
+			order = torch.randperm(num_examples)
+		else:
+			order = torch.arange(num_examples, dtype=torch.long)
+
+		if self.max_tokens is not None:
+			# sort everything, then pack by the token budget
+			order = order[torch.sort(lengths[order])[1]]
+			sorted_lengths = lengths[order].tolist()
+			batches = [order[start:end] for start, end in pack_by_token_budget(sorted_lengths, self.max_tokens, self.batch_size, self.split.fix_length)]
+		else:
+			if self.sort_by_length:
+				pools = torch.split(order, self.batch_size * 100)
+				order = torch.cat([pool[torch.sort(lengths[pool])[1]] for pool in pools])
+			batches = list(torch.split(order, self.batch_size))
+
+		if self.shuffle and (self.sort_by_length or self.max_tokens is not None):
+			batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+		return [b.to(self.split.lengths.device) for b in batches]
+
+	def init_epoch(self):
+		self.batches = self._create_batches()
+		self.iterations = 0
+
+	def __len__(self):
+		if self.max_tokens is not None:
+			sorted_lengths = torch.sort(self.split.lengths.cpu())[0].tolist()
+			return len(pack_by_token_budget(sorted_lengths, self.max_tokens, self.batch_size, self.split.fix_length))
+		return (len(self.split) + self.batch_size - 1) // self.batch_size
+
+	def __iter__(self):
+		# like torchtext, batches are created anew for every pass
+		self.init_epoch()
+		for indices in self.batches:
+			self.iterations += 1
+			yield self.split.batch(indices)
+		self.epoch += 1
@@ -0,0 +1,113 @@
+import re
+from typing import Dict, List
+
+from data.torchtext.custom_datasets import punctuation_remover, url_regex, EN_CONTRACTION_MAPPING, \
+	replace_urls, harmonize_bahn_names, text_cleaner
+
+ORGANIC_PROFILE = 'organic'
+GERMEVAL_PROFILE = 'germeval'
+AMAZON_PROFILE = 'amazon'
+
+# encoding fixes of the GermEval comments
+GERMEVAL_REPLACEMENTS = {
+	'»': ' ',
+	'ã¼': 'ü',
+	'ã¤': 'ä',
+	'ø': 'ö',
+	'ű': 'ü',
+	'..': ' '
+}
+
+_non_ascii_regex = re.compile(r'[^\x00-\x7f]')
+_germeval_replacement_regex = re.compile('|'.join(re.escape(k) for k in GERMEVAL_REPLACEMENTS.keys()))
+_url_regex = re.compile(url_regex)
+_non_word_regex = re.compile(r'[^\w\säöüß]')
+
+
+class TextNormalizer(object):
+	"""Single-pass replacement for the comment cleaning chains of the Organic, GermEval and Amazon datasets.
+
+	The string level passes are precompiled regexes. Everything after the split into tokens (contraction
+	removal, url tokens, bahn names, organic word replacements) only depends on the token itself, so the result
+	of each distinct token is computed once and looked up afterwards.
+	The output is identical to the original chains.
+
+	Arguments:
+		hp {RunConfiguration} -- configuration with the text cleaning flags
+		profile {str} -- one of ORGANIC_PROFILE, GERMEVAL_PROFILE or AMAZON_PROFILE
+
+	Keyword Arguments:
+		organic_text_cleaning_dict {Dict[str, str]} -- organic word replacements (default: {None})
+	"""
+
+	def __init__(self, hp, profile: str, organic_text_cleaning_dict: Dict[str, str] = None):
+		assert profile in [ORGANIC_PROFILE, GERMEVAL_PROFILE, AMAZON_PROFILE]
+		self.profile = profile
+		self.language = hp.language
+		self.contraction_removal = profile == ORGANIC_PROFILE and hp.contraction_removal
+		self.organic_text_cleaning = profile == ORGANIC_PROFILE and hp.organic_text_cleaning
+		self.harmonize_bahn = profile == GERMEVAL_PROFILE and hp.harmonize_bahn
+		self.use_text_cleaner = profile == ORGANIC_PROFILE and hp.use_text_cleaner
+		self.replace_url_tokens = hp.replace_url_tokens
+		self.organic_text_cleaning_dict = organic_text_cleaning_dict or {}
+
+		self._token_cache: Dict[str, List[str]] = {}
+
+	def _normalize_text(self, text: str) -> str:
+		if self.profile == ORGANIC_PROFILE:
+			# punctuation removal runs first, so the ’ -> ' step of the contraction removal has nothing left to do
+			return _non_ascii_regex.sub(' ', text.translate(punctuation_remover))
+
+		if self.profile == GERMEVAL_PROFILE:
+			text = _germeval_replacement_regex.sub(lambda m: GERMEVAL_REPLACEMENTS[m.group(0)], text)
+			# '<URL>' would lose its brackets in the non-word pass below
+			text = _url_regex.sub(' URL ', text)
+			return _non_word_regex.sub(' ', text)
+
+		return _url_regex.sub('<URL>', text)
+
+	def _normalize_token(self, token: str) -> List[str]:
+		if self.profile != ORGANIC_PROFILE:
+			# remove all empty entries
+			if token.strip() == '':
+				return []
+			tokens = [token]
+			if self.harmonize_bahn:
+				tokens = harmonize_bahn_names(tokens)
+			if self.replace_url_tokens:
+				tokens = replace_urls(tokens)
+			return tokens
+
+		tokens = [token]
+		if self.contraction_removal:
+			expanded = EN_CONTRACTION_MAPPING.get(token.lower())
+			if expanded is not None:
+				tokens = expanded.split(' ')
+
+		if self.replace_url_tokens:
+			tokens = replace_urls(tokens)
+
+		if self.organic_text_cleaning:
+			tokens = [w if w == '' or w == ' ' else self.organic_text_cleaning_dict.get(w, w) for w in tokens]
+		return tokens
+
+	def normalize_tokens(self, text: str) -> List[str]:
+		"""Cleans a raw comment and returns its tokens (before the optional text cleaner)."""
+		result = []
+		cache = self._token_cache
+		for token in self._normalize_text(text).split(' '):
+			normalized = cache.get(token)
+			if normalized is None:
+				normalized = self._normalize_token(token)
+				cache[token] = normalized
+			result.extend(normalized)
+		return result
+
+	def join(self, tokens: List[str]) -> str:
+		comment = ' '.join(tokens)
+		if self.use_text_cleaner:
+			comment = text_cleaner(comment, self.language)
+		return comment
+
+	def __call__(self, text: str) -> str:
+		return self.join(self.normalize_tokens(text))
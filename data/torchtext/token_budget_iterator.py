@@ -0,0 +1,88 @@
+from typing import List, Optional, Tuple
+
+import torchtext.data as data
+
+
+def pack_by_token_budget(lengths: List[int], max_tokens: int, max_batch_size: int = None, fix_length: int = None) -> List[Tuple[int, int]]:
+	"""Greedily packs consecutive examples into batches whose padded size (number of examples times padded length)
+	does not exceed max_tokens. Every batch contains at least one example.
+
+	Arguments:
+		lengths {List[int]} -- lengths of the examples in batch order (usually sorted)
+		max_tokens {int} -- token budget per batch
+
+	Keyword Arguments:
+		max_batch_size {int} -- maximum number of examples per batch (default: {None})
+		fix_length {int} -- padded length if every batch is padded to a fixed length (default: {None})
+
+	Returns:
+		List[Tuple[int, int]] -- start and end index of each batch
+	"""
+	batches = []
+	start = 0
+	longest = 0
+	for i, length in enumerate(lengths):
+		padded_length = fix_length or max(longest, length, 1)
+		size = i - start + 1
+		if size > 1 and (size * padded_length > max_tokens or (max_batch_size is not None and size > max_batch_size)):
+			batches.append((start, i))
+			start = i
+			longest = 0
+		longest = max(longest, length)
+
+	if start < len(lengths):
+		batches.append((start, len(lengths)))
+	return batches
+
+
+class TokenBudgetBucketIterator(data.Iterator):
+	"""Iterator that packs batches by a token budget instead of a fixed number of examples.
+
+	In every epoch the (shuffled) examples are sorted by length and packed greedily so that the number of examples
+	times the padded length of a batch stays below max_tokens. The order of the batches is shuffled, so each step
+	sees a batch of similar length examples and roughly the same number of tokens.
+
+	Because the packing only depends on the sorted lengths, the number of batches is the same in every epoch.
+
+	Arguments:
+		dataset {Dataset} -- dataset of the iterator
+		max_tokens {int} -- token budget per batch
+
+	Keyword Arguments:
+		max_batch_size {int} -- maximum number of examples per batch. None only limits the tokens (default: {None})
+		sort_key {Callable} -- length of an example (default: {number of comment tokens})
+		fix_length {int} -- padded length if every batch is padded to a fixed length (default: {None})
+	"""
+
+	# batches do not have the same number of examples
+	variable_batch_size = True
+
+	def __init__(self, dataset, max_tokens: int, max_batch_size: Optional[int] = None, sort_key=None, fix_length: Optional[int] = None, **kwargs):
+		if sort_key is None:
+			sort_key = lambda example: len(example.comments)
+		super(TokenBudgetBucketIterator, self).__init__(dataset, max_batch_size, sort_key=sort_key, **kwargs)
+
+		self.max_tokens = max_tokens
+		self.fix_length = fix_length
+		self._num_batches: Optional[int] = None
+
+	@classmethod
+	def splits(cls, datasets, max_tokens: int, **kwargs):
+		return tuple(cls(d, max_tokens, train=i == 0, **kwargs) for i, d in enumerate(datasets))
+
+	def _pack(self, examples) -> List[Tuple[int, int]]:
+		lengths = [self.sort_key(example) for example in examples]
+		return pack_by_token_budget(lengths, self.max_tokens, self.batch_size, self.fix_length)
+
+	def create_batches(self):
+		# sort after shuffling so that examples of the same length appear in a different order every epoch
+		examples = sorted(self.data(), key=self.sort_key)
+		batches = [examples[start:end] for start, end in self._pack(examples)]
+		if self.shuffle:
+			batches = self.random_shuffler(batches)
+		self.batches = batches
+
+	def __len__(self):
+		if self._num_batches is None:
+			self._num_batches = len(self._pack(sorted(self.dataset, key=self.sort_key)))
+		return self._num_batches
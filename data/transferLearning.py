@@ -9,7 +9,7 @@ from stop_words import get_stop_words
 
 from data.torchtext.custom_fields import ReversibleField
 from data.torchtext.amazon_dataset import *
-from data.data_loader import get_embedding
+from data.data_loader import get_embedding, create_iterators
 
 from misc.run_configuration import RunConfiguration
 
@@ -55,10 +55,6 @@ def transfer_learning(
 	for splits in loader_results
 	for field in splits['splits']]
 
-	all_paddings = [field.padding
-	for splits in loader_results
-	for field in splits['splits']]
-
 	# build vocab and iterators
 	train_device = torch.device('cuda:0' if torch.cuda.is_available() and use_cuda else 'cpu')
 
@@ -84,13 +80,12 @@ def transfer_learning(
 			comment_vocab = r['fields']['comment'].vocab
 		else:
 			r['fields']['comment'].vocab = comment_vocab
-		r['fields']['padding'].build_vocab(*all_paddings)
 		r['fields']['aspect_sentiment'].build_vocab(train.aspect_sentiments, val.aspect_sentiments, test.aspect_sentiments)
 
 		examples = train.examples[0:3] + val.examples[0:3] + test.examples[0:3]
 
-		iters = data.BucketIterator.splits(
-		(train, val, test), batch_size=batch_size, device=train_device, shuffle=True)
+		iters = create_iterators(
+		(train, val, test), batch_size, train_device, hyperparameters)
 
 		datasets['stats'].append((train.stats, val.stats, test.stats))
 		datasets['split_length'].append((len(train), len(val), len(test)))
@@ -119,7 +114,7 @@ def transfer_learning(
 		'fields': fields,
 		'source_field_name': 'comments',
 		'target_field_name': 'aspect_sentiments',
-		'padding_field_name': 'padding',
+		'padding_field_name': 'lengths',
 		'embeddings': (source_embedding, None),
 		'dummy_input': Variable(torch.zeros((batch_size, 42), dtype=torch.long)),
 		'baselines': {
@@ -14,14 +14,7 @@ class TransferDataLoader(Dataset):
 
 		self.verbose = verbose
 
-		self.logger.info(f'Getting {self.pretrained_word_embeddings} with dimension {self.pretrained_word_embeddings_dim}')
-		word_vectors: vocab
-		word_vectors = None
-		if self.pretrained_word_embeddings == 'glove':
-			word_vectors = vocab.GloVe(name=self.pretrained_word_embeddings_name, dim=self.pretrained_word_embeddings_dim)
-		elif self.pretrained_word_embeddings == 'fasttext':
-			word_vectors = vocab.FastText(language=self.language)
-		self.logger.info('Word vectors successfully loaded.')
+		word_vectors = self._load_word_vectors()
 				
 		self.logger.debug('Start loading dataset')
 		self.dataset = transfer_learning(
@@ -13,7 +13,7 @@ from criterion import NllLoss, LossCombiner
 
 from models.transformer.encoder import TransformerEncoder
 from models.jointAspectTagger import JointAspectTagger
-from trainer.train import Trainer, create_padding_masks
+from trainer.train import Trainer, get_source_mask
 import pprint
 import pickle
 import torchtext
@@ -134,13 +134,13 @@ def write_evaluation_file(iterator: torchtext.data.Iterator, dataset: Dataset, t
 		fn_a = 0
 
 		for batch in iterator:
-			doc_id, comment, relevance, target_aspect_sentiment, general_sentiment, padding = batch.id, batch.comments, batch.relevance, batch.aspect_sentiments, batch.general_sentiments, batch.padding
+			doc_id, comment, relevance, target_aspect_sentiment, general_sentiment = batch.id, batch.comments, batch.relevance, batch.aspect_sentiments, batch.general_sentiments
 			doc_id = fields['id'].reverse(doc_id.unsqueeze(1))
 			comment_decoded = fields['comments'].reverse(comment)
 			relevance = ['false' if r == 0 else 'true' for r in relevance]
 			general_sentiment = fields['general_sentiments'].reverse(general_sentiment.unsqueeze(1))
 
-			source_mask = create_padding_masks(padding, 1)
+			source_mask = get_source_mask(batch)
 			prediction = trainer.model.predict(comment, source_mask)
 
 			all_predictions.append(prediction)
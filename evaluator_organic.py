@@ -14,7 +14,7 @@ from criterion import NllLoss, LossCombiner
 
 from models.transformer.encoder import TransformerEncoder
 from models.jointAspectTagger import JointAspectTagger
-from trainer.train import Trainer, create_padding_masks
+from trainer.train import Trainer, get_source_mask
 import pprint
 import pickle
 import torchtext
@@ -101,11 +101,11 @@ def write_evaluation_file(iterator: torchtext.data.Iterator, dataset: Dataset, t
 		fn_a = 0
 
 		for batch in iterator:
-			comment_id, comment, target_aspect_sentiment, padding = batch.id, batch.comments, batch.aspect_sentiments, batch.padding
+			comment_id, comment, target_aspect_sentiment = batch.id, batch.comments, batch.aspect_sentiments
 			comment_id = fields['id'].reverse(comment_id.unsqueeze(1))
 			comment_decoded = [get_gold_label_row(df_gold, c_id)['Sentence'] for c_id in comment_id]
 
-			source_mask = create_padding_masks(padding, 1)
+			source_mask = get_source_mask(batch)
 			prediction = trainer.model.predict(comment, source_mask)
 
 			all_predictions.append(prediction)
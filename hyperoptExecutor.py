@@ -13,7 +13,7 @@ from misc import utils
 from misc.hyperopt_space import *
 
 from optimizer import get_optimizer
-from criterion import NllLoss, LossCombiner
+from criterion import NllLoss, LossCombiner, create_multi_head_loss
 from models.transformer.encoder import TransformerEncoder
 from models.jointAspectTagger import JointAspectTagger
 from trainer.train import Trainer
@@ -22,7 +22,7 @@ import argparse
 import pickle
 
 def load_model(dataset, rc, experiment_name):
-	loss = LossCombiner(4, dataset.class_weights, NllLoss)
+	loss = create_multi_head_loss(4, dataset.class_weights, rc.vectorized_loss)
 	transformer = TransformerEncoder(dataset.source_embedding,
 									 hyperparameters=rc)
 	model = JointAspectTagger(transformer, rc, 4, 20, dataset.target_names)
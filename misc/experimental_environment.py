@@ -12,7 +12,7 @@ from misc.run_configuration import get_default_params, randomize_params, OutputL
 from misc import utils
 import traceback
 from optimizer import get_optimizer
-from criterion import NllLoss, LossCombiner
+from criterion import NllLoss, LossCombiner, create_multi_head_loss
 
 from models.transformer.encoder import TransformerEncoder
 from trainer.train import Trainer
@@ -79,7 +79,7 @@ class Experiment(object):
 
 			else:
 				from models.jointAspectTagger import JointAspectTagger
-				loss = LossCombiner(dataset.target_size, dataset.class_weights, NllLoss)
+				loss = create_multi_head_loss(dataset.target_size, dataset.class_weights, rc.vectorized_loss)
 				model = JointAspectTagger(transformer, rc, dataset.target_size, len(dataset.target_names), dataset.target_names)
 
 
@@ -292,6 +292,24 @@ class RunConfiguration(object):
 
 			self.batch_size = self._get_default('batch_size', cast_int=True)
 
+			# if larger than 0, batches are packed by this number of tokens (examples times padded length) instead of batch_size examples
+			self.batch_max_tokens = self._get_default('batch_max_tokens', 0, cast_int=True)
+
+			# numericalize all splits once and slice batches from tensors instead of building torchtext batches
+			self.tensorized_dataset = self._get_default('tensorized_dataset', False)
+
+			# number of batches that are prepared in the background. 0 creates each batch when it is needed
+			self.prefetch_batches = self._get_default('prefetch_batches', 0, cast_int=True)
+
+			# worker processes that numericalize the prefetched batches. 0 uses a background thread
+			self.data_loader_workers = self._get_default('data_loader_workers', 0, cast_int=True)
+
+			# 'reuse' keeps cached gpu memory for the next batches, 'release' frees it at epoch boundaries and above the high-water mark
+			self.memory_policy = self._get_default('memory_policy', 'reuse')
+
+			# allocated megabytes after a step above which the 'release' policy frees the cache. 0 only releases at epoch boundaries
+			self.memory_high_water_mark_mb = self._get_default('memory_high_water_mark_mb', 0, cast_int=True)
+
 			# types
 			self.learning_rate_scheduler_type = learning_rate_scheduler_type
 			self.output_layer_type = output_layer_type
@@ -360,9 +378,21 @@ class RunConfiguration(object):
 			self.dropout_rate = kwargs['dropout_rate']
 			self.pointwise_layer_size = self._get_default('pointwise_layer_size', cast_int=True)
 
+			# one packed query, key and value projection per attention layer. Checkpoints of the separate projections can still be loaded
+			self.use_fused_attention = self._get_default('use_fused_attention', False)
+
+			# F.layer_norm instead of the mean / std layer normalization. Checkpoints of the latter can still be loaded
+			self.use_fused_layer_norm = self._get_default('use_fused_layer_norm', False)
+
 			# Output Layer
 			self.last_layer_dropout = self._get_default('output_dropout_rate', 0.0)
 
+			# compute all aspect heads with stacked weights instead of one module per head. Checkpoints of the latter can still be loaded
+			self.batched_aspect_heads = self._get_default('batched_aspect_heads', False)
+
+			# compute the weighted NLL loss of all aspect heads at once instead of one loss per head
+			self.vectorized_loss = self._get_default('vectorized_loss', False)
+
 			# - Convolutions:	
 			if output_layer_type == OutputLayerType.Convolutions:
 				p = kwargs['output_layer']		
@@ -384,6 +414,9 @@ class RunConfiguration(object):
 			self.embedding_name = self._get_default('embedding_name', '6B')
 			self.embedding_dim = self._get_default('embedding_dim', 300, cast_int=True)
 			self.clip_comments_to = self._get_default('clip_comments_to', cast_int=True)
+
+			# pad each batch only to its longest comment instead of clip_comments_to
+			self.dynamic_padding = self._get_default('dynamic_padding', False)
 			self.finetune_embedding = self._get_default('finetune_embedding', True)
 
 			# finetuning can only be off if embedding is pretrained
@@ -396,11 +429,17 @@ class RunConfiguration(object):
 			self.use_stemming = self._get_default('use_stemming', False)
 			self.harmonize_bahn = self._get_default('harmonize_bahn', False)
 			self.use_spell_checkers = self._get_default('use_spell_checkers', False)
+
+			# correct the unknown tokens of the raw Organic texts on load. use_spell_checkers uses the prespellchecked files instead
+			self.spell_correction_on_load = self._get_default('spell_correction_on_load', False)
 			self.replace_url_tokens = self._get_default('replace_url_tokens', True)
 			self.use_text_cleaner = self._get_default('use_text_cleaner', False)
 			self.contraction_removal = self._get_default('contraction_removal', False)
 			self.organic_text_cleaning = self._get_default('organic_text_cleaning', False)
 
+			# number of processes used to clean the dataset texts. 0 cleans in the main process
+			self.preprocessing_workers = self._get_default('preprocessing_workers', 0, cast_int=True)
+
 			# amazon specific
 			self.token_removal_1 = self._get_default('token_removal_1', False)
 			self.token_removal_2 = self._get_default('token_removal_2', False)
@@ -12,7 +12,7 @@ from misc.run_configuration import get_default_params, randomize_params, OutputL
 from misc import utils
 
 from optimizer import get_optimizer
-from criterion import NllLoss, LossCombiner
+from criterion import NllLoss, LossCombiner, create_multi_head_loss
 
 from models.transformer.encoder import TransformerEncoder
 from models.jointAspectTagger import JointAspectTagger
@@ -68,7 +68,7 @@ class TransferLearningExperiment(object):
 		assert self.hp.task == self.task
 
 	def load_model(self, dataset, rc, experiment_name, iteration):
-		loss = LossCombiner(4, dataset.class_weights, NllLoss)
+		loss = create_multi_head_loss(4, dataset.class_weights, rc.vectorized_loss)
 
 		if self.produce_baseline:
 			iteration = 0
@@ -5,7 +5,8 @@ import torch.nn as nn
 
 from misc.run_configuration import RunConfiguration, OutputLayerType
 from models.transformer.encoder import TransformerEncoder
-from models.output_layers import CommentWiseConvLogSoftmax, CommentWiseSumLogSoftmax, CommentWiseConvLinearLogSoftmax
+from models.output_layers import CommentWiseConvLogSoftmax, CommentWiseSumLogSoftmax, CommentWiseConvLinearLogSoftmax, \
+	BatchedCommentWiseConvLogSoftmax, BatchedCommentWiseSumLogSoftmax
 
 class JointAspectTagger(nn.Module):
 	"""description of class"""
@@ -33,8 +34,12 @@ class JointAspectTagger(nn.Module):
 		self.target_size = target_size
 		self.num_taggers = num_taggers
 		self.names = names
+		self.batched_aspect_heads = hyperparameters.batched_aspect_heads
 		
-		self.taggers = self.initialize_aspect_taggers()
+		if self.batched_aspect_heads:
+			self.taggers = self.initialize_batched_aspect_taggers()
+		else:
+			self.taggers = self.initialize_aspect_taggers()
 		self.logger.debug(f"{self.num_taggers} initialized")
 		
 		if initialize_params:
@@ -56,6 +61,10 @@ class JointAspectTagger(nn.Module):
 				if p.dim() > 1:
 					nn.init.xavier_uniform_(p)
 
+		if self.batched_aspect_heads:
+			# the stacked weights have to be initialized like the weights of the individual heads
+			self.taggers.initialize_xavier_uniform()
+
 		self.logger.debug(f"Tagger initialized")
 
 
@@ -80,9 +89,20 @@ class JointAspectTagger(nn.Module):
 			taggers.append(tagger)
 		return nn.ModuleList(taggers)
 
+	def initialize_batched_aspect_taggers(self) -> nn.Module:
+		hp = self.hyperparameters
+		num_taggers = len(self.names) if len(self.names) > 0 else self.num_taggers
+		if hp.output_layer_type == OutputLayerType.Convolutions:
+			return BatchedCommentWiseConvLogSoftmax(hp, self.target_size, num_taggers)
+		return BatchedCommentWiseSumLogSoftmax(hp, self.model_size, self.target_size, num_taggers)
+
 	def forward(self, x: torch.Tensor, *args) -> torch.Tensor:
 		result = self.encoder(x, *args) # result will be [batch_size, num_words, model_size]
 
+		if self.batched_aspect_heads:
+			# [batch_size, num_aspects, 4] (12, 20, 4)
+			return self.taggers(result, *args)
+
 		output: torch.Tensor = None
 
 		# provide the result to each aspect tagger
@@ -101,6 +121,11 @@ class JointAspectTagger(nn.Module):
 
 	def predict(self, x: torch.Tensor, *args) -> torch.Tensor:
 		result = self.encoder(x, *args) # result will be [batch_size, num_words, model_size]
+
+		if self.batched_aspect_heads:
+			# [batch_size, num_aspects]
+			_, output = torch.max(self.taggers.predict(result, *args), dim=-1)
+			return output
 		output: torch.Tensor = None
 
 		# provide the result to each aspect tagger
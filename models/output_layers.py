@@ -1,3 +1,4 @@
+import math
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -127,19 +128,24 @@ class CommentWiseConvLogSoftmax(nn.Module):
 		self.name = name if name is not None else 'NotSet'
 		self.output_size = output_size
 
-		self.conv_out = ((hp.clip_comments_to + 2 * hp.output_conv_padding - 1 * (hp.output_conv_kernel_size - 1) - 1) // hp.output_conv_stride) + 1
-		# self.conv = nn.Sequential(
-		# 	nn.Conv2d(1, hp.output_conv_num_filters, (hp.output_conv_kernel_size, hp.model_size), hp.output_conv_stride, hp.output_conv_padding),
-		# 	nn.ReLU(inplace=True),
-		# 	nn.Dropout(hp.last_layer_dropout),
-		# 	nn.MaxPool2d((self.conv_out, 1), stride=hp.output_conv_stride)
-		# )
 		self.conv = nn.Conv2d(1, hp.output_conv_num_filters, (hp.output_conv_kernel_size, hp.model_size), hp.output_conv_stride, hp.output_conv_padding)
 		self.dropout = nn.Dropout(hp.last_layer_dropout)
-		self.pooling = nn.MaxPool2d((self.conv_out, 1), stride=hp.output_conv_stride)
+
+		# max over all words, so the pooling works for any padded length (e.g. with dynamic padding)
+		self.pooling = nn.AdaptiveMaxPool2d((1, None))
 		self.output_projection = nn.Linear(hp.output_conv_num_filters, output_size)
 
+		# the convolution needs at least this many words
+		self.min_words = max(1, hp.output_conv_kernel_size - 2 * hp.output_conv_padding)
+
+	def _pad_words(self, x: torch.Tensor) -> torch.Tensor:
+		# dynamically padded batches of short comments can be shorter than the convolution kernel
+		if x.shape[1] < self.min_words:
+			x = F.pad(x, (0, 0, 0, self.min_words - x.shape[1]))
+		return x
+
 	def forward(self, x: torch.Tensor, mask: torch.Tensor =None, *args):
+		x = self._pad_words(x)
 		x = x.unsqueeze(1) 					# [batch_size, num_words, model_size] -> e.g. [12, 100, 300] -> [batch_size, 1, num_words, model_size]
 
 		x = self.conv(x)					# [batch_size, 1, num_words, model_size] -> [batch_size, num_filters, num_words - padding, 1] e.g. [12, 300, 96, 1]
@@ -155,6 +161,7 @@ class CommentWiseConvLogSoftmax(nn.Module):
 		return probs
 
 	def predict(self, x: torch.Tensor, mask: torch.Tensor=None, *args):
+		x = self._pad_words(x)
 		x = x.unsqueeze(1) 					# [batch_size, num_words, model_size] -> e.g. [12, 100, 300] -> [batch_size, 1, num_words, model_size]
 
 		x = self.conv(x)					# [batch_size, 1, num_words, model_size] -> [batch_size, num_filters, num_words - padding, 1] e.g. [12, 300, 96, 1]
@@ -241,4 +248,148 @@ class CommentWiseLinearLogSoftmax(CommentWiseConvLogSoftmax):
 		logits = torch.sum(logits, dim=1)
 		probs = F.log_softmax(logits, dim=-1)
 
-		return probs
\ No newline at end of file
+		return probs
+
+def _stack_head_parameters(state_dict, prefix: str, num_heads: int, name: str):
+	keys = [f'{prefix}{i}.{name}' for i in range(num_heads)]
+	if not all(k in state_dict for k in keys):
+		return None
+	return torch.stack([state_dict.pop(k) for k in keys])
+
+
+class BatchedCommentWiseSumLogSoftmax(nn.Module):
+
+	def __init__(self, hp: RunConfiguration, hidden_size: int, output_size: int, num_heads: int):
+		"""All aspect heads of CommentWiseSumLogSoftmax in one module. The projections of the heads are stacked,
+		so the logits of all heads are computed with one einsum.
+
+		Loads state dicts of a ModuleList of CommentWiseSumLogSoftmax heads.
+
+		Arguments:
+			hidden_size {int} -- output of the transformer encoder (d_model)
+			output_size {int} -- number of classes
+			num_heads {int} -- number of aspect heads
+		"""
+		super(BatchedCommentWiseSumLogSoftmax, self).__init__()
+		self.hidden_size = hidden_size
+		self.output_size = output_size
+		self.num_heads = num_heads
+
+		self.weight = nn.Parameter(torch.Tensor(num_heads, output_size, hidden_size))	# [num_heads, classes, model_size]
+		self.bias = nn.Parameter(torch.Tensor(num_heads, output_size))					# [num_heads, classes]
+		self.dropout = nn.Dropout(hp.last_layer_dropout)
+		self.reset_parameters()
+
+	def reset_parameters(self):
+		# same initialization as one nn.Linear per head
+		for i in range(self.num_heads):
+			nn.init.kaiming_uniform_(self.weight[i], a=math.sqrt(5))
+		bound = 1 / math.sqrt(self.hidden_size)
+		nn.init.uniform_(self.bias, -bound, bound)
+
+	def initialize_xavier_uniform(self):
+		for i in range(self.num_heads):
+			nn.init.xavier_uniform_(self.weight[i])
+
+	def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+		for name, key in [('output_projection.weight', 'weight'), ('output_projection.bias', 'bias')]:
+			stacked = _stack_head_parameters(state_dict, prefix, self.num_heads, name)
+			if stacked is not None:
+				state_dict[prefix + key] = stacked
+		super(BatchedCommentWiseSumLogSoftmax, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+	def _logits(self, x: torch.Tensor, apply_dropout: bool) -> torch.Tensor:
+		if apply_dropout and self.training and self.dropout.p > 0:
+			# dropout is applied to the logits of each word, so the mean can only be taken afterwards
+			logits = torch.einsum('blh,ach->balc', (x, self.weight)) + self.bias.unsqueeze(1)
+			return self.dropout(logits).mean(dim=2)
+
+		# the projection is linear, so the mean over the words can be taken first
+		return torch.einsum('bh,ach->bac', (x.mean(dim=1), self.weight)) + self.bias
+
+	def forward(self, x: torch.Tensor, mask: torch.Tensor=None, *args) -> torch.Tensor:
+		# [batch_size, num_words, model_size] -> [batch_size, num_heads, classes]
+		return F.log_softmax(self._logits(x, True), dim=-1)
+
+	def predict(self, x: torch.Tensor, mask: torch.Tensor=None, *args) -> torch.Tensor:
+		return F.log_softmax(self._logits(x, False), dim=-1)
+
+
+class BatchedCommentWiseConvLogSoftmax(nn.Module):
+
+	def __init__(self, hp: RunConfiguration, output_size: int, num_heads: int):
+		"""All aspect heads of CommentWiseConvLogSoftmax in one module. The filters of all heads are computed by one
+		convolution and the output projections of the heads are stacked and applied with one einsum.
+
+		Loads state dicts of a ModuleList of CommentWiseConvLogSoftmax heads.
+
+		Arguments:
+			output_size {int} -- number of classes
+			num_heads {int} -- number of aspect heads
+		"""
+		super(BatchedCommentWiseConvLogSoftmax, self).__init__()
+		self.output_size = output_size
+		self.num_heads = num_heads
+		self.num_filters = hp.output_conv_num_filters
+
+		self.conv = nn.Conv2d(1, num_heads * self.num_filters, (hp.output_conv_kernel_size, hp.model_size), hp.output_conv_stride, hp.output_conv_padding)
+		self.dropout = nn.Dropout(hp.last_layer_dropout)
+		self.pooling = nn.AdaptiveMaxPool2d((1, None))
+
+		self.output_weight = nn.Parameter(torch.Tensor(num_heads, output_size, self.num_filters))	# [num_heads, classes, num_filters]
+		self.output_bias = nn.Parameter(torch.Tensor(num_heads, output_size))						# [num_heads, classes]
+
+		# the convolution needs at least this many words
+		self.min_words = max(1, hp.output_conv_kernel_size - 2 * hp.output_conv_padding)
+		self.reset_parameters()
+
+	def _head_filters(self, i: int) -> torch.Tensor:
+		return self.conv.weight[i * self.num_filters:(i + 1) * self.num_filters]
+
+	def reset_parameters(self):
+		# same initialization as one nn.Conv2d and nn.Linear per head
+		for i in range(self.num_heads):
+			nn.init.kaiming_uniform_(self._head_filters(i), a=math.sqrt(5))
+			nn.init.kaiming_uniform_(self.output_weight[i], a=math.sqrt(5))
+		fan_in = self.conv.weight[0].numel()
+		nn.init.uniform_(self.conv.bias, -1 / math.sqrt(fan_in), 1 / math.sqrt(fan_in))
+		nn.init.uniform_(self.output_bias, -1 / math.sqrt(self.num_filters), 1 / math.sqrt(self.num_filters))
+
+	def initialize_xavier_uniform(self):
+		for i in range(self.num_heads):
+			nn.init.xavier_uniform_(self._head_filters(i))
+			nn.init.xavier_uniform_(self.output_weight[i])
+
+	def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+		conv_weight = _stack_head_parameters(state_dict, prefix, self.num_heads, 'conv.weight')
+		if conv_weight is not None:
+			# [num_heads, num_filters, 1, kernel_size, model_size] -> [num_heads * num_filters, 1, kernel_size, model_size]
+			state_dict[prefix + 'conv.weight'] = conv_weight.view(-1, *conv_weight.shape[2:])
+		conv_bias = _stack_head_parameters(state_dict, prefix, self.num_heads, 'conv.bias')
+		if conv_bias is not None:
+			state_dict[prefix + 'conv.bias'] = conv_bias.view(-1)
+		for name, key in [('output_projection.weight', 'output_weight'), ('output_projection.bias', 'output_bias')]:
+			stacked = _stack_head_parameters(state_dict, prefix, self.num_heads, name)
+			if stacked is not None:
+				state_dict[prefix + key] = stacked
+		super(BatchedCommentWiseConvLogSoftmax, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+	def _logits(self, x: torch.Tensor, apply_dropout: bool) -> torch.Tensor:
+		# dynamically padded batches of short comments can be shorter than the convolution kernel
+		if x.shape[1] < self.min_words:
+			x = F.pad(x, (0, 0, 0, self.min_words - x.shape[1]))
+
+		x = self.conv(x.unsqueeze(1))		# [batch_size, 1, num_words, model_size] -> [batch_size, num_heads * num_filters, num_words - padding, 1]
+		x = F.relu(x)
+		if apply_dropout:
+			x = self.dropout(x)
+		x = self.pooling(x)					# -> [batch_size, num_heads * num_filters, 1, 1]
+
+		x = x.view(x.shape[0], self.num_heads, self.num_filters)
+		return torch.einsum('baf,acf->bac', (x, self.output_weight)) + self.output_bias	# [batch_size, num_heads, classes]
+
+	def forward(self, x: torch.Tensor, mask: torch.Tensor=None, *args) -> torch.Tensor:
+		return F.log_softmax(self._logits(x, True), dim=-1)
+
+	def predict(self, x: torch.Tensor, mask: torch.Tensor=None, *args) -> torch.Tensor:
+		return F.softmax(self._logits(x, False), dim=-1)
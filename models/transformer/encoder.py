@@ -41,19 +41,22 @@ class TransformerEncoder(nn.Module):
 		self.d_k = hyperparameters.d_k
 		self.d_v = hyperparameters.d_v
 		self.bias = hyperparameters.use_bias
+		self.use_fused_attention = hyperparameters.use_fused_attention
+		self.use_fused_layer_norm = hyperparameters.use_fused_layer_norm
 
 		self.positional_encoding = PositionalEncoding2(self.d_model, hyperparameters.clip_comments_to, dropout=hyperparameters.dropout_rate)
 
 
 		self.encoder_blocks = self._initialize_encoder_blocks()
-		self.layer_norm = LayerNorm(self.d_model)
+		self.layer_norm = create_layer_norm(self.d_model, self.use_fused_layer_norm)
 		self._initialize_embeddings(src_embeddings, hyperparameters, d_vocab)
 		
 
 	def _initialize_encoder_blocks(self) -> nn.ModuleList:
 		blocks = []
 		for _ in range(self.n_enc_blocks):
-			blocks.append(EncoderBlock(self.dropout_rate, self.pointwise_layer_size, self.d_model, self.d_k, self.d_v, self.n_head, self.bias))
+			blocks.append(EncoderBlock(self.dropout_rate, self.pointwise_layer_size, self.d_model, self.d_k, self.d_v, self.n_head, self.bias,
+				self.use_fused_attention, self.use_fused_layer_norm))
 		return nn.ModuleList(blocks)
 
 	def _initialize_embeddings(self, src_embeddings: nn.Embedding, hyperparameters: RunConfiguration, d_vocab: int = None):
@@ -113,7 +116,9 @@ class EncoderBlock(nn.Module):
 				d_k,
 				d_v,
 				num_heads,
-				use_bias):
+				use_bias,
+				use_fused_attention=False,
+				use_fused_layer_norm=False):
 		"""
 		"""
 		super(EncoderBlock, self).__init__()
@@ -125,9 +130,13 @@ class EncoderBlock(nn.Module):
 		self.d_v = d_v
 		self.num_heads = num_heads
 		self.use_bias = use_bias
-		self.self_attention_layer = MultiHeadedSelfAttentionLayer(d_k, d_v, d_model, num_heads, dropout_rate)
+		if use_fused_attention:
+			self.self_attention_layer = FusedMultiHeadedSelfAttentionLayer(d_k, d_v, d_model, num_heads, dropout_rate)
+		else:
+			self.self_attention_layer = MultiHeadedSelfAttentionLayer(d_k, d_v, d_model, num_heads, dropout_rate)
 		self.feed_forward_layer = PointWiseFCLayer(d_model, pointwise_layer_size, dropout=self.dropout_rate, use_bias=use_bias)
-		self.layer_norm = LayerNorm(d_model)
+		# both residual connections are normalized by the same module
+		self.layer_norm = create_layer_norm(d_model, use_fused_layer_norm)
 
 	def forward(self, x, mask=None):
 		"""Applies the forward pass on a transformer encoder layer.
@@ -323,6 +323,125 @@ class MultiHeadedSelfAttentionLayer(nn.Module):
         return result
 
 
+
+def fuse_attention_state_dict(state_dict, prefix: str = '') -> None:
+    """Converts the separate query, key and value projections of a MultiHeadedSelfAttentionLayer in state_dict
+    into the packed projection of a FusedMultiHeadedSelfAttentionLayer (in place).
+
+    prefix: prefix of the attention layer in state_dict. An empty prefix converts all attention layers
+    """
+    suffix = 'query_projections.weight'
+    query_keys = [k for k in state_dict.keys() if k.startswith(prefix) and k.endswith(suffix)]
+    for query_key in query_keys:
+        layer_prefix = query_key[:-len(suffix)]
+        key_key = layer_prefix + 'key_projections.weight'
+        value_key = layer_prefix + 'value_projections.weight'
+        if key_key not in state_dict or value_key not in state_dict:
+            continue
+
+        # the packed weight produces [Q | K | V] like the three separate projections
+        state_dict[layer_prefix + 'qkv_projection.weight'] = torch.cat(
+            [state_dict.pop(query_key), state_dict.pop(key_key), state_dict.pop(value_key)], dim=0)
+
+
+class FusedMultiHeadedSelfAttentionLayer(nn.Module):
+
+    def __init__(self,
+                d_k,
+                d_v,
+                d_model,
+                n_head,
+                dropout_rate) -> None:
+        """Multi head attention with the same parameters and results as MultiHeadedSelfAttentionLayer.
+        Query, key and value are projected with one packed matrix multiplication, the heads are a separate tensor
+        dimension instead of being merged with the batch and the mask is broadcast over the heads.
+        The attention itself is computed with the same matmul / softmax steps as the ScaledDotProductAttentionLayer,
+        since its masking (masked scores are set to eps) can not be expressed with scaled_dot_product_attention.
+
+        State dicts of MultiHeadedSelfAttentionLayer are converted on load (see fuse_attention_state_dict).
+
+        d_k: dimensionality of the query and key vectors
+        d_v: dimensionality of the value vector
+        n_head: number of attention heads
+        """
+        super(FusedMultiHeadedSelfAttentionLayer, self).__init__()
+
+        assert d_model % n_head == 0
+        assert d_k * n_head == d_model
+
+        self.d_model = d_model
+        self.d_k = d_k
+        self.d_v = d_v
+        self.n_head = n_head
+        self.dropout_rate = dropout_rate if dropout_rate is not None else 0.0
+        self.gradientStabilizer = math.sqrt(self.d_k)
+
+        # W^Q, W^K and W^V stacked into one projection
+        self.qkv_projection = nn.Linear(self.d_model, self.n_head * (2 * self.d_k + self.d_v), bias=False)
+        self.attention_dropout = nn.Dropout(self.dropout_rate)
+        self.w_0 = nn.Linear(self.n_head * self.d_v, self.d_model, bias=False)
+        self.dropout = nn.Dropout(dropout_rate) if dropout_rate is not None else None
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        fuse_attention_state_dict(state_dict, prefix)
+        super(FusedMultiHeadedSelfAttentionLayer, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def _project(self, x_queries: torch.Tensor, x_keys: torch.Tensor, x_values: torch.Tensor):
+        size_qk = self.n_head * self.d_k
+        if x_queries is x_keys and x_keys is x_values:
+            return self.qkv_projection(x_queries).split([size_qk, size_qk, self.n_head * self.d_v], dim=-1)
+
+        # e.g. source attention of the decoder
+        w_query, w_key, w_value = self.qkv_projection.weight.split([size_qk, size_qk, self.n_head * self.d_v], dim=0)
+        return F.linear(x_queries, w_query), F.linear(x_keys, w_key), F.linear(x_values, w_value)
+
+    def _attention(self, Q: torch.Tensor, K: torch.Tensor, V: torch.Tensor, mask: torch.Tensor=None, eps=1e-6) -> torch.Tensor:
+        # Q, K, V: [batch_size, num_heads, num_words, d_k]
+        scores = torch.matmul(Q, K.transpose(-2, -1)) / self.gradientStabilizer     # [batch_size, num_heads, num_words, num_words]
+        if mask is not None:
+            # [batch_size, 1, num_words] -> [batch_size, 1, 1, num_words]. Same semantics as the ScaledDotProductAttentionLayer,
+            # the masked scores are set to eps
+            scores = scores.masked_fill(mask.unsqueeze(1) == 0, eps)
+        attention = self.attention_dropout(F.softmax(scores, dim=-1))
+        return torch.matmul(attention, V)
+
+    def forward(self, x_queries: torch.Tensor, x_keys: torch.Tensor, x_values: torch.Tensor, mask: torch.Tensor=None) -> torch.Tensor:
+        """
+        x_queries: [batch_size, num_words, d_model] (100, 10, 512)
+        """
+        Q, K, V = self._project(x_queries, x_keys, x_values)
+
+        batch_size, len_q, _ = x_queries.size()
+        len_k = x_keys.size(1)
+
+        # [batch_size, num_words, num_heads * d_k] -> [batch_size, num_heads, num_words, d_k]
+        Q = Q.view(batch_size, len_q, self.n_head, self.d_k).transpose(1, 2)
+        K = K.view(batch_size, len_k, self.n_head, self.d_k).transpose(1, 2)
+        V = V.view(batch_size, len_k, self.n_head, self.d_v).transpose(1, 2)
+
+        result = self._attention(Q, K, V, mask)
+
+        # concatenate heads: [batch_size, num_heads, num_words, d_v] -> [batch_size, num_words, num_heads * d_v]
+        result = result.transpose(1, 2).contiguous().view(batch_size, len_q, -1)
+        result = self.w_0(result)
+
+        if self.dropout is not None:
+            result = self.dropout(result)
+
+        return result
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def _get_parameters(self, indentation: str) -> str:
+        result = indentation + "\tModel Size: {0}\n".format(self.d_model)
+        result += indentation + "\t# Heads: {0}\n".format(self.n_head)
+        result += indentation + "\tValue Size: {0}\n".format(self.d_v)
+        return result
+
+    def print_model_graph(self, indentation: str) -> str:
+        return indentation + "- " + self.__str__() + ": - Parameters\n" + self._get_parameters(indentation + "\t")
+
 class LayerNorm(nn.Module):
 
     def __init__(self, features, eps=1e-6) -> None:
@@ -341,31 +460,91 @@ class LayerNorm(nn.Module):
     def __str__(self):
         return self.__class__.__name__
 
+
+class FusedLayerNorm(nn.Module):
+
+    def __init__(self, features, eps=1e-6) -> None:
+        """Layer normalization with a single F.layer_norm kernel.
+
+        Unlike LayerNorm, the input is divided by the biased standard deviation with eps inside the square root.
+        Checkpoints of LayerNorm are converted on load: gamma is scaled by sqrt((features - 1) / features) to
+        account for the biased standard deviation and loaded as weight, beta is loaded as bias.
+        """
+        super(FusedLayerNorm, self).__init__()
+        self.features = features
+        self.weight = nn.Parameter(torch.ones(features))
+        self.bias = nn.Parameter(torch.zeros(features))
+        self.eps = eps
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        if prefix + 'gamma' in state_dict:
+            state_dict[prefix + 'weight'] = state_dict.pop(prefix + 'gamma') * math.sqrt((self.features - 1) / self.features)
+        if prefix + 'beta' in state_dict:
+            state_dict[prefix + 'bias'] = state_dict.pop(prefix + 'beta')
+        super(FusedLayerNorm, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.layer_norm(x, (self.features,), self.weight, self.bias, self.eps)
+
+    def __str__(self):
+        return self.__class__.__name__
+
+
+def create_layer_norm(features, use_fused_layer_norm: bool = False) -> nn.Module:
+    if use_fused_layer_norm:
+        return FusedLayerNorm(features)
+    return LayerNorm(features)
+
+# positional encoding tables by (d_model, max_len, dtype), shared by all encoders of the process
+_positional_encoding_tables = {}
+
+def build_positional_encoding_table(d_model: int, max_len: int, dtype=torch.float32) -> torch.Tensor:
+    """Creates the positional encoding table [max_len, d_model].
+    Even columns i are sin(pos / 10000^(2i / d_model)), odd columns i + 1 are cos(pos / 10000^(2(i + 1) / d_model)).
+    The values are computed in double precision like math.sin / math.cos and then converted to dtype.
+    """
+    positions = torch.arange(max_len, dtype=torch.float64).unsqueeze(1)                 # [max_len, 1]
+    even_columns = torch.arange(0, d_model, 2, dtype=torch.float64)                     # [d_model / 2]
+
+    pe = torch.zeros(max_len, d_model, dtype=torch.float64)
+    pe[:, 0::2] = torch.sin(positions / torch.pow(10000.0, (2 * even_columns) / d_model))
+    pe[:, 1::2] = torch.cos(positions / torch.pow(10000.0, (2 * (even_columns + 1)) / d_model))
+    return pe.to(dtype)
+
+def get_positional_encoding_table(d_model: int, max_len: int, dtype=torch.float32) -> torch.Tensor:
+    """Returns the cached positional encoding table [1, max_len, d_model]. The table must not be modified."""
+    key = (d_model, max_len, dtype)
+    if key not in _positional_encoding_tables:
+        _positional_encoding_tables[key] = build_positional_encoding_table(d_model, max_len, dtype).unsqueeze(0)
+    return _positional_encoding_tables[key]
+
+
 class PositionalEncoding2(nn.Module):
     def __init__(self, d_model, max_seq_len, dropout):
         super().__init__()
         self.d_model = d_model
         self.dropout = nn.Dropout(dropout)
-        # create constant 'pe' matrix with values dependant on 
-        # pos and i
-        pe = torch.zeros(max_seq_len, d_model)
-        for pos in range(max_seq_len):
-            for i in range(0, d_model, 2):
-                pe[pos, i] = \
-                math.sin(pos / (10000 ** ((2 * i)/d_model)))
-                pe[pos, i + 1] = \
-                math.cos(pos / (10000 ** ((2 * (i + 1))/d_model)))
-        pe = pe.unsqueeze(0)
-        self.register_buffer('pe', pe)
- 
-    
+        # constant 'pe' matrix with values dependant on pos and i. The table is shared with
+        # all other encoders of the same size and grows if longer comments show up
+        self.register_buffer('pe', get_positional_encoding_table(d_model, max_seq_len))
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # the table only depends on the size. Don't copy the stored one into the shared table,
+        # it might also have a different length
+        if prefix + 'pe' in state_dict:
+            state_dict[prefix + 'pe'] = self.pe
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def _grow(self, seq_len: int):
+        max_len = max(seq_len, 2 * self.pe.size(1))
+        self.pe = get_positional_encoding_table(self.d_model, max_len, self.pe.dtype).to(self.pe.device)
+
     def forward(self, x):
         # make embeddings relatively larger
         x = x * math.sqrt(self.d_model)
         #add constant to embedding
         seq_len = x.size(1)
-        pe = Variable(self.pe[:,:seq_len], requires_grad=False)
-        if x.is_cuda:
-            pe.cuda()
-        x = x + pe
-        return self.dropout(x)
\ No newline at end of file
+        if seq_len > self.pe.size(1):
+            self._grow(seq_len)
+        x = x + self.pe[:, :seq_len]
+        return self.dropout(x)
@@ -0,0 +1,82 @@
+import os
+from collections import Counter, defaultdict
+
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('revtok')
+data = pytest.importorskip('torchtext.data')
+
+from misc.run_configuration import get_default_params
+import data.spellchecker.correction_store as correction_store
+from data.torchtext.organic_dataset import SingleSentenceOrganicDataset
+
+ORGANIC_ROWS = [
+	'Author ID|Author Name|Comment Number|Sentence Number|Domain Relevance|Sentiment|Entity|Attribute|Sentence|Source File|Annotator|Aspect',
+	'a1|n1|1|1|1|p|g|g|The tomatos are good|f|x|g-g',
+	'a2|n2|2|1|1|n|g|p|Too expensiv|f|x|g-p',
+	# the last sample of a file is not added
+	'a3|n3|3|1|1|p|g|g|end|f|x|g-g'
+]
+
+
+class FakeSpellChecker(object):
+	words = {'the', 'tomatoes', 'are', 'good', 'too', 'expensive'}
+	corrections = {'tomatos': 'tomatoes', 'expensiv': 'expensive'}
+
+	def __contains__(self, word):
+		return word.lower() in self.words
+
+	def correction(self, word):
+		return self.corrections.get(word, word)
+
+
+def load_comments(tmp_path, monkeypatch, **overwrite):
+	# the correction store is kept in data/spellchecker of the working directory
+	monkeypatch.chdir(tmp_path)
+	os.makedirs(os.path.join('data', 'spellchecker'))
+	monkeypatch.setattr(correction_store, '_stores', {})
+	monkeypatch.setattr(SingleSentenceOrganicDataset, 'initialize_spellchecker', lambda self, language: FakeSpellChecker())
+
+	path = os.path.join(str(tmp_path), 'train.csv')
+	with open(path, 'w') as f:
+		f.write('\n'.join(ORGANIC_ROWS) + '\n')
+
+	hp = get_default_params(overwrite={'language': 'en', 'clip_comments_to': 100, **overwrite})
+	fields = [
+		('id', data.Field(sequential=False)),
+		(None, None),
+		(None, None),
+		(None, None),
+		(None, None),
+		(None, None),
+		('aspect_sentiments', data.Field(sequential=True)),
+		('comments', data.Field(sequential=True, lower=True)),
+		(None, None),
+		('lengths', data.Field(sequential=False, use_vocab=False))
+	]
+
+	dataset = SingleSentenceOrganicDataset.__new__(SingleSentenceOrganicDataset)
+	dataset.aspects = []
+	dataset.aspect_sentiment_fields = []
+	dataset.stats = defaultdict(Counter)
+	examples, _ = dataset._load(path, 'train', fields, separator='|', verbose=False, hp=hp, task='all')
+	return [e.comments for e in examples]
+
+
+def test_raw_texts_are_not_corrected_by_default(tmp_path, monkeypatch):
+	comments = load_comments(tmp_path, monkeypatch, use_spell_checkers=True)
+	assert comments == [['the', 'tomatos', 'are', 'good'], ['too', 'expensiv']]
+
+
+def test_spell_correction_on_load(tmp_path, monkeypatch):
+	comments = load_comments(tmp_path, monkeypatch, spell_correction_on_load=True)
+	assert comments == [['the', 'tomatoes', 'are', 'good'], ['too', 'expensive']]
+
+	# the corrections are appended to the store
+	assert correction_store.get_correction_store('en').get('tomatos') == 'tomatoes'
+
+
+def test_spell_correction_on_load_with_workers(tmp_path, monkeypatch):
+	comments = load_comments(tmp_path, monkeypatch, spell_correction_on_load=True, preprocessing_workers=2)
+	assert comments == [['the', 'tomatoes', 'are', 'good'], ['too', 'expensive']]
@@ -0,0 +1,65 @@
+import logging
+
+import torch
+
+# the caching allocator keeps freed memory and reuses it for the next batches
+MEMORY_POLICY_REUSE = 'reuse'
+
+# cached memory is released at the end of each epoch / evaluation and when the allocated memory exceeds a high-water mark
+MEMORY_POLICY_RELEASE = 'release'
+
+
+class MemoryPolicy(object):
+	"""Decides when the cached gpu memory of the training and evaluation loops is released.
+
+	With MEMORY_POLICY_REUSE (default), memory is never released, so the caching allocator reuses the blocks of the
+	previous batch without synchronizing. With MEMORY_POLICY_RELEASE, torch.cuda.empty_cache is called at epoch and
+	evaluation boundaries and after each step in which more than high_water_mark_mb are allocated. In this mode, the
+	peak of the allocated memory is logged at every boundary.
+
+	Keyword Arguments:
+		policy {str} -- MEMORY_POLICY_REUSE or MEMORY_POLICY_RELEASE (default: {MEMORY_POLICY_REUSE})
+		high_water_mark_mb {int} -- release after a step above this many allocated megabytes. 0 disables it (default: {0})
+	"""
+
+	def __init__(self, policy: str = MEMORY_POLICY_REUSE, high_water_mark_mb: int = 0):
+		assert policy in [MEMORY_POLICY_REUSE, MEMORY_POLICY_RELEASE]
+		self.logger = logging.getLogger(__name__)
+		self.policy = policy
+		self.high_water_mark = high_water_mark_mb * 1024 * 1024
+		self.enabled = policy == MEMORY_POLICY_RELEASE and torch.cuda.is_available()
+		self.peak_bytes = 0
+		self.num_releases = 0
+
+	@classmethod
+	def from_configuration(cls, hp):
+		return cls(hp.memory_policy, hp.memory_high_water_mark_mb)
+
+	def _release(self):
+		torch.cuda.empty_cache()
+		self.num_releases += 1
+
+	def after_step(self):
+		if not self.enabled or self.high_water_mark <= 0:
+			return
+
+		# reads the counters of the allocator, no synchronization
+		if torch.cuda.memory_allocated() > self.high_water_mark:
+			self._release()
+
+	def _end_of_section(self, section: str):
+		if not self.enabled:
+			return
+
+		peak = torch.cuda.max_memory_allocated()
+		self.peak_bytes = max(self.peak_bytes, peak)
+		self.logger.info(f'Peak allocated memory in {section}: {peak / 1024 ** 2:.1f} MB (overall {self.peak_bytes / 1024 ** 2:.1f} MB, {self.num_releases} releases)')
+		if hasattr(torch.cuda, 'reset_max_memory_allocated'):
+			torch.cuda.reset_max_memory_allocated()
+		self._release()
+
+	def end_of_epoch(self):
+		self._end_of_section('epoch')
+
+	def end_of_evaluation(self):
+		self._end_of_section('evaluation')
@@ -0,0 +1,152 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+
+# binary classification counts of each head and class. Each entry is a [num_heads, num_labels] array
+ClassificationCounts = Dict[str, np.array]
+
+
+def confusion_matrices(targets: torch.Tensor, predictions: torch.Tensor, num_labels: int) -> torch.Tensor:
+	"""Counts the confusion matrices of all heads with a single bincount on the device of the tensors.
+
+	Arguments:
+		targets {torch.Tensor} -- target classes [batch_size, num_heads]
+		predictions {torch.Tensor} -- predicted classes [batch_size, num_heads]
+		num_labels {int} -- number of classes of each head
+
+	Returns:
+		torch.Tensor -- confusion matrices [num_heads, num_labels, num_labels]. Rows are targets, columns predictions
+	"""
+	num_heads = targets.shape[-1]
+	head_offsets = torch.arange(num_heads, dtype=torch.long, device=targets.device) * num_labels
+	index = (head_offsets + targets.long()) * num_labels + predictions.view_as(targets).long()
+	counts = torch.bincount(index.view(-1), minlength=num_heads * num_labels * num_labels)
+	return counts.view(num_heads, num_labels, num_labels)
+
+
+def binary_classification_counts(c_matrices: np.array) -> ClassificationCounts:
+	"""Calculates the one vs. rest counts of every class of every head.
+
+	The counts are the same as the ones of the binary sklearn confusion matrix of (target == class, prediction == class)
+	with labels [1, 0] that was used so far: 'fp' counts the missed targets and 'fn' the wrong predictions of a class.
+	Since f1 scores are symmetric in fp and fn, this does not change any score.
+
+	Arguments:
+		c_matrices {np.array} -- confusion matrices [num_heads, num_labels, num_labels]
+	"""
+	tp = np.diagonal(c_matrices, axis1=1, axis2=2)
+	fp = c_matrices.sum(axis=2) - tp
+	fn = c_matrices.sum(axis=1) - tp
+	tn = c_matrices.sum(axis=(1, 2))[:, np.newaxis] - tp - fp - fn
+	return {'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn}
+
+
+def binary_f1_scores(counts: ClassificationCounts) -> np.array:
+	"""F1 score of every class of every head. Classes without any tp, fp and fn get a score of 0.
+
+	Returns:
+		np.array -- f1 scores [num_heads, num_labels]
+	"""
+	with np.errstate(divide='ignore', invalid='ignore'):
+		f1 = (2 * counts['tp']) / (2 * counts['tp'] + counts['fn'] + counts['fp'])
+	f1[np.isnan(f1)] = 0.0
+	return f1
+
+
+def macro_f1_scores(f1: np.array) -> np.array:
+	"""Unweighted mean of the class f1 scores of each head without the n/a class at position 0.
+
+	Arguments:
+		f1 {np.array} -- f1 scores [num_heads, num_labels]
+
+	Returns:
+		np.array -- macro f1 scores [num_heads]
+	"""
+	num_labels = f1.shape[1]
+
+	# sum the classes in order so that the result does not depend on the summation strategy of numpy
+	s_f1 = np.zeros(f1.shape[0])
+	for i in range(1, num_labels):
+		s_f1 += f1[:, i]
+	return s_f1 / (num_labels - 1)
+
+
+def calculate_accuracy(c_matrices: np.array) -> float:
+	"""Share of correctly predicted labels over all heads.
+
+	Arguments:
+		c_matrices {np.array} -- confusion matrices [num_heads, num_labels, num_labels]
+	"""
+	true_pos = np.trace(c_matrices, axis1=1, axis2=2).sum()
+	return float(true_pos) / float(c_matrices.sum())
+
+
+def micro_counts(counts: ClassificationCounts):
+	"""Sums the tp, fn and fp of all heads and classes without the n/a class at position 0.
+
+	Returns:
+		Tuple[int, int, int] -- tp, fn, fp
+	"""
+	return counts['tp'][:, 1:].sum(), counts['fn'][:, 1:].sum(), counts['fp'][:, 1:].sum()
+
+
+def micro_f1_score(tp: int, fn: int, fp: int) -> float:
+	return (2 * tp) / (2 * tp + fn + fp)
+
+
+def germeval_classification_counts(c_matrices: np.array) -> ClassificationCounts:
+	"""Counts of the GermEval 2017 aspect-sentiment evaluation of each head.
+
+	A correct sentiment is a tp. A missed sentiment, a wrong sentiment and a sentiment predicted for n/a
+	produce one mismatching entry each, a wrong sentiment a second one for the predicted sentiment.
+	Each mismatching entry is both a fp and a fn. The counts are reported in the column of class 1, all other
+	classes are 0.
+
+	Arguments:
+		c_matrices {np.array} -- confusion matrices [num_heads, num_labels, num_labels]
+	"""
+	num_heads, num_labels, _ = c_matrices.shape
+	tp = np.diagonal(c_matrices, axis1=1, axis2=2)
+	c_wrong = c_matrices.copy()
+	c_wrong[:, np.arange(num_labels), np.arange(num_labels)] = 0
+
+	counts = {k: np.zeros((num_heads, num_labels), dtype=c_matrices.dtype) for k in ['tp', 'fp', 'fn', 'tn']}
+	mismatches = c_wrong[:, 1:].sum(axis=(1, 2)) + c_wrong[:, 1:, 1:].sum(axis=(1, 2)) + c_matrices[:, 0, 1:].sum(axis=1)
+	counts['tp'][:, 1] = tp[:, 1:].sum(axis=1)
+	counts['fp'][:, 1] = mismatches
+	counts['fn'][:, 1] = mismatches
+	return counts
+
+
+def micro_scores(c_matrices: np.array, labels: List[int]) -> Tuple[np.array, np.array, np.array]:
+	"""Micro averaged precision, recall and f1 score of each head over the given labels
+	(precision_recall_fscore_support with average='micro').
+
+	Arguments:
+		c_matrices {np.array} -- confusion matrices [num_heads, num_labels, num_labels]
+		labels {List[int]} -- labels that are included
+
+	Returns:
+		Tuple[np.array, np.array, np.array] -- precision, recall and f1 scores [num_heads]
+	"""
+	labels = np.array(labels)
+	labels = labels[labels < c_matrices.shape[1]]
+	tp = np.diagonal(c_matrices, axis1=1, axis2=2)[:, labels].sum(axis=1)
+	num_predicted = c_matrices.sum(axis=1)[:, labels].sum(axis=1)
+	num_true = c_matrices.sum(axis=2)[:, labels].sum(axis=1)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		precision = tp / num_predicted
+		recall = tp / num_true
+		f1 = 2 * precision * recall / (precision + recall)
+	precision[np.isnan(precision)] = 0.0
+	recall[np.isnan(recall)] = 0.0
+	f1[np.isnan(f1)] = 0.0
+	return precision, recall, f1
+
+
+def head_metrics(counts: ClassificationCounts, head: int) -> List[Dict[str, int]]:
+	"""Counts of each class of a head in the format of TrainLogger.log_aspect_metrics."""
+	num_labels = counts['tp'].shape[1]
+	return [{k: v[head, i] for k, v in counts.items()} for i in range(num_labels)]
@@ -0,0 +1,80 @@
+from array import array
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# name, array type code and numpy type of each column. String columns are stored in lists
+METRICS_COLUMNS: List[Tuple[str, Optional[str], Optional[type]]] = [
+	('epoch', 'q', np.int64),
+	('iteration', 'q', np.int64),
+	('metric type', None, None),		# loss, f1, etc.
+	('iterator type', None, None),		# train, valid, test
+	('value', 'd', np.float64),			# value of the metric
+	('is general', 'b', np.int8),		# is the metric a general metric or an head-metric
+	('head name', None, None),			# name of the transformer head
+	('head category', None, None)		# category of the transformer head (n/a, neutral, etc)
+]
+
+
+class MetricsBuffer(object):
+	"""Append-only columnar store for the metrics of a training run.
+
+	Each metric is appended to typed column arrays, so logging a metric does not copy the rows that were logged
+	before. The pd.DataFrame with the columns of METRICS_COLUMNS is only created when it is requested and is reused
+	until the next metric is appended.
+	"""
+
+	def __init__(self):
+		self.columns = {name: array(type_code) if type_code is not None else [] for name, type_code, _ in METRICS_COLUMNS}
+		self._data_frame: Optional[pd.DataFrame] = None
+
+	def __len__(self) -> int:
+		return len(self.columns['epoch'])
+
+	def append(self, epoch: int, iteration: int, metric: str, iterator_type: str, value: float, is_general: bool=False, head_name: str='', head_category: str=''):
+		columns = self.columns
+		columns['epoch'].append(int(epoch))
+		columns['iteration'].append(int(iteration))
+		columns['metric type'].append(metric)
+		columns['iterator type'].append(iterator_type)
+		columns['value'].append(float(value))
+		columns['is general'].append(bool(is_general))
+		columns['head name'].append(head_name)
+		columns['head category'].append(head_category)
+		self._data_frame = None
+
+	def _column_values(self, name: str, dtype: Optional[type]):
+		column = self.columns[name]
+		if dtype is None:
+			return list(column)
+
+		# copy, so that the array can still grow
+		values = np.frombuffer(column, dtype=dtype).copy() if len(column) > 0 else np.empty(0, dtype=dtype)
+		if name == 'is general':
+			values = values.astype(bool)
+		return values
+
+	def to_data_frame(self) -> pd.DataFrame:
+		if self._data_frame is None:
+			names = [name for name, _, _ in METRICS_COLUMNS]
+			self._data_frame = pd.DataFrame({name: self._column_values(name, dtype) for name, _, dtype in METRICS_COLUMNS}, columns=names)
+		return self._data_frame
+
+	@classmethod
+	def from_data_frame(cls, df: pd.DataFrame) -> 'MetricsBuffer':
+		"""Creates a buffer from a metrics data frame, e.g. the one of a checkpoint."""
+		buffer = cls()
+		if df is None or len(df) == 0:
+			return buffer
+
+		for name, type_code, _ in METRICS_COLUMNS:
+			values = df[name].tolist()
+			if type_code == 'q':
+				values = [int(v) for v in values]
+			elif type_code == 'd':
+				values = [float(v) for v in values]
+			elif type_code == 'b':
+				values = [bool(v) for v in values]
+			buffer.columns[name].extend(values)
+		return buffer
@@ -0,0 +1,57 @@
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from trainer.metrics import confusion_matrices
+
+
+class StreamingEvaluation(object):
+	"""Accumulates the loss and the confusion matrices of all heads during an evaluation on the device of the model.
+
+	Each batch adds its loss to a device scalar and updates a [num_heads, num_labels, num_labels] confusion tensor
+	(rows are targets, columns are predictions) with a single bincount. The evaluation loop therefore neither
+	concatenates the predictions of the split nor synchronizes with the gpu. The counts are copied to the cpu once
+	when the evaluation is finalized.
+
+	Arguments:
+		num_labels {int} -- number of classes of each head
+	"""
+
+	def __init__(self, num_labels: int):
+		self.num_labels = num_labels
+		self.num_batches = 0
+		self.loss_sum: torch.Tensor = None
+		self.confusion: torch.Tensor = None
+
+	def update(self, loss: torch.Tensor, prediction: torch.Tensor, target: torch.Tensor, batch_size: int):
+		"""Adds a batch to the evaluation.
+
+		Arguments:
+			loss {torch.Tensor} -- loss of the batch
+			prediction {torch.Tensor} -- predicted classes [batch_size, num_heads]
+			target {torch.Tensor} -- target classes [batch_size, num_heads]
+			batch_size {int} -- the loss is divided by the batch size so that it does not depend on it
+		"""
+		# models predict [num_heads] instead of [1, num_heads] for single sample batches
+		prediction = prediction.view_as(target)
+		c_matrices = confusion_matrices(target, prediction, self.num_labels)
+		if self.confusion is None:
+			self.loss_sum = torch.zeros((), dtype=torch.float64, device=target.device)
+			self.confusion = c_matrices
+		else:
+			self.confusion += c_matrices
+		self.loss_sum += loss.detach().double() / batch_size
+		self.num_batches += 1
+
+	def finalize(self) -> Tuple[float, np.array]:
+		"""Copies the counts to the cpu.
+
+		Returns:
+			Tuple[float, np.array] -- mean batch loss and confusion matrices [num_heads, num_labels, num_labels]
+		"""
+		assert self.num_batches > 0, 'Evaluation without batches'
+		mean_loss = self.loss_sum.item() / self.num_batches
+		c_matrices = self.confusion.cpu().numpy()
+		return mean_loss, c_matrices
+
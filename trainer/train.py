@@ -16,10 +16,11 @@ from torch.autograd import *
 from trainer.utils import *
 from trainer.train_logger import TrainLogger
 from trainer.early_stopping import EarlyStopping
+from trainer.memory_policy import MemoryPolicy
 
 from misc.utils import *
 from misc.run_configuration import RunConfiguration
-from data.data_loader import Dataset
+from data.data_loader import Dataset, create_batch_loader
 
 if isnotebook():
 	from tqdm.autonotebook import tqdm
@@ -92,6 +93,9 @@ class Trainer(object):
 		self.train_iterator = dataset.train_iter
 		self.valid_iterator = dataset.valid_iter
 		self.test_iterator = dataset.test_iter
+
+		# yields the tensors of the train batches, prepared in the background if configured
+		self.train_loader = create_batch_loader(self.train_iterator, hyperparameters)
 		
 		self.num_epochs = hyperparameters.num_epochs
 		self.current_sample_iteration = 0 # how many samples did the classifier see? (current iteration * batch_size)
@@ -155,6 +159,10 @@ class Trainer(object):
 				self.pre_training,
 				dataset)
 
+		# decides when cached gpu memory is released. By default the allocator reuses it for the next batch
+		self.memory_policy = MemoryPolicy.from_configuration(hyperparameters)
+		self.evaluator.memory_policy = self.memory_policy
+
 		self.early_stopping = EarlyStopping(self.optimizer, self.model, hyperparameters, self.evaluator, self.checkpoint_dir)
 
 		self.train_logger.log_hyperparameters(self)
@@ -175,13 +183,16 @@ class Trainer(object):
 			self.pre_training = logging.getLogger('pre_training_silent')	
 
 
-	def _step(self, input: torch.Tensor, target: torch.Tensor, source_mask: torch.Tensor) -> torch.Tensor:
+	def _step(self, input: torch.Tensor, target: torch.Tensor, source_mask: torch.Tensor, batch_size: int = None) -> torch.Tensor:
 		"""Make a single gradient update. This is called by train() and should not
 		be called manually.
 		
 		Arguments:
 			input {torch.Tensor} -- input batch
 			target {torch.Tensor} -- targets
+
+		Keyword Arguments:
+			batch_size {int} -- number of examples in the batch (default: {None} uses the batch size of the train iterator)
 		
 		Returns:
 			torch.Tensor -- loss tensor
@@ -197,7 +208,7 @@ class Trainer(object):
 		loss.backward()
 		self.optimizer.step(loss)
 
-		return loss.data / self.batch_size	
+		return loss.data / (batch_size or self.batch_size)
 
 	def load_model(self, file_name=None, custom_path=None):
 
@@ -242,7 +253,11 @@ class Trainer(object):
 
 			self.evaluator.epoch = checkpoint['epoch']
 			self.model.load_state_dict(checkpoint['state_dict'])
-			self.optimizer.optimizer.load_state_dict(checkpoint['optimizer'])
+			try:
+				self.optimizer.optimizer.load_state_dict(checkpoint['optimizer'])
+			except ValueError:
+				# e.g. the checkpoint was trained with separate attention projections and the model uses fused ones
+				self.pre_training.warning('Optimizer state of the checkpoint does not match the model parameters. The optimizer state is not restored.')
 			self.evaluator.best_f1 = checkpoint['f1']
 			self.best_model_checkpoint = checkpoint
 			self.pre_training.info(f'Loaded model at epoch {self.evaluator.epoch} with reported f1 of {self.evaluator.best_f1}')
@@ -310,40 +325,27 @@ class Trainer(object):
 				self.evaluator.epoch = epoch
 
 				# loop iterations
-				for batch in self.train_iterator:  # batch is torchtext.data.batch.Batch
+				for x, y, lengths in self.train_loader:
 
 					if not continue_training:
 						self.logger.info('continue_training is false -> Stop training')
 						break
 
-					self.current_sample_iteration += self.batch_size
+					batch_size = get_batch_size(self.train_iterator, x)
+					self.current_sample_iteration += batch_size
 					iteration += 1
 
 					# self.logger.debug('Iteration ' + str(iteration))
 					# Sets the module in training mode
 					self.model.train()
 
-					#x, _, padding, y = batch.comments, batch.general_sentiments, batch.padding, batch.aspect_sentiments
-					x, y = batch.comments, batch.aspect_sentiments
-
-					if hasattr(batch, 'padding'):
-						padding = batch.padding
-						source_mask = create_padding_masks(padding, 1)
-					else:
-						source_mask = None
-						padding = None
+					source_mask = get_length_mask(x, lengths)
 
-					train_loss = self._step(x, y, source_mask)
+					train_loss = self._step(x, y, source_mask, batch_size)
 					self.train_logger.log_scalar(self.evaluator.train_loss_history, train_loss.item(), 'loss', 'train', self.current_sample_iteration)
 					self.train_logger.log_scalar(None, self.optimizer.rate(), 'lr', 'general', self.current_sample_iteration)
 
-					del train_loss
-					del x
-					del y
-					del padding
-					del source_mask
-
-					torch.cuda.empty_cache()
+					self.memory_policy.after_step()
 
 					if self.log_every_xth_iteration > 0 and iteration % self.log_every_xth_iteration == 0 and iteration > 1:
 						try:
@@ -364,6 +366,7 @@ class Trainer(object):
 				# ----------- End of epoch loop -----------
 
 				self.logger.info('End of Epoch {}'.format(self.evaluator.epoch))
+				self.memory_policy.end_of_epoch()
 
 				# at the end of each epoch, check the accuracies
 				mean_valid_f1 = -1
@@ -5,15 +5,19 @@ import logging
 import torch
 import torchtext
 import math
-from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
+from sklearn.metrics import precision_recall_fscore_support
 import matplotlib
 matplotlib.use('agg')
 import matplotlib.pyplot as plt
 import os
 
-from data.data_loader import Dataset
+from data.data_loader import Dataset, create_batch_loader
 from trainer.utils import *
 from trainer.train_logger import TrainLogger
+from trainer.memory_policy import MemoryPolicy
+from trainer.streaming_evaluation import StreamingEvaluation
+from trainer.metrics import binary_classification_counts, binary_f1_scores, macro_f1_scores, micro_counts, micro_f1_score, \
+	calculate_accuracy, head_metrics, ClassificationCounts
 from trainer.utils import ITERATOR_TEST, ITERATOR_TRAIN, ITERATOR_VALIDATION
 from misc.utils import isnotebook
 
@@ -55,6 +59,9 @@ class TrainEvaluator(object):
 		self.dataset = dataset
 		self.num_labels = dataset.target_size
 
+		# the trainer shares its policy with the evaluator
+		self.memory_policy = MemoryPolicy()
+
 		self._reset()
 
 	def change_train_mode(self, train_mode):
@@ -100,7 +107,9 @@ class TrainEvaluator(object):
 		return self.loss(output, target)
 
 	def _get_mean_loss(self, history: List[float], iteration: int) -> float:
-		iteration = iteration // self.train_iterator.batch_size
+		# the history has one entry per train step. Batches of token budget iterators have
+		# different sizes, so the step can not be derived from the number of samples
+		iteration = len(history)
 		is_end_of_epoch = iteration % self.iterations_per_epoch_train == 0 or self.log_every_xth_iteration == -1
 		losses: np.array
 		if is_end_of_epoch:
@@ -132,111 +141,50 @@ class TrainEvaluator(object):
 
 			iterator.init_epoch()
 
-			# use batch size of 1 for evaluation
-			if show_c_matrix:
-				self.logger.debug('log confusion matrices')
-				prev_batch_size = iterator.batch_size
-				iterator.batch_size = 1
-				bs = 1
-			else:
-				bs = iterator.batch_size
+			bs = iterator.batch_size
+			variable_batch_size = getattr(iterator, 'variable_batch_size', False)
 
-			losses = []
-			f1_scores = []
-			predictions: torch.Tensor = None
-			targets: torch.Tensor = None
-			c_matrices: List[np.array] = []
+			# loss and confusion matrices of all heads are accumulated on the device
+			evaluation = StreamingEvaluation(self.num_labels)
 
+			batches = create_batch_loader(iterator, self.dataset.configuration)
 			if show_progress:
-				iterator = tqdm(iterator, desc=progress_label, leave=False)
-			true_pos = 0
-			total = 0
-			e_iteration = 0
-			for batch in iterator:
-				# self.logger.debug(f'Starting evaluation @{e_iteration}')
-				e_iteration += 1
-				x, y, padding = batch.comments, batch.aspect_sentiments, batch.padding
-				source_mask = create_padding_masks(padding, 1)
+				batches = tqdm(batches, desc=progress_label, leave=False)
+			for x, y, lengths in batches:
+				source_mask = get_length_mask(x, lengths)
 				
 				loss = self.get_loss(x, source_mask, y)
 
-				# divide by batch size so that we can compare losses regardless of batch size (a higher batch size will produce a nummerically higher loss than a batch size of 1)
-				losses.append(loss.item() / bs)
-
 				# [batch_size, num_words] in the collnl2003 task num labels
 				# will contain the
 				# predicted class for the label
 				prediction = self.model.predict(x, source_mask)
 
-				if predictions is None or targets is None:
-					if len(prediction.shape) == 1:
-						predictions = prediction.unsqueeze(0)
-					else:
-						predictions = prediction
-					targets = y
-				else:
-					if len(prediction.shape) == 1:
-						predictions = torch.cat((predictions, prediction.unsqueeze(0)), 0)
-					else:
-						predictions = torch.cat((predictions, prediction), 0)
-					targets = torch.cat((targets, y), 0)
-
-				# get true positives
-				true_pos += ((y == prediction).sum()).item()
-				total += y.shape[0] * y.shape[1]
+				# divide by batch size so that we can compare losses regardless of batch size (a higher batch size will produce a nummerically higher loss than a batch size of 1)
+				evaluation.update(loss, prediction, y, x.shape[0] if variable_batch_size else bs)
 
-				if show_c_matrix:
+				self.memory_policy.after_step()
 
-					if len(y.shape) > 1 and len(prediction.shape) > 1 and y.shape != (1, 1) and prediction.shape != (1, 1):
-						y_single = y.squeeze().cpu()
-						y_hat_single = prediction.squeeze().cpu()
-					elif y.shape != prediction.shape:
-						y_single = y.squeeze().cpu()
-						y_hat_single = prediction.cpu()
-					else:
-						y_single = y.cpu()
-						y_hat_single = prediction.cpu()
-					c_matrices.append(confusion_matrix(
-						y_single, y_hat_single, labels=range(self.num_labels)))
-
-				del batch
-				del prediction
-				del x
-				del padding
-				del y
-				del loss
-				torch.cuda.empty_cache()
-
-
-			avg_loss = np.array(losses).mean()
-			accuracy = float(true_pos) / float(total)
-
-			# calculate f1 score based on predictions and targets
-			f1_macro_scores, tp, fn, fp = self.calculate_multiheaded_scores(
-				iterator_name, predictions.data, targets, f1_strategy, iteration=iteration, epoch=self.train_iterator.epoch, show_c_matrix=show_c_matrix)
-			if show_c_matrix:
-				self.logger.debug(f'Resetting batch size to {prev_batch_size}.')
-				iterator.batch_size = prev_batch_size
+			avg_loss, head_c_matrices = evaluation.finalize()
+			accuracy = calculate_accuracy(head_c_matrices)
 
+			# calculate f1 score based on the confusion matrices of the heads
+			f1_macro_scores, tp, fn, fp = self.calculate_multiheaded_scores(
+				iterator_name, head_c_matrices, f1_strategy, iteration=iteration, epoch=self.train_iterator.epoch, show_c_matrix=show_c_matrix)
 			if show_c_matrix:
-				self.logger.debug('Calculating confusion matrix sum')
-				c_matrices = np.array(c_matrices)
-				# sum element wise to get total count
-				c_matrices = c_matrices.sum(axis=0)
+				# the confusion matrix over all heads. Same as the sum of the per sample confusion matrices
+				c_matrices = head_c_matrices.sum(axis=0)
 			else:
 				c_matrices = None
 
 		# reset model into training mode
 		self.change_train_mode(True)
 
-		del predictions
-		del targets
-		del losses
-		torch.cuda.empty_cache()
+		self.memory_policy.end_of_evaluation()
 
 
 		# calculate micro f1 score
-		f1_micro = (2 * tp) / (2 * tp + fn + fp)
+		f1_micro = micro_f1_score(tp, fn, fp)
 
 		self.logger.debug('Evaluation finished. Avg loss: {} - Macro F1 {} - Micro F1 {} - c_matrices: {}'.format(
 			avg_loss, np.mean(f1_macro_scores), f1_micro, c_matrices))
@@ -294,63 +242,44 @@ class TrainEvaluator(object):
 
 		return (mean_train_loss, mean_valid_loss, mean_valid_f1, accuracy)
 
-	def calculate_multiheaded_scores(self, iterator_name: str, prediction: torch.Tensor, targets: torch.Tensor, f1_strategy: str='micro', iteration: int=0, epoch: int=0, show_c_matrix: bool=False) -> Tuple[List[float], int, int, int]:
-		predictions = torch.t(prediction)
-		targets = torch.t(targets)
+	def calculate_multiheaded_scores(self, iterator_name: str, c_matrices: np.array, f1_strategy: str='micro', iteration: int=0, epoch: int=0, show_c_matrix: bool=False) -> Tuple[List[float], int, int, int]:
+		"""Calculates the scores of all heads from their confusion matrices.
 
-		# for macro score
-		f_scores_macro: List[float] = []
-
-		# for micro score
-		tp = 0
-		fn = 0
-		fp = 0
+		Arguments:
+			iterator_name {str} -- name of the evaluated split
+			c_matrices {np.array} -- confusion matrices [num_heads, num_labels, num_labels] (rows are targets)
+		"""
 
 		# if we use the germeval_multitask task we don't want to evaluate on the multitask task
 		if self.dataset.name == 'germeval_multitask':
 			num_aspects = len(self.dataset.target) - 1
 		else:
 			num_aspects = len(self.dataset.target)
+		c_matrices = c_matrices[:num_aspects]
+
+		# f_scores_macro is the macro score. From the scikit learn documentation:
+		# Calculate metrics for each label, and find their unweighted mean. This does not take label imbalance into account.
+		f_scores_macro, cls_f1_scores, counts = self.calculate_f1(c_matrices)
 
-		# iterate over all target heads and get true positives, false positives, etc for each aspect
+		# report the metrics of each target head
 		for i in range(num_aspects):
 			try:
-				y_pred = predictions[i]
-				y_true = targets[i]
-
-				if y_pred.is_cuda:
-					y_pred = y_pred.cpu()
-
-				if y_true.is_cuda:
-					y_true = y_true.cpu()
-
 				if show_c_matrix:
 					a_name = self.dataset.target_names[i]
-					cm = confusion_matrix(y_true, y_pred, labels=range(self.num_labels))
-					self.train_logger.log_confusion_matrices(cm, iterator_name, iteration, a_name)
+					self.train_logger.log_confusion_matrices(c_matrices[i], iterator_name, iteration, a_name)
 				
-				f1_mean, cls_f1_scores, metrics = self.calculate_f1(y_true, y_pred)
-				self.train_logger.log_aspect_metrics(i, f1_mean, cls_f1_scores, metrics, iterator_name, iteration, epoch)
-				precision = 0
-				recall = 0
-				support = 0
+				self.train_logger.log_aspect_metrics(i, f_scores_macro[i], cls_f1_scores[i].tolist(), head_metrics(counts, i), iterator_name, iteration, epoch)
 
 			except Exception as err:
-				self.logger.exception('Could not compute f1 score for input with size {} and target size {}'.format(prediction.size(),
-																								  targets.size()))
-			# this is the macro score. From the scikit learn documentation:
-			# Calculate metrics for each label, and find their unweighted mean. This does not take label imbalance into account.
-			f_scores_macro.append(f1_mean)
-
-			# this is for the calculation of the micro f1 score. It calculates the f1 score by summing up all tps, fps...
-			# From the documentation:
-			# Calculate metrics globally by counting the total true positives, false negatives and false positives.
-			# However, we exclude the n/a labels which are at position 0
-			tp += sum([m['tp'] for m in metrics[1:]])
-			fn += sum([m['fn'] for m in metrics[1:]])
-			fp += sum([m['fp'] for m in metrics[1:]])
+				self.logger.exception('Could not log metrics of head {} for confusion matrices with size {}'.format(i, c_matrices.shape))
+
+		# this is for the calculation of the micro f1 score. It calculates the f1 score by summing up all tps, fps...
+		# From the documentation:
+		# Calculate metrics globally by counting the total true positives, false negatives and false positives.
+		# However, we exclude the n/a labels which are at position 0
+		tp, fn, fp = micro_counts(counts)
 			
-		return f_scores_macro, tp, fn, fp
+		return f_scores_macro.tolist(), tp, fn, fp
 
 	def calculate_scores(self, prediction: torch.Tensor, targets: torch.Tensor, f1_strategy: str='micro') -> Tuple[List[float], List[float], List[float], List[float]]:
 		p_size = prediction.size()
@@ -393,30 +322,19 @@ class TrainEvaluator(object):
 
 		return f_scores[0], p_scores, r_scores, s_scores
 
-	def calculate_f1(self, target, prediction):
-		s_f1 = 0.0
-		scores = []
-		metrics_list = []
-		# calculate stats for each class label (e.g. n/a, pos, neg, neutr)
-		for i in range(self.dataset.target_size):
-			metrics = self.calculate_aspect_binary_classification_result(
-				target, prediction, i)
-			f1 = self.calculate_binary_aspect_f1(metrics)
-			if math.isnan(f1):
-				f1 = 0.0
-
-			# for macro f1 calculation exclude n/a label
-			if i > 0:
-				s_f1 += f1
-			metrics_list.append(metrics)
-			scores.append(f1)
-		return (s_f1 / (self.dataset.target_size - 1), scores, metrics_list)
-
-	def calculate_aspect_binary_classification_result(self, target, prediction, class_label):
-		mask_target = target == class_label
-		mark_prediction = prediction == class_label
-		c_matrix = confusion_matrix(mask_target, mark_prediction, labels=[1, 0])
-		return {'tp': c_matrix[0, 0], 'fp': c_matrix[0, 1], 'fn': c_matrix[1, 0], 'tn': c_matrix[1, 1]}
+	def calculate_f1(self, c_matrices: np.array) -> Tuple[np.array, np.array, ClassificationCounts]:
+		"""Calculates the f1 scores of each class (e.g. n/a, pos, neg, neutr) of all heads at once.
+
+		Arguments:
+			c_matrices {np.array} -- confusion matrices [num_heads, num_labels, num_labels]
+
+		Returns:
+			Tuple[np.array, np.array, ClassificationCounts] -- macro f1 scores without the n/a label [num_heads],
+				f1 scores [num_heads, num_labels] and the tp, fp, fn, tn counts they are based on
+		"""
+		counts = binary_classification_counts(c_matrices)
+		f1 = binary_f1_scores(counts)
+		return (macro_f1_scores(f1), f1, counts)
 
 	def calculate_binary_aspect_f1(self, metrics):
 		return (2*metrics['tp']) / (2*metrics['tp']+metrics['fn']+metrics['fp'])
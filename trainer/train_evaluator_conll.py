@@ -6,7 +6,6 @@ import logging
 import torch
 import torchtext
 import math
-from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
 import matplotlib
 matplotlib.use('agg')
 import matplotlib.pyplot as plt
@@ -14,6 +13,7 @@ import matplotlib.pyplot as plt
 from data.data_loader import Dataset
 from trainer.utils import *
 from trainer.train_logger import TrainLogger
+from trainer.metrics import confusion_matrices, micro_scores
 from trainer.utils import ITERATOR_TEST, ITERATOR_TRAIN, ITERATOR_VALIDATION
 from misc.utils import isnotebook
 
@@ -39,20 +39,15 @@ class TrainEvaluatorCoNLL(TrainEvaluator):
 		with torch.no_grad():
 
 			iterator.init_epoch()
-
-			# use batch size of 1 for evaluation
-			if show_c_matrix:
-				prev_batch_size = iterator.batch_size
-				iterator.batch_size = 1
-				bs = 1
-			else:
-				bs = iterator.batch_size
+			batch_iterator = iterator
 
 			losses = []
 			f1_scores = []
-			predictions: torch.Tensor = None
-			targets: torch.Tensor = None
-			c_matrices: List[np.array] = []
+
+			# confusion matrix of all words, accumulated on the device
+			c_matrices: torch.Tensor = None
+			comments_field = self.dataset.fields['comments']
+			pad_index = comments_field.vocab.stoi[comments_field.pad_token]
 
 			if show_progress:
 				iterator = tqdm(iterator, desc=progress_label, leave=False)
@@ -72,7 +67,7 @@ class TrainEvaluatorCoNLL(TrainEvaluator):
 				loss = self.get_loss(x, source_mask, y)
 
 				# divide by batch size so that we can compare losses regardless of batch size (a higher batch size will produce a nummerically higher loss than a batch size of 1)
-				losses.append(loss.item() / bs)
+				losses.append(loss.item() / get_batch_size(batch_iterator, x))
 
 				# [batch_size, num_words] in the collnl2003 task num labels
 				# will contain the
@@ -94,48 +89,28 @@ class TrainEvaluatorCoNLL(TrainEvaluator):
 				total += y.shape[0] * y.shape[1]
 
 				if show_c_matrix:
-					# self.logger.debug('Calculating c_matrices')
-					if len(y.shape) > 1 and len(prediction.shape) > 1 and y.shape != (1, 1) and prediction.shape != (1, 1):
-						y_single = y.squeeze().cpu()
-						y_hat_single = prediction.squeeze().cpu()
-					else:
-						y_single = y.cpu()
-						y_hat_single = prediction.cpu()
-					c_matrices.append(confusion_matrix(
-						y_single, y_hat_single, labels=range(self.num_labels)))
+					# only count the words of the sentences. Paddings were not counted when the matrices were collected
+					# with a batch size of 1, so the sum is the same
+					words = x != pad_index
+					y_hat = prediction.view_as(y)
+					batch_c_matrices = confusion_matrices(y[words].unsqueeze(-1), y_hat[words].unsqueeze(-1), self.num_labels)
+					c_matrices = batch_c_matrices if c_matrices is None else c_matrices + batch_c_matrices
 
 				# self.logger.debug(f'Evaluation iteration finished with f1 of
 				# {batch_f1}.')
-				# self.logger.debug('Clearing up memory')
-				del batch
-				del prediction
-				del x
-				del y
-				del loss
-				torch.cuda.empty_cache()
-
+				self.memory_policy.after_step()
 
 			avg_loss = np.array(losses).mean()
 			accuracy = float(true_pos) / float(total)
 
 			
-			if show_c_matrix:
-				self.logger.debug(f'Resetting batch size to {prev_batch_size}.')
-				iterator.batch_size = prev_batch_size
-
-			if show_c_matrix:
-				self.logger.debug('Calculating confusion matrix sum')
-				c_matrices = np.array(c_matrices)
-				# sum element wise to get total count
-				c_matrices = c_matrices.sum(axis=0)
-			else:
-				c_matrices = None
+			if c_matrices is not None:
+				c_matrices = c_matrices[0].cpu().numpy()
 
 		# reset model into training mode
 		self.change_train_mode(True)
 
-		del losses
-		torch.cuda.empty_cache()
+		self.memory_policy.end_of_evaluation()
 
 
 		# calculate micro f1 score
@@ -150,69 +125,18 @@ class TrainEvaluatorCoNLL(TrainEvaluator):
 
 
 	def calculate_multiheaded_scores(self, iterator_name: str, prediction: torch.Tensor, targets: torch.Tensor, f1_strategy: str='micro', iteration: int=0, epoch: int=0) -> Tuple[List[float], int, int, int]:
-		
-		# for macro score
-		f_scores_macro: List[float] = []
-
-		# for micro score
-		tp = 0
-		fn = 0
-		fp = 0
-
-		if prediction.is_cuda:
-			prediction = prediction.cpu()
-
-		if targets.is_cuda:
-			targets = targets.cpu()
-
-		for i in range(prediction.shape[0]):
-			try:
-				y = prediction[i]
-				y_t = targets[i]
-				
-
-				tp += (y == y_t).sum().item()
-				precision, recall, f1_mean, _ = precision_recall_fscore_support(y_t, y, labels=range(10), average='micro')
-				if recall != 0:
-					fn += (tp-recall*tp)/recall
-				if precision != 0:
-					fp += (tp-(precision*tp))/precision
-				f_scores_macro.append(f1_mean)
-
-				# beta = 1.0 means f1 score
-				# precision, recall, f_beta, support = precision_recall_fscore_support(y_true, y_pred, beta=1.0,
-				#																	 average=f1_strategy)
-				#f1_mean, cls_f1_scores, metrics = self.calculate_f1(y_true, y_pred)
-				#self.train_logger.log_aspect_metrics(i, f1_mean, cls_f1_scores, metrics, iterator_name, iteration, epoch)
-				precision = 0
-				recall = 0
-				support = 0
-
-			except Exception as err:
-				self.logger.exception('Could not compute f1 score for input with size {} and target size {}'.format(prediction.size(),
-																								  targets.size()))
-			# this is the macro score. From the scikit learn documentation:
-			# Calculate metrics for each label, and find their unweighted mean. This does not take label imbalance into account.
-
-			# this is for the calculation of the micro f1 score. It calculates the f1 score by summing up all tps, fps...
-			# From the documentation:
-			# Calculate metrics globally by counting the total true positives, false negatives and false positives.
-			# However, we exclude the n/a labels which are at position 0
-			# tp += sum([m['tp'] for m in metrics[1:]])
-			# fn += sum([m['fn'] for m in metrics[1:]])
-			# fp += sum([m['fp'] for m in metrics[1:]])
-			
-		return f_scores_macro, tp, fn, fp
 
-	def calculate_f1(self, target, prediction):
-		macro_f1 = 0.0
-		f1_scores = []
+		# confusion matrices of each sentence [batch_size, num_labels, num_labels]
+		c_matrices = confusion_matrices(torch.t(targets), torch.t(prediction), self.num_labels).cpu().numpy()
 
-		# target and prediction are already transposed
-		eval_entries = self.get_tensor_eval_entries(target, prediction)
-		tp, fp, fn, _ = self.calculate_metrics(eval_entries)
+		# micro scores of each sentence over the first 10 labels
+		precision, recall, f_scores_macro = micro_scores(c_matrices, range(10))
 
-		metrics = {'tp': tp, 'fp': fp, 'fn': fn}
-		empty_metric = {'tp': 0, 'fp': 0, 'fn': 0}
-		micro_f1 = self.calculate_binary_aspect_f1(metrics)
-		return (micro_f1, [micro_f1, micro_f1, micro_f1, micro_f1], [empty_metric, metrics, empty_metric, empty_metric])
+		# for micro score. tp is accumulated over the sentences of the batch and fn, fp are derived from it
+		tp = np.cumsum(np.trace(c_matrices, axis1=1, axis2=2))
+		has_recall = recall != 0
+		fn = sum((tp[has_recall] - recall[has_recall] * tp[has_recall]) / recall[has_recall])
+		has_precision = precision != 0
+		fp = sum((tp[has_precision] - (precision[has_precision] * tp[has_precision])) / precision[has_precision])
+			
+		return f_scores_macro.tolist(), tp[-1], fn, fp
@@ -14,20 +14,9 @@ from typing import Tuple, List, Dict, Optional, Union
 import matplotlib.pyplot as plt
 import pandas as pd
 import math
-from collections import defaultdict
 from trainer.train_plotter import TrainPlotter
+from trainer.metrics_buffer import MetricsBuffer
 from trainer.utils import *
-# data frame default row
-df_row_template = {
-	'epoch': int(0),
-	'iteration': int(0),
-	'metric type': '',				# loss, f1, etc.
-	'iterator type': '',			# train, valid, test
-	'value': float(0.0),			# value of the metric
-	'is general': False,			# is the metric a general metric or an head-metric
-	'head name': '',				# name of the transformer head
-	'head category': ''				# category of the transformer head (n/a, neutral, etc)
-}
 
 class TrainLogger(object):
 
@@ -62,7 +51,9 @@ class TrainLogger(object):
 		self._initialize(dummy_input)
 		self.show_summary = True
 		self.last_reported_valid_loss = 10000
-		self.data_frame = pd.DataFrame()
+
+		# metrics of the run. Use data_frame to get them as pd.DataFrame
+		self.metrics = MetricsBuffer()
 
 		max_eps = len(self.dataset.train_iter) * self.hyperparameters.batch_size * self.hyperparameters.num_epochs
 		self.train_plotter = TrainPlotter(log_image_dir, max_eps, criterion_name, experiment_name, self.dataset.task)
@@ -123,17 +114,17 @@ class TrainLogger(object):
 				self.logger.exception('Could not generate graph')
 			self.logger.debug('Graph Saved')
 
+	@property
+	def data_frame(self) -> pd.DataFrame:
+		return self.metrics.to_data_frame()
+
+	@data_frame.setter
+	def data_frame(self, df: pd.DataFrame):
+		# e.g. the data frame of a checkpoint
+		self.metrics = MetricsBuffer.from_data_frame(df)
+
 	def append_df_row(self, epoch:int, iteration:int, metric:str, iterator_type:str, value:float, is_general:bool=False, head_name:str='', head_category:str=''):
-		df_row = defaultdict(**df_row_template)
-		df_row['epoch'] = epoch
-		df_row['iteration'] = iteration
-		df_row['metric type'] = metric
-		df_row['iterator type'] = iterator_type
-		df_row['value'] = value
-		df_row['head name'] = head_name
-		df_row['is general'] = is_general
-		df_row['head category'] = head_category
-		self.data_frame = self.data_frame.append(df_row, ignore_index=True)
+		self.metrics.append(epoch, iteration, metric, iterator_type, value, is_general, head_name, head_category)
 
 	def print_epoch_summary(self, epoch: int, iteration: int, train_loss: float, valid_loss: float, valid_f1: float,
 							valid_accuracy: float, epoch_duration: float, duration: float, total_time: float, best_loss: float, best_f1: float):
@@ -22,6 +22,40 @@ ITERATOR_VALIDATION = 'validation'
 ITERATOR_TEST = 'test'
 
 
+def get_batch_size(iterator, comments: torch.Tensor) -> int:
+	# token budget iterators produce batches with different numbers of examples
+	if getattr(iterator, 'variable_batch_size', False):
+		return comments.shape[0]
+	return iterator.batch_size
+
 def create_padding_masks(targets: torch.Tensor, padd_class: int) -> torch.Tensor:
 		input_mask = (targets != padd_class).unsqueeze(-2)
-		return input_mask
\ No newline at end of file
+		return input_mask
+
+def create_length_masks(lengths: torch.Tensor, num_words: int) -> torch.Tensor:
+	"""Creates the source mask of a batch from the number of words of each comment.
+
+	The mask is the same as create_padding_masks(padding, 1) of the former padding field,
+	where '0' (a word) had the index 1 and '<pad>' the index 0: it is set at the paddings.
+
+	Arguments:
+		lengths {torch.Tensor} -- number of words per comment [batch_size]
+		num_words {int} -- padded length of the batch
+
+	Returns:
+		torch.Tensor -- mask [batch_size, 1, num_words]
+	"""
+	positions = torch.arange(num_words, dtype=lengths.dtype, device=lengths.device)
+	return (positions.unsqueeze(0) >= lengths.unsqueeze(1)).unsqueeze(-2)
+
+def get_length_mask(comments: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+	if lengths is None:
+		return None
+	return create_length_masks(lengths, comments.shape[1])
+
+def get_source_mask(batch) -> torch.Tensor:
+	if hasattr(batch, 'lengths'):
+		return create_length_masks(batch.lengths, batch.comments.shape[1])
+	if hasattr(batch, 'padding'):
+		return create_padding_masks(batch.padding, 1)
+	return None
\ No newline at end of file